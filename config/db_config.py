@@ -3,6 +3,7 @@
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
+import threading
 from utils.logger import logger
 from pathlib import Path
 from urllib.parse import quote_plus
@@ -16,10 +17,17 @@ class Database:
     """Singleton MongoDB connection handler with logging."""
 
     _instance = None
+    _lock = threading.Lock()
 
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(Database, cls).__new__(cls)
+        if cls._instance is not None:
+            return cls._instance
+
+        with cls._lock:
+            if cls._instance is not None:
+                return cls._instance
+
+            instance = super(Database, cls).__new__(cls)
 
             mongo_uri = os.getenv("MONGO_URI")
             db_name = os.getenv("DB_NAME")
@@ -45,13 +53,61 @@ class Database:
                 db = client[db_name]
                 client.admin.command('ping')
                 logger.info(f"✅ Connected to MongoDB: {db_name}")
-                cls._instance.client = client
-                cls._instance.db = db
+                instance.client = client
+                instance.db = db
             except Exception as e:
                 logger.exception(f"❌ MongoDB connection failed: {e}")
                 raise e
 
+            # Only publish a fully connected instance, so a failed attempt can be retried
+            cls._instance = instance
+
         return cls._instance
 
+class LazyCollection:
+    """Collection handle that connects on first use instead of at import time."""
+
+    def __init__(self, name):
+        self._name = name
+        self._collection = None
+
+    def _resolve(self):
+        if self._collection is None:
+            self._collection = Database().db[self._name]
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __repr__(self):
+        state = "connected" if self._collection is not None else "lazy"
+        return f"LazyCollection({self._name!r}, {state})"
+
+
+class LazyDatabase:
+    """
+    Stand-in for the pymongo Database.
+
+    `db["setups"]` hands out a LazyCollection, so modules can bind collections
+    at import time without a network round-trip. The connection (and ping)
+    happens the first time a collection or database method is actually used.
+    """
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = LazyCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, attr):
+        return getattr(Database().db, attr)
+
+    @property
+    def is_connected(self):
+        return Database._instance is not None
+
+
 # Global instance
-db = Database().db
+db = LazyDatabase()
@@ -1,9 +1,6 @@
-from db import db
-
-userdetail = db["userdetail"]
-document = userdetail.find_one({"name": "token"})
-
-
 def get_token():
-   print(document.dtoken)
-   return document.dtoken
\ No newline at end of file
+   # db.py builds its MongoClient at import, so only pull it in when a token is needed
+   from db import db
+
+   document = db["userdetail"].find_one({"name": "token"})
+   return document["dtoken"]
\ No newline at end of file
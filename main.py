@@ -1,27 +1,40 @@
 # main.py
 
 import time
-from datetime import datetime, timedelta, time as dtime
-import pytz
 
 import schedule
 
-from utils.logger import logger
+from utils.logger import logger, log_stats
 from config.db_config import db
 from services.dhan_service import DhanService
-from services.setup_service import fetch_setups_from_mongo
-
-from tasks.task import fetch_setups
+from services.setup_service import fetch_setups_from_mongo, processed_symbols, ensure_indexes, setup_changes
+
+from services.change_stream_service import ChangeStreamService
+from services.market_state import market_state
+from services.market_bus import market_bus
+from services.snapshot_service import SnapshotService
+from services.trade_book import trade_book
+from services.candle_service import candle_service
+from services.calendar_service import calendar
+from services.api_service import ApiServer, read_cache, API_ENABLED
+from services.trade_rules import monitor_decision, pnl_label, CLOSE, SIGNAL_LOST, STOPLOSS
+
+from tasks.task import prepare_scan, scan_stock, finish_scan
+from services.scan_checkpoint import scan_checkpoint
+from services.prefilter_service import regime_prefilter
+from services.cycle_scheduler import cycle_scheduler, MONITOR, READY_SETUPS, CANDIDATES, UNIVERSE
+from services.quota_manager import with_priority, PRIORITY_MONITOR
+from utils.time_utils import BAR_SECONDS, DAY_SECONDS, format_ist, ist_date, ist_day, minute_of_day, now_epoch, to_epoch
+from functools import partial
+import threading
+
+trade_lock = threading.Lock()
 
 # --- Utility Functions ---
 
 def is_market_open():
-    """Check if market is open (Mon–Fri, 9:15–15:25)."""
-    now = datetime.now()
-    market_start = dtime(9, 15)
-    market_end = dtime(15, 25)
-    is_open = now.weekday() < 5 and market_start <= now.time() <= market_end
-    return is_open
+    """Check if the NSE session is open right now (IST, holidays and special sessions included)."""
+    return calendar.is_open_at(now_epoch())
 
 
 # --- Trading Logic Placeholders ---
@@ -30,183 +43,195 @@ def check_for_setups_and_trade():
     """Fetch setups from DB and trade if conditions met."""
     if not is_market_open():
         logger.info("⏳ Market closed — skipping this cycle.")
-        #return
-
-    dhan = DhanService()
+        return
 
     logger.info("🔍 Checking for setups...")
 
-    ist = pytz.timezone("Asia/Kolkata")
-    current_time = datetime.now(ist)
-    today_str = current_time.strftime("%Y-%m-%d")
+    today_str = ist_day(now_epoch())
     query = { "date": today_str, "tradeStatus": "ready" }
     setups = fetch_setups_from_mongo(query)
     for setup in setups:
-        symbol = setup["symbol"]
+        market_state.set_setup(setup)
+        start_trade(setup)
+
 
+def start_trade(setup):
+    """Turn a ready setup into an in-progress trade (shared by polling and the change stream)."""
+    symbol = setup["symbol"]
+
+    # Polling and the change stream listener can race on the same setup
+    with trade_lock:
         # Skip if already in progress
-        existing_trade = db["trades"].find_one({"symbol": symbol, "status": "in_progress"})
-        if existing_trade:
-            logger.info(f"⛔ Trade already in progress for {symbol}, skipping.")
-            continue
+        if trade_book.has_open(symbol):
+            logger.info(f"⛔ Trade already in progress for {symbol}, skipping.", extra={"sample_key": "trade_in_progress", "symbol": symbol})
+            return
+
+        # Claim the setup so no other path starts it again
+        claimed = db["setups"].update_one(
+            {"_id": setup["_id"], "tradeStatus": "ready"},
+            {"$set": {"tradeStatus": "traded"}}
+        )
+        if claimed.modified_count == 0:
+            return
+        market_state.set_setup({**setup, "tradeStatus": "traded"})
 
         # Example: Place order (stub)
         logger.info(f"🚀 Starting trade for {symbol}")
         #order = dhan.place_order(symbol, "BUY", 1, 0.0)
-        first_candle = setup["candleData"][0]
-        first_close = float(first_candle["Close"])
-        from datetime import timezone, timedelta
-
-        IST = timezone(timedelta(hours=5, minutes=30))
-        entry_dt_ist = setup["Datetime"].astimezone(IST)
-       
-        entryTimeUTC = setup["Datetime"].replace(tzinfo=timezone.utc)
-        entryTimeIST = entryTimeUTC.astimezone(IST)
-
-        print(entryTimeIST) 
-       
+        if "entryPrice" in setup:
+            first_close = float(setup["entryPrice"])
+        else:
+            # Setups written before candles moved to the time-series collection
+            first_close = float(setup["candleData"][0]["Close"])
+        # Mongo returns Datetime as naive UTC; trades store IST wall-clock strings
+        setup_ts = to_epoch(setup["Datetime"])
+        entry_time = format_ist(setup_ts)
+
         #if order:
-        db["trades"].insert_one({
-            "price": first_close,
-            "signal": setup["signal"],
-            "dsecurityid" :setup["dSecurityId"],
-            "target": setup["target"],
-            "stoploss": setup["stoploss"],
-            "symbol": symbol,
-            "fentry_time": entryTimeIST.strftime("%Y-%m-%d %H:%M"),
-            "entry_time": entryTimeIST.strftime("%Y-%m-%d %H:%M"),
-            "exit_time": None,
-            "status": "in_progress",
-        })
-        db["setups"].update_one({"_id": setup["_id"]}, {"$set": {"tradeStatus": "traded"}})
+        try:
+            # Inserted before returning: the setup is already claimed
+            trade_book.open(
+                entry_price=first_close,
+                signal=setup["signal"],
+                security_id=setup["dSecurityId"],
+                target=setup["target"],
+                stoploss=setup["stoploss"],
+                symbol=symbol,
+                fentry_time=entry_time,
+                entry_time=entry_time,
+                exit_time=None,
+                status="in_progress",
+                levels_ts=setup_ts,   # the setup bar set the initial stoploss/target
+            )
+        except Exception as e:
+            # Release the claim so the next cycle retries this setup
+            logger.exception(f"❌ Failed to store trade for {symbol}, setup released: {e}")
+            db["setups"].update_one({"_id": setup["_id"], "tradeStatus": "traded"}, {"$set": {"tradeStatus": "ready"}})
+            market_state.set_setup(setup)
+            return
         logger.info(f"✅ Trade started for {symbol}")
         #else:
             #logger.error(f"❌ Failed to place order for {symbol}")
 
 
+def on_setup_ready(setup):
+    """Change stream callback: start today's ready setups as soon as they are written."""
+    if setup.get("date") != ist_day(now_epoch()):
+        return
+    if not TRADES:
+        # The monitor process trades it; this one only shows it
+        market_state.set_setup(setup)
+        read_cache.mark_dirty()
+        return
+    if not is_market_open():
+        # Left "ready": run_chain polls ready setups in the session's first cycle, streaming or not
+        logger.info(f"⏳ Market closed — not starting {setup.get('symbol')} from the change stream.")
+        return
+    market_state.set_setup(setup)
+    processed_symbols.add(setup["date"], setup["symbol"])
+    start_trade(setup)
+    read_cache.mark_dirty()
+
+
+def on_trade_change(trade, operation):
+    """Change stream callback for trade inserts/updates."""
+    trade_book.apply_external(trade)
+    read_cache.mark_dirty()
+    logger.info(f"📡 Trade {trade.get('symbol')} {operation}: status={trade.get('status')} exit_reason={trade.get('exit_reason')}")
+
+
 def monitor_open_trades():
     """Check ongoing trades for target/stoploss."""
     if not is_market_open():
         logger.info("⏳ Market closed — skipping this cycle.")
-        #return
+        return
 
     dhan = DhanService()
 
-    trades = db["trades"].find({"status": "in_progress"})
+    trades = trade_book.open_trades()
+    market_state.set_open_trades([t.to_doc() for t in trades])
     for trade in trades:
-        symbol = trade["symbol"]
-        dsecurityid = trade["dsecurityid"]
-        entryTime = trade["entry_time"]  # e.g. "2025-10-30 11:05"
-
-        if isinstance(entryTime, str):
-            entry_dt = datetime.strptime(entryTime, "%Y-%m-%d %H:%M")
-        else:
-            entry_dt = entryTime
-
-        to_date = entry_dt + timedelta(minutes=5)
-        entry_dt = entry_dt - timedelta(days=5)
-        logger.info(f"📊 Checking trade: {symbol} from {entry_dt} to {to_date}")
-
-        # Fetch live price
-        #live_data = dhan.fetch_5min_candles(trade["order_details"]["securityId"],
-         #                                   datetime.now().strftime("%Y-%m-%d"),
-          #                                  datetime.now().strftime("%Y-%m-%d"))
-        #if not live_data:
-            #continue TODO its temp
-        live_data = dhan.fetch_candles(dsecurityid, symbol, to_date)
-
-        # Safely get values
-
-        # signal lost if not ready
-        if live_data.get("tradeStatus") != "ready":
-            pl = "profit" if trade.get("current_price") and trade["current_price"] > trade["price"] else "loss"
-            logger.info("Signal lost or stoploss hit, closing trade.")
-            db["trades"].update_one(
-                {"_id": trade["_id"]},
-                {"$set": {"current_price": trade.get("stoploss"), "status": "closed", "exit_reason": "Signal lost sl hit", "pnl": pl}}
-            )
+        monitor_trade(dhan, trade)
+
+
+@with_priority(PRIORITY_MONITOR)
+def monitor_trade(dhan, trade):
+    """One monitor step for one open trade: crossed levels, signal lost, trailing stop/target."""
+    if trade.status != "in_progress":
+        return
+    symbol = trade.symbol
+    dsecurityid = trade.security_id
+    # e.g. "2025-10-30 11:05"; older trades hold a naive IST datetime
+    entry_ts = to_epoch(trade.entry_time, naive="ist")
+
+    to_ts = entry_ts + BAR_SECONDS
+    logger.info(f"📊 Checking trade: {symbol} from {format_ist(entry_ts - 5 * DAY_SECONDS)} to {format_ist(to_ts)}", extra={"sample_key": "checking_trade", "symbol": symbol})
+
+    # Fetch live price
+    #live_data = dhan.fetch_5min_candles(trade["order_details"]["securityId"],
+     #                                   datetime.now().strftime("%Y-%m-%d"),
+      #                                  datetime.now().strftime("%Y-%m-%d"))
+    #if not live_data:
+        #continue TODO its temp
+    live_data = dhan.fetch_candles(dsecurityid, symbol, to_ts)
+    if live_data is None:
+        return
+
+    # Intrabar wicks: check the bar's whole range, but only for bars after the one the levels came from
+    bar_ts = to_epoch(live_data["Datetime"])
+    if exit_crossed_triggers(symbol, live_data["Low"], live_data["High"], bar_ts=bar_ts):
+        return
+
+    action, result, exit_reason = monitor_decision(trade.signal, trade.stoploss, live_data)
+
+    # signal lost if not ready
+    if exit_reason == SIGNAL_LOST:
+        pl = "profit" if trade.last_price and trade.last_price > trade.entry_price else "loss"
+        logger.info("Signal lost or stoploss hit, closing trade.")
+        trade_book.close(trade, last_price=result, exit_reason=exit_reason, pnl=pl)
+        return
+
+    # Update for next time
+    trade_book.update(trade, entry_time=format_ist(to_ts))
+
+    if trade.signal not in ("bullish", "bearish"):
+        return
+
+    pl = pnl_label(trade.signal, trade.entry_price, trade.last_price)
+    if action == CLOSE:
+        logger.info(f"🛑 Stoploss hit for {symbol} ({trade.signal}), closing trade with Price: {result}")
+        trade_book.close(trade, last_price=result, exit_reason=exit_reason, pnl=pl)
+    else:
+        logger.info(f"🔄 {trade.signal.capitalize()} trade for {symbol} active. Price: {result['last_price']}", extra={"sample_key": "trade_active", "symbol": symbol})
+        trade_book.update(trade, pnl=pl, levels_ts=bar_ts, **result)
+
+    # if not target or not stoploss then check current candle for tail stop loss and target adjustments
+
+
+
+def exit_crossed_triggers(symbol, low, high=None, bar_ts=None):
+    """
+    Close open trades on `symbol` whose stoploss/target lies within this tick
+    (low only) or bar range (low, high). Cheap enough to call on every price update.
+    Pass `bar_ts` for bars, so a bar is never checked against levels it produced itself.
+    """
+    hits = trade_book.crossed(symbol, low, high, bar_ts)
+
+    # Stops first: if one bar spans both levels, assume the worse fill
+    for trade, kind in sorted(hits, key=lambda hit: hit[1] != STOPLOSS):
+        if trade.status != "in_progress":
             continue
+        level = float(trade.stoploss if kind == STOPLOSS else trade.target)
+        pl = pnl_label(trade.signal, trade.entry_price, level)
+        logger.info(f"🎯 {kind} crossed for {symbol} ({trade.signal}) at {level}")
+        trade_book.close(trade, last_price=level, exit_reason=f"{kind}_hit", pnl=pl)
 
-        current_price = live_data["Close"]
-        target = live_data["target"]
-        stoploss = live_data["stoploss"]
-        signal = trade.get("signal")
-        symbol = trade.get("symbol")
-
-        # Convert to float only if not None
-        if current_price is not None:
-            current_price = float(current_price)
-        else:
-            current_price = 0  # or handle appropriately
-
-        if stoploss is not None:
-            stoploss = float(stoploss)
-        else:
-            stoploss = 0  # or handle appropriately
-
-        # target can also be float if needed
-        if target is not None:
-            target = float(target)
-        else:
-            target = 0
-
-
-        # Update for next time
-        db["trades"].update_one(
-                    {"_id": trade["_id"]},
-                    {"$set": {"entry_time": to_date}}
-                )
-
-        # -------------------------------
-        # ✅ Bullish Trade Logic
-        # -------------------------------
-        if signal == "bullish":
-
-            pl = "profit" if trade.get("current_price") and trade["current_price"] > trade["price"] else "loss"
-
-            if current_price <= stoploss:
-                logger.info(f"🛑 Stoploss hit for {symbol} (bullish), closing tradew ith Price: {current_price}")
-               
-                db["trades"].update_one(
-                    {"_id": trade["_id"]},
-                    {"$set": {"current_price":current_price, "status": "closed", "exit_reason": "stoploss_hit", "pnl": pl}}
-                )
-
-            else:
-                logger.info(f"🔄 Bullish trade for {symbol} active. Price: {current_price}")
-                db["trades"].update_one(
-                    {"_id": trade["_id"]},
-                    {"$set": {"current_price":current_price, "target": live_data["target"], "stoploss": live_data["stoploss"], "pnl": pl}}
-                )
-
-        # -------------------------------
-        # ✅ Bearish Trade Logic
-        # -------------------------------
-        elif signal == "bearish":
-            pl = "profit" if trade.get("current_price") and trade["current_price"] < trade["price"] else "loss"
-
-            if current_price >= stoploss:
-                logger.info(f"🛑 Stoploss hit for {symbol} (bearish), closing trade with Price: {current_price}")
-                db["trades"].update_one(
-                    {"_id": trade["_id"]},
-                    {"$set": {"current_price":current_price, "status": "closed", "exit_reason": "stoploss_hit", "pnl": pl}}
-                )
-
-            else:
-                logger.info(f"🔄 Bearish trade for {symbol} active. Price: {current_price}")
-                db["trades"].update_one(
-                    {"_id": trade["_id"]},
-                    {"$set": {"current_price":current_price, "target": live_data["target"], "stoploss": live_data["stoploss"], "pnl": pl}}
-                )
-
-        # if not target or not stoploss then check current candle for tail stop loss and target adjustments
-
+    return hits
 
 
 def close_trades_before_market_close():
     """Exit all trades 5 min before close."""
-    now = datetime.now().time()
-    if now >= dtime(15, 20):
+    if minute_of_day(now_epoch()) >= 15 * 60 + 20:
         logger.info("🏁 Closing all open trades before market close...")
         #db["trades"].update_many({"status": "in_progress"}, {"$set": {"status": "closed", "exit_reason": "EOD"}})
         logger.info("✅ All trades closed for the day.")
@@ -234,24 +259,84 @@ def close_trades_before_market_close():
 #         time.sleep(5)
 
 
+import os
 import time
 import logging
+import signal
+import sys
 
 logger = logging.getLogger(__name__)
 
-def run_chain():
-    try:
-        logger.info("▶️ Starting fetch_setups()")
-        fetch_setups()
-        logger.info("✅ Completed fetch_setups()")
+def stop_distance(trade):
+    """How close an open trade is to its stop, as a fraction of the entry price."""
+    price = trade.last_price or trade.entry_price
+    if trade.stoploss is None or not trade.entry_price:
+        return float("inf")
+    return abs(float(price) - float(trade.stoploss)) / float(trade.entry_price)
+
+
+# Process role. "all" runs everything in one process; on one host the work can be
+# split into a "scanner", a "monitor" (trades) and an "api" reader (see README)
+WORKER_ROLES = ("all", "scanner", "monitor", "api")
+WORKER_ROLE = os.getenv("WORKER_ROLE", "all")
+SCANS = WORKER_ROLE in ("all", "scanner")
+TRADES = WORKER_ROLE in ("all", "monitor")
 
-        logger.info("▶️ Starting check_for_setups_and_trade()")
-        check_for_setups_and_trade()
-        logger.info("✅ Completed check_for_setups_and_trade()")
+ready_polled_day = None
 
-        logger.info("▶️ Starting monitor_open_trades()")
-        monitor_open_trades()
-        logger.info("✅ Completed monitor_open_trades()")
+
+def run_chain(started=None):
+    """
+    One cycle, scheduled by priority under the cycle deadline:
+    open trades (closest to stop first) > ready setups > prefilter candidates > rest of the universe.
+    """
+    global ready_polled_day
+    try:
+        cycle_scheduler.begin(started)
+        dhan = DhanService()
+
+        # Open trades are queued before any scan-side work, so a failing scan can't starve stoploss monitoring
+        if TRADES and not listener.is_streaming:
+            # Nothing streams other processes' trade changes into the book
+            try:
+                trade_book.reconcile()
+            except Exception as e:
+                logger.exception(f"❌ Trade book reconcile failed, monitoring the cached book: {e}")
+
+        market_open = is_market_open()
+        if TRADES and market_open:
+            trades = trade_book.open_trades()
+            market_state.set_open_trades([t.to_doc() for t in trades])
+            for trade in trades:
+                cycle_scheduler.add(MONITOR, f"trade:{trade.symbol}", partial(monitor_trade, dhan, trade),
+                                    score=stop_distance(trade), serial=str(trade.security_id))
+
+        # With a live change stream, ready setups are traded as they arrive. Those streamed
+        # in before the open are still "ready", so the session's first cycle polls once anyway.
+        today = ist_day(now_epoch())
+        if TRADES and not listener.is_streaming:
+            cycle_scheduler.add(READY_SETUPS, "check_setups", check_for_setups_and_trade)
+        elif TRADES and market_open and ready_polled_day != today:
+            cycle_scheduler.add(READY_SETUPS, "check_setups", check_for_setups_and_trade)
+            ready_polled_day = today
+
+        candidates = []
+        if SCANS:
+            try:
+                _, candidates = prepare_scan(dhan)
+            except Exception as e:
+                logger.exception(f"❌ Scan preparation failed, monitoring only this cycle: {e}")
+
+        for rank, stock in enumerate(candidates):
+            security_id = str(stock.get("SECURITY_ID"))
+            state = regime_prefilter.state(security_id)
+            priority = CANDIDATES if state is not None and state.viable else UNIVERSE
+            # serial: never scanned while the same security's trade is being monitored
+            cycle_scheduler.add(priority, f"scan:{security_id}", partial(scan_task, dhan, stock), score=rank, serial=security_id)
+
+        cycle_scheduler.run()
+        if SCANS:
+            finish_scan()
 
         #logger.info("▶️ Starting close_trades_before_market_close()")
         #close_trades_before_market_close()
@@ -261,22 +346,147 @@ def run_chain():
         logger.exception(f"❌ Error in job chain: {e}")
 
 
-logger.info("🚀 Serial Scheduler started... (Ctrl+C to stop)")
+def scan_task(dhan, stock):
+    setups = scan_stock(dhan, stock)
+    # Polling mode: trade a setup that just became ready before scanning further
+    if TRADES and setups and setups.get("tradeStatus") == "ready" and not listener.is_streaming:
+        cycle_scheduler.add(READY_SETUPS, "check_setups", check_for_setups_and_trade)
 
-while True:
-    try:
-        start_time = time.time()
 
-        run_chain()  # run them in FIXED ORDER, one after another
+# Warm restart: reuse bars/indicator state from the last snapshot, only the gap gets downloaded
+snapshots = SnapshotService()
 
-        # Ensure 1-minute interval between cycles
-        elapsed = time.time() - start_time
-        sleep_time = max(0, 60 - elapsed)
-        time.sleep(sleep_time)
+listener = ChangeStreamService(
+    on_setup_ready=on_setup_ready,
+    on_trade_change=on_trade_change,
+    on_connect=check_for_setups_and_trade if TRADES else None
+)
 
-    except KeyboardInterrupt:
-        logger.info("🛑 Scheduler stopped by user.")
-        break
+# Dashboards read from the in-memory cache, never from Mongo or the broker
+api = ApiServer(read_cache)
+
+
+EXPORT_AFTER_CLOSE = os.getenv("EXPORT_AFTER_CLOSE", "0") == "1"
+last_export_day = None
+
+
+def export_after_close():
+    """Once per trading day, after the close: write the day to the local Parquet store for analytics."""
+    global last_export_day
+    now = now_epoch()
+    session = calendar.session_epochs(ist_date(now))
+    if not EXPORT_AFTER_CLOSE or session is None or now <= session[1]:
+        return
+    day = ist_day(now)
+    if day == last_export_day:
+        return
+    try:
+        from tasks.export_daily import export_day
+        export_day(day)
+        last_export_day = day
     except Exception as e:
-        logger.exception(f"Unexpected error in main loop: {e}")
-        time.sleep(5)
+        logger.exception(f"❌ Daily export failed: {e}")
+        last_export_day = day  # don't retry every loop; run tasks.export_daily by hand
+
+
+def handle_sigterm(signum, frame):
+    """Deploys send SIGTERM; persist state before exiting."""
+    logger.info("🛑 SIGTERM received, flushing trades and saving market snapshot.")
+    scan_checkpoint.flush()
+    trade_book.stop()
+    snapshots.save()
+    market_bus.close()
+    sys.exit(0)
+
+
+def serve_api_only():
+    """
+    API-only reader: no scanning, no trading. Trades and setups arrive through
+    the change stream, bars from the market bus (MARKET_BUS=reader).
+    """
+    logger.info("🌐 API-only worker started... (Ctrl+C to stop)")
+    try:
+        while True:
+            read_cache.refresh()
+            time.sleep(60)
+    except KeyboardInterrupt:
+        logger.info("🛑 API worker stopped by user.")
+        listener.stop()
+        trade_book.stop()
+        market_bus.close()
+
+
+def main():
+    """Worker entry point. Nothing connects or loops until this runs."""
+    if WORKER_ROLE not in WORKER_ROLES:
+        raise ValueError(f"❌ Unknown WORKER_ROLE '{WORKER_ROLE}', expected one of {', '.join(WORKER_ROLES)}")
+    snapshots.restore()
+    candle_service.ensure_collections()
+    ensure_indexes()
+    trade_book.ensure_indexes()
+    market_bus.open()
+    trade_book.load()
+    trade_book.start()
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    listener.start()
+    read_cache.refresh()
+    if API_ENABLED or WORKER_ROLE == "api":
+        api.start()
+    if WORKER_ROLE == "api":
+        serve_api_only()
+        return
+
+    logger.info(f"🚀 Serial Scheduler started as '{WORKER_ROLE}'... (Ctrl+C to stop)")
+
+    while True:
+        try:
+            # Outside the session: sleep until the next open instead of burning API calls
+            if not is_market_open():
+                wait = calendar.seconds_until_open()
+                logger.info(f"💤 Market closed, next session opens {calendar.next_session_open()} ({wait / 60:.0f} min)")
+                snapshots.maybe_save()
+                read_cache.refresh()
+                if SCANS:
+                    export_after_close()
+                time.sleep(min(max(wait, 1), 3600))
+                continue
+
+            start_time = time.time()
+            log_before = log_stats.snapshot()
+
+            run_chain(start_time)  # priority-ordered under the cycle deadline
+            read_cache.refresh()
+            snapshots.maybe_save()
+
+            log_after = log_stats.snapshot()
+            logger.info(
+                f"📝 Logging this cycle: {log_after['enqueued'] - log_before['enqueued']} records, "
+                f"{log_after['sampled_out'] - log_before['sampled_out']} sampled out, "
+                f"{log_after['dropped'] - log_before['dropped']} dropped, "
+                f"{log_after['enqueue_ms'] - log_before['enqueue_ms']:.2f} ms on the hot path"
+            )
+            logger.info(f"🗃️ Dhan cache: {DhanService.cache_stats()}")
+            logger.info(f"🛡️ Broker: {DhanService.broker_stats()}")
+            logger.info(f"🎫 Quota: {DhanService.quota_stats()}")
+            logger.info(f"🚦 Concurrency: {DhanService.concurrency_stats()}")
+            logger.info(f"✍️ Writes: trades {trade_book.changes.stats()} | setups {setup_changes.stats()}")
+
+            # Ensure 1-minute interval between cycles
+            elapsed = time.time() - start_time
+            sleep_time = max(0, 60 - elapsed)
+            time.sleep(sleep_time)
+
+        except KeyboardInterrupt:
+            logger.info("🛑 Scheduler stopped by user.")
+            listener.stop()
+            trade_book.stop()
+            snapshots.save()
+            market_bus.close()
+            break
+        except Exception as e:
+            logger.exception(f"Unexpected error in main loop: {e}")
+            time.sleep(5)
+
+
+if __name__ == "__main__":
+    main()
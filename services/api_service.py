@@ -0,0 +1,312 @@
+# services/api_service.py
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from services.calendar_service import calendar
+from services.concurrency import broker_concurrency
+from services.market_state import market_state, BAR_FIELDS
+from services.market_bus import market_bus
+from services.quota_manager import quota_manager
+from services.trade_book import trade_book
+from utils.logger import logger
+from utils.time_utils import ist_day, now_epoch
+
+API_PORT = int(os.getenv("PORT", "8080"))
+API_ENABLED = os.getenv("API_ENABLED", "1") == "1"
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+DEFAULT_BAR_LIMIT = 75   # one session of 5-minute bars
+ENCODED_CACHE_SIZE = 256
+
+SETUP_FIELDS = ("symbol", "dSecurityId", "signal", "tradeStatus", "date", "Datetime", "entryPrice", "stoploss", "target")
+SIGNAL_FIELDS = (
+    "symbol", "dsecurityid", "Datetime", "Close", "SMA20", "SMA200", "ATR",
+    "signal", "stoploss", "target", "tradeStatus", "trend_strength",
+)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)  # ObjectId etc.
+
+
+def _encode(payload):
+    return json.dumps(payload, default=_json_default, separators=(",", ":")).encode()
+
+
+class View:
+    """An immutable published list plus the ETag of its content."""
+
+    __slots__ = ("items", "etag", "updated_at")
+
+    def __init__(self, items, etag, updated_at):
+        self.items = items
+        self.etag = etag
+        self.updated_at = updated_at
+
+
+class ReadCache:
+    """
+    What the API serves. The worker calls `refresh()` after each cycle; it
+    rebuilds the views from in-process state only (MarketState / TradeBook),
+    so HTTP reads never reach Mongo or the broker. Change-stream events only
+    `mark_dirty()`: the views are rebuilt at most once, by the next cycle or
+    the next read, however many events arrive in between.
+
+    A view's ETag only changes when its content does, and encoded response
+    bodies are memoized per (view version, query) until the next change.
+    """
+
+    def __init__(self):
+        self.views = {}
+        self._encoded = {}
+        self._bar_markers = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.not_modified = 0
+
+    def publish(self, name, items):
+        etag = hashlib.sha1(_encode(items)).hexdigest()[:16]
+        current = self.views.get(name)
+        if current is not None and current.etag == etag:
+            return current
+        view = View(items, etag, time.time())
+        self.views[name] = view
+        return view
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    def view(self, name):
+        if self._dirty:
+            with self._refresh_lock:
+                if self._dirty:
+                    self.refresh()
+        return self.views.get(name)
+
+    def refresh(self):
+        # Cleared first: an event arriving mid-rebuild flags the views again
+        self._dirty = False
+        today = ist_day(now_epoch())
+        setups = [
+            {f: s.get(f) for f in SETUP_FIELDS}
+            for s in market_state.setup_values() if s.get("date") == today
+        ]
+        self.publish("setups", sorted(setups, key=lambda s: str(s["Datetime"]), reverse=True))
+        self.publish("trades", sorted((t.to_doc() for t in trade_book.open_trades()), key=lambda t: t["symbol"]))
+        self.publish("signals", sorted(
+            ({f: c.get(f) for f in SIGNAL_FIELDS} for c in market_state.signal_values()),
+            key=lambda c: str(c.get("symbol"))
+        ))
+
+    def bars_view(self, security_id):
+        """Bars are published lazily, and only rebuilt when the last bar changes."""
+        bars = market_state.get_bars(security_id)
+        if not bars and market_bus.role:
+            # Web process: the scanner's bars from shared memory
+            bars = market_bus.read(security_id, BAR_FIELDS)
+        if not bars or not bars["timestamp"]:
+            return None
+        name = f"bars:{security_id}"
+        marker = (len(bars["timestamp"]), bars["timestamp"][-1], bars["close"][-1], bars["volume"][-1])
+        current = self.views.get(name)
+        if current is not None and self._bar_markers.get(name) == marker:
+            return current
+        rows = [dict(zip(BAR_FIELDS, row)) for row in zip(*(bars[f] for f in BAR_FIELDS))]
+        view = View(rows, hashlib.sha1(repr(marker).encode()).hexdigest()[:16], time.time())
+        self._bar_markers[name] = marker
+        self.views[name] = view
+        return view
+
+    def encoded(self, key, build):
+        with self._lock:
+            body = self._encoded.get(key)
+            if body is not None:
+                self.hits += 1
+                return body
+        body = _encode(build())
+        with self._lock:
+            if len(self._encoded) >= ENCODED_CACHE_SIZE:
+                self._encoded.clear()
+            self._encoded[key] = body
+        return body
+
+    def stats(self):
+        return {"views": len(self.views), "encoded": len(self._encoded), "hits": self.hits, "not_modified": self.not_modified}
+
+
+def _page(items, query):
+    try:
+        page = max(1, int(query.get("page", ["1"])[0]))
+        per_page = min(MAX_PER_PAGE, max(1, int(query.get("per_page", [str(DEFAULT_PER_PAGE)])[0])))
+    except ValueError:
+        page, per_page = 1, DEFAULT_PER_PAGE
+    start = (page - 1) * per_page
+    return {
+        "items": items[start:start + per_page],
+        "page": page,
+        "per_page": per_page,
+        "total": len(items),
+        "pages": (len(items) + per_page - 1) // per_page,
+    }
+
+
+def _filter(items, query, fields):
+    for field in fields:
+        if field in query:
+            wanted = set(query[field])
+            items = [i for i in items if str(i.get(field)) in wanted]
+    return items
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    GET /health
+    GET /setups?status=ready&signal=bullish&page=1&per_page=50   today's setups
+    GET /trades                                                  open trades
+    GET /signals?symbol=TCS                                      latest signal per symbol
+    GET /bars/<security_id>?limit=75                             recent 5-minute bars
+    """
+
+    cache = None
+    routes = (
+        (re.compile(r"^/health$"), "health"),
+        (re.compile(r"^/setups$"), "setups"),
+        (re.compile(r"^/trades$"), "trades"),
+        (re.compile(r"^/signals$"), "signals"),
+        (re.compile(r"^/bars/(\w+)$"), "bars"),
+    )
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        for pattern, name in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                try:
+                    getattr(self, f"get_{name}")(query, *match.groups())
+                except Exception as e:
+                    logger.exception(f"❌ API error on {self.path}: {e}")
+                    self._send(500, _encode({"error": "internal error"}))
+                return
+        self._send(404, _encode({"error": "not found"}))
+
+    # --- Routes ---
+
+    def get_health(self, query):
+        self._send(200, _encode({
+            "status": "ok",
+            "market_open": calendar.is_open(),
+            "cache": self.cache.stats(),
+            "quota": quota_manager.stats(),
+            "concurrency": broker_concurrency.stats(),
+            "market_bus": market_bus.stats(),
+        }), cache_control="no-store")
+
+    def get_setups(self, query):
+        if "status" in query:
+            query["tradeStatus"] = query.pop("status")
+        self._serve_view("setups", query, ("tradeStatus", "signal", "symbol"))
+
+    def get_trades(self, query):
+        self._serve_view("trades", query, ("signal", "symbol"))
+
+    def get_signals(self, query):
+        self._serve_view("signals", query, ("symbol", "signal", "tradeStatus"))
+
+    def get_bars(self, query, security_id):
+        view = self.cache.bars_view(security_id)
+        if view is None:
+            self._send(404, _encode({"error": f"no bars cached for {security_id}"}))
+            return
+        try:
+            limit = min(MAX_PER_PAGE, max(1, int(query.get("limit", [str(DEFAULT_BAR_LIMIT)])[0])))
+        except ValueError:
+            limit = DEFAULT_BAR_LIMIT
+        etag = f'"{view.etag}-{limit}"'
+        if self._not_modified(etag):
+            return
+        body = self.cache.encoded(
+            (f"bars:{security_id}", etag),
+            lambda: {"security_id": security_id, "items": view.items[-limit:], "updated_at": view.updated_at}
+        )
+        self._send(200, body, etag=etag)
+
+    # --- Helpers ---
+
+    def _serve_view(self, name, query, filter_fields):
+        view = self.cache.view(name)
+        if view is None:
+            self._send(503, _encode({"error": "warming up"}), cache_control="no-store")
+            return
+        query_key = "&".join(f"{k}={','.join(sorted(v))}" for k, v in sorted(query.items()))
+        etag = '"' + hashlib.sha1(f"{view.etag}?{query_key}".encode()).hexdigest()[:16] + '"'
+        if self._not_modified(etag):
+            return
+
+        def build():
+            payload = _page(_filter(view.items, query, filter_fields), query)
+            payload["updated_at"] = view.updated_at
+            return payload
+
+        self._send(200, self.cache.encoded((name, etag), build), etag=etag)
+
+    def _not_modified(self, etag):
+        if self.headers.get("If-None-Match") == etag:
+            self.cache.not_modified += 1
+            self._send(304, b"", etag=etag)
+            return True
+        return False
+
+    def _send(self, status, body, etag=None, cache_control="no-cache"):
+        self.send_response(status)
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Cache-Control", cache_control)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if body and status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # dashboard polling would flood the worker log
+
+
+class ApiServer:
+    """Threaded stdlib HTTP server running inside the worker process."""
+
+    def __init__(self, cache, port=API_PORT):
+        self.cache = cache
+        self.port = port
+        self._server = None
+
+    def start(self):
+        handler = type("BoundApiHandler", (ApiHandler,), {"cache": self.cache})
+        self._server = ThreadingHTTPServer(("0.0.0.0", self.port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="api-server", daemon=True).start()
+        logger.info(f"🌐 Read API listening on :{self.port}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server = None
+
+
+# Global cache the worker keeps warm
+read_cache = ReadCache()
@@ -0,0 +1,170 @@
+# services/calendar_service.py
+
+import json
+import os
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+
+import pytz
+
+from utils.logger import logger
+from utils.time_utils import ist_date, to_epoch
+
+IST = pytz.timezone("Asia/Kolkata")
+
+SESSION_OPEN = time(9, 15)
+SESSION_CLOSE = time(15, 30)
+BAR_MINUTES = 5
+
+# NSE equity segment trading holidays (weekdays only; weekends are always closed).
+# Extend/override without a deploy via TRADING_CALENDAR_FILE.
+NSE_HOLIDAYS = {
+    # 2025
+    "2025-02-26", "2025-03-14", "2025-03-31", "2025-04-10", "2025-04-14",
+    "2025-04-18", "2025-05-01", "2025-08-15", "2025-08-27", "2025-10-02",
+    "2025-10-21", "2025-10-22", "2025-11-05", "2025-12-25",
+    # 2026
+    "2026-01-15", "2026-01-26", "2026-03-03", "2026-03-26", "2026-03-31",
+    "2026-04-03", "2026-04-14", "2026-05-01", "2026-05-28", "2026-06-26",
+    "2026-09-14", "2026-10-02", "2026-10-20", "2026-11-10", "2026-11-24",
+    "2026-12-25",
+}
+
+# Sessions outside the normal schedule (e.g. Muhurat trading), date -> (open, close) IST
+SPECIAL_SESSIONS = {
+    "2025-10-21": ("13:45", "14:45"),
+}
+
+TRADING_CALENDAR_FILE = os.getenv("TRADING_CALENDAR_FILE")
+
+
+def _load_overrides():
+    """Optional JSON file: {"holidays": [...], "special_sessions": {"YYYY-MM-DD": ["HH:MM", "HH:MM"]}}"""
+    if not TRADING_CALENDAR_FILE or not os.path.exists(TRADING_CALENDAR_FILE):
+        return
+    with open(TRADING_CALENDAR_FILE) as f:
+        overrides = json.load(f)
+    NSE_HOLIDAYS.update(overrides.get("holidays", []))
+    SPECIAL_SESSIONS.update({d: tuple(s) for d, s in overrides.get("special_sessions", {}).items()})
+    logger.info(f"📅 Loaded trading calendar overrides from {TRADING_CALENDAR_FILE}")
+
+
+_load_overrides()
+
+
+def _parse_time(value):
+    return datetime.strptime(value, "%H:%M").time()
+
+
+class TradingCalendar:
+    """
+    IST trading calendar for NSE equities.
+
+    All answers are computed in Asia/Kolkata regardless of the server's
+    timezone. Per-day session bounds and 5-minute bar boundaries are
+    precomputed once per day and cached, both as datetimes and as epoch
+    seconds for integer comparisons (`session_epochs`, `bar_close_epochs`).
+    """
+
+    @staticmethod
+    def now():
+        return datetime.now(IST)
+
+    @staticmethod
+    def _as_date(day):
+        if isinstance(day, datetime):
+            return day.astimezone(IST).date() if day.tzinfo else day.date()
+        return day
+
+    @lru_cache(maxsize=64)
+    def session(self, day):
+        """(open, close) IST datetimes for `day`, or None if the market is shut."""
+        day = self._as_date(day)
+        key = day.strftime("%Y-%m-%d")
+
+        if key in SPECIAL_SESSIONS:
+            open_t, close_t = (_parse_time(t) for t in SPECIAL_SESSIONS[key])
+        elif day.weekday() >= 5 or key in NSE_HOLIDAYS:
+            return None
+        else:
+            open_t, close_t = SESSION_OPEN, SESSION_CLOSE
+
+        return IST.localize(datetime.combine(day, open_t)), IST.localize(datetime.combine(day, close_t))
+
+    @lru_cache(maxsize=64)
+    def session_epochs(self, day):
+        """session(day) as (open, close) epoch seconds, or None."""
+        session = self.session(day)
+        return None if session is None else (int(session[0].timestamp()), int(session[1].timestamp()))
+
+    def is_open_at(self, ts):
+        """is_open for epoch seconds."""
+        session = self.session_epochs(ist_date(ts))
+        return session is not None and session[0] <= ts <= session[1]
+
+    def is_trading_day(self, day):
+        return self.session(self._as_date(day)) is not None
+
+    def is_open(self, now=None):
+        now = now or self.now()
+        session = self.session(self._as_date(now))
+        return session is not None and session[0] <= now <= session[1]
+
+    @lru_cache(maxsize=64)
+    def bar_closes(self, day):
+        """All 5-minute bar close times of the session on `day` (empty if closed)."""
+        session = self.session(self._as_date(day))
+        if session is None:
+            return ()
+        open_dt, close_dt = session
+        step = timedelta(minutes=BAR_MINUTES)
+        closes = []
+        t = open_dt + step
+        while t <= close_dt:
+            closes.append(t)
+            t += step
+        return tuple(closes)
+
+    @lru_cache(maxsize=64)
+    def bar_close_epochs(self, day):
+        """bar_closes(day) as sorted epoch seconds."""
+        return tuple(int(c.timestamp()) for c in self.bar_closes(day))
+
+    def last_closed_bar(self, now=None):
+        """Close time of the most recent completed bar today, or None before the first close."""
+        now = now or self.now()
+        day = self._as_date(now)
+        i = bisect_right(self.bar_close_epochs(day), to_epoch(now))
+        return self.bar_closes(day)[i - 1] if i else None
+
+    def last_closed_bar_epoch(self, ts):
+        closes = self.bar_close_epochs(ist_date(ts))
+        i = bisect_right(closes, ts)
+        return closes[i - 1] if i else None
+
+    def next_bar_close(self, now=None):
+        now = now or self.now()
+        day = self._as_date(now)
+        closes = self.bar_closes(day)
+        i = bisect_right(self.bar_close_epochs(day), to_epoch(now))
+        return closes[i] if i < len(closes) else None
+
+    def next_session_open(self, now=None):
+        """Open of the next session at or after `now` (today's if it hasn't opened yet)."""
+        now = now or self.now()
+        day = self._as_date(now)
+        for offset in range(0, 15):
+            session = self.session(day + timedelta(days=offset))
+            if session and session[1] >= now:
+                return max(session[0], now)
+        return None
+
+    def seconds_until_open(self, now=None):
+        now = now or self.now()
+        next_open = self.next_session_open(now)
+        return max(0.0, (next_open - now).total_seconds()) if next_open else 24 * 3600.0
+
+
+# Global instance
+calendar = TradingCalendar()
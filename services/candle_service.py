@@ -0,0 +1,146 @@
+# services/candle_service.py
+
+import os
+import threading
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, CollectionInvalid
+
+from config.db_config import db
+from utils.logger import logger
+from utils.time_utils import bar_close, now_epoch, to_epoch
+
+CANDLE_TTL_DAYS = int(os.getenv("CANDLE_TTL_DAYS", "180"))
+
+CANDLE_FIELDS = ("Open", "High", "Low", "Close", "Volume")
+SIGNAL_FIELDS = (
+    "Close", "SMA20", "SMA200", "ATR", "signal", "stoploss", "target", "tradeStatus",
+    "trend_strength", "atr_mean", "avg_vol", "is_sma20_rising", "is_sma20_falling",
+    "strong_bullish_vol", "strong_bearish_vol", "near_sma", "isBullish", "isBearish",
+    "is_higher_highs", "is_lower_lows",
+)
+
+candles = db["candles"]
+signals = db["signals"]
+
+
+def candle_ref(security_id, ts):
+    """What setup documents store instead of the candle itself."""
+    return {"securityId": str(security_id), "ts": ts}
+
+
+class CandleService:
+    """
+    Stores 5-minute bars (`candles`) and per-bar strategy evaluations (`signals`)
+    in MongoDB time-series collections.
+
+    - metaField `meta.securityId` + timeField `ts`, minute granularity, so
+      MongoDB buckets and compresses bars per instrument
+    - documents expire after CANDLE_TTL_DAYS
+    - records are buffered and written with one insert_many per cycle
+    """
+
+    def __init__(self):
+        self._candles = []
+        self._signals = []
+        self._last_ts = {}  # security id -> last bar time written (time-series has no unique index)
+        self._lock = threading.Lock()
+
+    def ensure_collections(self):
+        """Create the time-series collections and their (securityId, ts) indexes if missing."""
+        for name in ("candles", "signals"):
+            try:
+                db.create_collection(
+                    name,
+                    timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+                    expireAfterSeconds=CANDLE_TTL_DAYS * 24 * 3600,
+                    storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}},
+                )
+                logger.info(f"✅ Created time-series collection '{name}'")
+            except CollectionInvalid:
+                pass  # already exists
+            db[name].create_index([("meta.securityId", ASCENDING), ("ts", ASCENDING)])
+
+    def record(self, candle_data):
+        """
+        Buffer the evaluated bar and its signal. Returns the candle reference.
+        Only closed bars are stored: a forming bar's OHLCV and signal are a
+        partial snapshot, and the dedupe below would keep that snapshot for good.
+        """
+        security_id = str(candle_data["dsecurityid"])
+        ts = candle_data["Datetime"]
+        ref = candle_ref(security_id, ts)
+        if bar_close(to_epoch(ts)) > now_epoch():
+            return ref
+
+        with self._lock:
+            if self._last_ts.get(security_id) == ts:
+                return ref
+            self._last_ts[security_id] = ts
+
+            meta = {"securityId": security_id, "symbol": candle_data.get("symbol")}
+            self._candles.append({"ts": ts, "meta": meta, **{f: candle_data.get(f) for f in CANDLE_FIELDS}})
+            self._signals.append({"ts": ts, "meta": meta, **{f: candle_data.get(f) for f in SIGNAL_FIELDS}})
+        return ref
+
+    def flush(self):
+        """
+        Write buffered candles and signals, one insert_many each. Records that
+        were not written go back into the buffer for the next flush (record()
+        would skip them as already seen) and the error is raised.
+        """
+        with self._lock:
+            pending_candles, self._candles = self._candles, []
+            pending_signals, self._signals = self._signals, []
+
+        error = None
+        for collection, pending, buffer in ((candles, pending_candles, "_candles"), (signals, pending_signals, "_signals")):
+            if not pending:
+                continue
+            try:
+                collection.insert_many(pending, ordered=False)
+            except Exception as e:
+                error = error or e
+                if isinstance(e, BulkWriteError):
+                    # Unordered: everything but the reported documents landed
+                    failed = {err["index"] for err in e.details.get("writeErrors", [])}
+                    pending = [doc for i, doc in enumerate(pending) if i in failed]
+                with self._lock:
+                    setattr(self, buffer, pending + getattr(self, buffer))
+
+        if error is not None:
+            raise error
+        if pending_candles or pending_signals:
+            logger.info(f"🕯️ Stored {len(pending_candles)} candles / {len(pending_signals)} signals")
+
+    def fetch_candles(self, security_id, start, end, projection=None):
+        """Bars for one instrument in [start, end], served by the (meta.securityId, ts) index."""
+        return list(
+            candles.find(
+                {"meta.securityId": str(security_id), "ts": {"$gte": start, "$lte": end}},
+                projection or {"_id": 0, "meta": 0},
+            ).sort("ts", ASCENDING)
+        )
+
+    def fetch_signals(self, security_id, start, end, projection=None):
+        return list(
+            signals.find(
+                {"meta.securityId": str(security_id), "ts": {"$gte": start, "$lte": end}},
+                projection or {"_id": 0, "meta": 0},
+            ).sort("ts", ASCENDING)
+        )
+
+    def resolve(self, refs):
+        """Load the signal records a setup document points at."""
+        if not refs:
+            return []
+        return list(
+            signals.find(
+                {"$or": [{"meta.securityId": r["securityId"], "ts": r["ts"]} for r in refs]},
+                {"_id": 0},
+            ).sort("ts", ASCENDING)
+        )
+
+
+# Global instance shared by the scan and setup persistence
+candle_service = CandleService()
@@ -0,0 +1,180 @@
+# services/change_stream_service.py
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytz
+from pymongo.errors import OperationFailure, PyMongoError
+
+from config.db_config import db
+from utils.logger import logger
+
+IST = pytz.timezone("Asia/Kolkata")
+
+# Server error codes that mean "change streams can't be used here"
+# 40573: not a replica set / sharded cluster, 20: illegal operation (standalone)
+UNSUPPORTED_CODES = {20, 40573}
+# Resume token fell off the oplog
+HISTORY_LOST_CODES = {136, 280, 286}
+
+WATCHED_OPS = ["insert", "update", "replace"]
+
+# The resume token is written every N events or S seconds (and on shutdown), not per event.
+# Replaying the few events after it is safe: dispatch is idempotent through the setup claim.
+TOKEN_SAVE_EVENTS = int(os.getenv("RESUME_TOKEN_SAVE_EVENTS", "50"))
+TOKEN_SAVE_SECONDS = float(os.getenv("RESUME_TOKEN_SAVE_SECONDS", "5"))
+
+
+class ChangeStreamService:
+    """
+    Listens to `setups` and `trades` through a single database change stream.
+
+    - New/updated setups with tradeStatus == "ready" are handed to `on_setup_ready`
+    - Any trade insert/update is handed to `on_trade_change`
+    - The resume token is persisted in `resumetokens`, so a restart continues
+      where the previous listener stopped
+    - `on_connect` runs every time the stream (re)opens, so the caller can do
+      a catch-up poll for anything written while it was down
+    - When change streams are unavailable (standalone mongod), `is_streaming`
+      stays False and the caller keeps polling
+    """
+
+    TOKEN_ID = "setups-trades"
+
+    def __init__(self, on_setup_ready, on_trade_change=None, on_connect=None, database=None, retry_interval=30):
+        self.db = database if database is not None else db
+        self.on_setup_ready = on_setup_ready
+        self.on_trade_change = on_trade_change
+        self.on_connect = on_connect
+        self.retry_interval = retry_interval
+        self.is_streaming = False
+        self._stop = threading.Event()
+        self._thread = None
+        logger.info("✅ ChangeStreamService initialized")
+
+    # --- Resume token persistence ---
+
+    def load_resume_token(self):
+        doc = self.db["resumetokens"].find_one({"_id": self.TOKEN_ID})
+        return doc.get("token") if doc else None
+
+    def save_resume_token(self, token):
+        self.db["resumetokens"].update_one(
+            {"_id": self.TOKEN_ID},
+            {"$set": {"token": token, "updatedAt": datetime.now(IST)}},
+            upsert=True
+        )
+
+    def clear_resume_token(self):
+        self.db["resumetokens"].delete_one({"_id": self.TOKEN_ID})
+
+    # --- Lifecycle ---
+
+    def supports_change_streams(self):
+        """Change streams need a replica set or a sharded cluster; a standalone mongod has neither."""
+        try:
+            hello = self.db.client.admin.command("hello")
+        except PyMongoError as e:
+            logger.warning(f"⚠️ Could not read the MongoDB topology ({e}), trying change streams anyway")
+            return True
+        return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        if not self.supports_change_streams():
+            logger.warning("⚠️ MongoDB is a standalone server (change streams need a replica set), "
+                           "falling back to polling setups/trades every cycle")
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.is_streaming = False
+
+    def _pipeline(self):
+        return [{
+            "$match": {
+                "operationType": {"$in": WATCHED_OPS},
+                "ns.coll": {"$in": ["setups", "trades"]}
+            }
+        }]
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._watch()
+            except OperationFailure as e:
+                self.is_streaming = False
+                if e.code in UNSUPPORTED_CODES:
+                    logger.warning(f"⚠️ Change streams unavailable ({e.code}: {e.details.get('errmsg') if e.details else e}); "
+                                   "they need a replica set or sharded cluster, falling back to polling")
+                    return
+                if e.code in HISTORY_LOST_CODES:
+                    logger.warning("⚠️ Resume token expired, restarting change stream from now")
+                    self.clear_resume_token()
+                    continue
+                logger.exception(f"❌ Change stream failed: {e}")
+            except PyMongoError as e:
+                self.is_streaming = False
+                logger.exception(f"❌ Change stream connection error: {e}")
+            except Exception as e:
+                self.is_streaming = False
+                logger.exception(f"❌ Change stream handler error: {e}")
+
+            # Wait before reconnecting; the caller polls in the meantime
+            self._stop.wait(self.retry_interval)
+
+    def _watch(self):
+        token = self.load_resume_token()
+        with self.db.watch(
+            self._pipeline(),
+            full_document="updateLookup",
+            resume_after=token,
+            max_await_time_ms=1000
+        ) as stream:
+            self.is_streaming = True
+            logger.info(f"📡 Watching setups/trades (resumed={token is not None})")
+            if self.on_connect:
+                self.on_connect()
+
+            token, unsaved, saved_at = None, 0, time.time()
+            try:
+                while not self._stop.is_set() and stream.alive:
+                    change = stream.try_next()
+                    if change is not None:
+                        self._dispatch(change)
+                        unsaved += 1
+                    # Only past events that were handled
+                    token = stream.resume_token
+                    if unsaved and (unsaved >= TOKEN_SAVE_EVENTS or time.time() - saved_at >= TOKEN_SAVE_SECONDS):
+                        self.save_resume_token(token)
+                        unsaved, saved_at = 0, time.time()
+            finally:
+                if unsaved and token is not None:
+                    try:
+                        self.save_resume_token(token)
+                    except PyMongoError as e:
+                        logger.warning(f"⚠️ Could not save the change stream resume token: {e}")
+
+    def _dispatch(self, change):
+        coll = change["ns"]["coll"]
+        doc = change.get("fullDocument")
+        if doc is None:
+            return
+
+        if coll == "setups":
+            # Post-image is looked up after the pipeline, so filter here
+            if doc.get("tradeStatus") != "ready":
+                return
+            started = time.time()
+            self.on_setup_ready(doc)
+            logger.info(f"⚡ Setup {doc.get('symbol')} handled in {time.time() - started:.2f}s")
+        elif coll == "trades" and self.on_trade_change:
+            self.on_trade_change(doc, change["operationType"])
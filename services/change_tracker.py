@@ -0,0 +1,67 @@
+# services/change_tracker.py
+
+import threading
+
+_MISSING = object()
+
+
+class ChangeTracker:
+    """
+    Last persisted value of every field, per record key. Writers ask for the
+    fields that actually changed and skip the write when nothing did, so
+    Mongo write volume follows state changes rather than the polling rate.
+
+    A key that was never seen reports all its fields as changed.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = {}
+        self.writes = 0
+        self.skipped = 0
+        self.fields_written = 0
+        self.fields_suppressed = 0
+        self._lock = threading.Lock()
+
+    def changes(self, key, fields):
+        """The subset of `fields` that differs from what was last persisted for `key`."""
+        with self._lock:
+            last = self.state.get(key)
+            if last is None:
+                return dict(fields)
+            changed = {f: v for f, v in fields.items() if last.get(f, _MISSING) != v}
+            self.fields_suppressed += len(fields) - len(changed)
+            if not changed:
+                self.skipped += 1
+            return changed
+
+    def persisted(self, key, fields):
+        """Record a successful write of `fields` for `key`."""
+        with self._lock:
+            self.state.setdefault(key, {}).update(fields)
+            self.writes += 1
+            self.fields_written += len(fields)
+
+    def seed(self, key, fields):
+        """Known database state (e.g. loaded or streamed in); not counted as a write."""
+        with self._lock:
+            self.state[key] = dict(fields)
+
+    def forget(self, key):
+        with self._lock:
+            self.state.pop(key, None)
+
+    def retain(self, keep):
+        """Drop every key for which `keep(key)` is false, e.g. an earlier day's records."""
+        with self._lock:
+            self.state = {k: v for k, v in self.state.items() if keep(k)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracked": len(self.state),
+                "writes": self.writes,
+                "skipped": self.skipped,
+                "fields_written": self.fields_written,
+                "fields_suppressed": self.fields_suppressed,
+            }
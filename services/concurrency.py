@@ -0,0 +1,157 @@
+# services/concurrency.py
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from services.resilience import classify_response, classify_exception, RATE_LIMIT, TRANSIENT
+from utils.logger import logger
+
+CONCURRENCY_MIN = int(os.getenv("BROKER_CONCURRENCY_MIN", "1"))
+CONCURRENCY_MAX = int(os.getenv("BROKER_CONCURRENCY_MAX", "8"))
+CONCURRENCY_INITIAL = float(os.getenv("BROKER_CONCURRENCY_INITIAL", "2"))
+# Calls per adjustment; a rate-limit response ends the window early
+WINDOW_CALLS = int(os.getenv("BROKER_CONCURRENCY_WINDOW", "20"))
+# p90 latency this many times the baseline counts as congestion
+LATENCY_FACTOR = float(os.getenv("BROKER_CONCURRENCY_LATENCY_FACTOR", "2.0"))
+# Share of 429/5xx/timeouts in a window that counts as congestion
+ERROR_RATE = float(os.getenv("BROKER_CONCURRENCY_ERROR_RATE", "0.05"))
+
+ERROR_BACKOFF = 0.5     # multiplicative decrease on throttling / errors
+LATENCY_BACKOFF = 0.8   # gentler decrease when the broker is only slowing down
+CONGESTION_KINDS = {RATE_LIMIT, TRANSIENT}
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AdaptiveLimiter:
+    """
+    AIMD window on in-flight broker calls.
+
+    Every window of calls is judged on its 429/5xx rate and p90 latency
+    against a baseline (the p50 floor, allowed to drift up slowly):
+
+    - too many errors   -> window * 0.5
+    - latency inflated  -> window * 0.8
+    - otherwise, if the window was actually used in full -> window + 1
+
+    so the scan runs as wide as the broker sustains, backs off as soon as it
+    pushes back, and always stays within [min_limit, max_limit].
+    """
+
+    def __init__(self, name, min_limit=CONCURRENCY_MIN, max_limit=CONCURRENCY_MAX, initial=CONCURRENCY_INITIAL,
+                 window_calls=WINDOW_CALLS):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.window_calls = window_calls
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.baseline = None
+        self.samples = []          # (latency, congested) of the current window
+        self.history = deque(maxlen=10)   # last window reports
+        self.increases = 0
+        self.decreases = 0
+        self.epoch = 0             # bumped on every decrease
+        self._cond = threading.Condition()
+
+    @property
+    def window(self):
+        return int(self.limit)
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while self.in_flight >= self.window:
+                self._cond.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify()
+
+    def call(self, fn):
+        """Run `fn()` in a slot and feed its latency and outcome to the controller."""
+        with self.slot():
+            epoch = self.epoch
+            started = time.monotonic()
+            try:
+                resp = fn()
+            except Exception as e:
+                self.record(time.monotonic() - started, classify_exception(e), epoch)
+                raise
+            self.record(time.monotonic() - started, classify_response(resp) if isinstance(resp, dict) else None, epoch)
+            return resp
+
+    def record(self, latency, kind=None, epoch=None):
+        with self._cond:
+            if epoch is not None and epoch != self.epoch:
+                # Sent under the window we already backed off from; counting it
+                # again would cut the window twice for the same congestion
+                return
+            self.samples.append((latency, kind in CONGESTION_KINDS))
+            if len(self.samples) >= self.window_calls or kind == RATE_LIMIT:
+                self._adjust()
+                self._cond.notify_all()
+
+    def _adjust(self):
+        latencies = [latency for latency, _ in self.samples]
+        errors = sum(1 for _, congested in self.samples if congested) / len(self.samples)
+        p50, p90 = _percentile(latencies, 0.5), _percentile(latencies, 0.9)
+        self.baseline = p50 if self.baseline is None else min(p50, self.baseline + (p50 - self.baseline) * 0.1)
+
+        before = self.limit
+        if errors > ERROR_RATE:
+            self.limit = max(self.min_limit, self.limit * ERROR_BACKOFF)
+            action = "throttled"
+        elif p90 > self.baseline * LATENCY_FACTOR:
+            self.limit = max(self.min_limit, self.limit * LATENCY_BACKOFF)
+            action = "slow"
+        elif self.peak_in_flight >= self.window:
+            self.limit = min(self.max_limit, self.limit + 1)
+            action = "grow"
+        else:
+            action = "hold"
+
+        if self.limit < before:
+            self.decreases += 1
+            self.epoch += 1
+            logger.info(f"🐢 {self.name} concurrency {before:.1f} → {self.limit:.1f} ({action}: "
+                        f"errors {errors:.0%}, p90 {p90 * 1000:.0f} ms vs baseline {self.baseline * 1000:.0f} ms)",
+                        extra={"sample_key": "concurrency_down"})
+        elif self.limit > before:
+            self.increases += 1
+
+        self.history.append({"calls": len(self.samples), "p50_ms": round(p50 * 1000), "p90_ms": round(p90 * 1000),
+                             "error_rate": round(errors, 3), "action": action})
+        self.samples = []
+        self.peak_in_flight = self.in_flight
+
+    def stats(self):
+        with self._cond:
+            last = self.history[-1] if self.history else {}
+            return {
+                "window": self.window,
+                "limit": round(self.limit, 2),
+                "bounds": [self.min_limit, self.max_limit],
+                "in_flight": self.in_flight,
+                "baseline_ms": round(self.baseline * 1000) if self.baseline is not None else None,
+                "p50_ms": last.get("p50_ms"),
+                "p90_ms": last.get("p90_ms"),
+                "error_rate": last.get("error_rate"),
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+
+# Global limiter for broker data calls (scan and monitor share it)
+broker_concurrency = AdaptiveLimiter("data")
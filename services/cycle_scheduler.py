@@ -0,0 +1,166 @@
+# services/cycle_scheduler.py
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from services.concurrency import broker_concurrency
+from utils.logger import logger
+
+CYCLE_BUDGET_SECONDS = float(os.getenv("CYCLE_BUDGET_SECONDS", "55"))
+
+# Lower runs first
+MONITOR = 0        # open trades, closest to their stop first
+READY_SETUPS = 1   # start trades for setups that just became ready
+CANDIDATES = 2     # symbols the prefilter ranks as able to signal
+UNIVERSE = 3       # everything else
+
+PRIORITY_NAMES = {MONITOR: "monitor", READY_SETUPS: "ready_setups", CANDIDATES: "candidates", UNIVERSE: "universe"}
+
+# Within a class, work carried over from earlier cycles goes ahead of fresh work
+CARRY_BOOST = 1e6
+
+
+class CycleScheduler:
+    """
+    Runs one cycle's work from a priority queue until it is empty or the
+    deadline passes. Work that misses the deadline is reported and carried
+    forward: when the same key is queued again next cycle it jumps ahead of
+    everything else in its class, so the tail of the universe rotates instead
+    of starving.
+
+    With a limiter, tasks are dispatched to a thread pool in priority order,
+    never more at once than the limiter's current window, so the cycle runs
+    as wide as the broker currently sustains. Tasks are not preempted; the
+    deadline is checked between dispatches. Tasks sharing a `serial` key
+    (e.g. the monitor and the scan of one security) never run at the same
+    time: a blocked task waits in the queue while lower priority work runs.
+    """
+
+    def __init__(self, budget=CYCLE_BUDGET_SECONDS, limiter=None):
+        self.budget = budget
+        self.limiter = limiter
+        self.carried = {}   # key -> number of cycles missed in a row
+        self.last_report = None
+        self._heap = []
+        self._pending = set()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.deadline = None
+
+    def begin(self, started=None):
+        with self._lock:
+            self._heap = []
+            self._pending = set()
+        self.deadline = (started or time.time()) + self.budget
+
+    def add(self, priority, key, fn, score=0.0, serial=None):
+        """Queue `fn()`; duplicates of a still-pending key are ignored. Safe to call from running tasks."""
+        with self._lock:
+            if key in self._pending:
+                return False
+            missed = self.carried.get(key, 0)
+            heapq.heappush(self._heap, (priority, score - missed * CARRY_BOOST, next(self._seq), key, fn, serial))
+            self._pending.add(key)
+            return True
+
+    def _pop(self, busy=()):
+        """Highest priority task whose serial key is not in `busy`, or None."""
+        with self._lock:
+            blocked = []
+            task = None
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                if entry[5] is not None and entry[5] in busy:
+                    blocked.append(entry)
+                    continue
+                task = entry
+                break
+            for entry in blocked:
+                heapq.heappush(self._heap, entry)
+            if task is None:
+                return None
+            priority, _, _, key, fn, serial = task
+            self._pending.discard(key)
+            self.carried.pop(key, None)
+            return priority, key, fn, serial
+
+    def _execute(self, key, fn):
+        try:
+            fn()
+            return True
+        except Exception as e:
+            logger.exception(f"❌ Task {key} failed: {e}")
+            return False
+
+    def run(self):
+        started = time.time()
+        done = {p: 0 for p in PRIORITY_NAMES}
+        failed = 0
+
+        if self.limiter is None or self.limiter.max_limit <= 1:
+            while time.time() < self.deadline:
+                task = self._pop()
+                if task is None:
+                    break
+                priority, key, fn, _ = task
+                failed += not self._execute(key, fn)
+                done[priority] = done.get(priority, 0) + 1
+        else:
+            running = {}
+            with ThreadPoolExecutor(max_workers=self.limiter.max_limit, thread_name_prefix="cycle") as pool:
+                while True:
+                    remaining = self.deadline - time.time()
+                    if remaining > 0 and len(running) < self.limiter.window:
+                        task = self._pop({serial for _, serial in running.values()})
+                        if task is not None:
+                            priority, key, fn, serial = task
+                            running[pool.submit(self._execute, key, fn)] = (priority, serial)
+                            continue
+                    if not running:
+                        break
+                    # Running tasks may queue more work; wake up for the first one to finish
+                    finished, _ = wait(running, timeout=max(remaining, 0) or None, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        priority, _ = running.pop(future)
+                        failed += not future.result()
+                        done[priority] = done.get(priority, 0) + 1
+
+        missed = {p: 0 for p in PRIORITY_NAMES}
+        still_carried = {}
+        with self._lock:
+            for priority, _, _, key, _, _ in self._heap:
+                missed[priority] = missed.get(priority, 0) + 1
+                still_carried[key] = self.carried.get(key, 0) + 1
+            self.carried = still_carried
+            self._heap = []
+            self._pending = set()
+
+        report = {
+            "elapsed": round(time.time() - started, 2),
+            "done": {PRIORITY_NAMES[p]: n for p, n in done.items() if n},
+            "missed": {PRIORITY_NAMES[p]: n for p, n in missed.items() if n},
+            "failed": failed,
+            "carried": len(still_carried),
+            "oldest_carry": max(still_carried.values(), default=0),
+        }
+        if self.limiter is not None:
+            report["window"] = self.limiter.window
+        self.last_report = report
+
+        if report["missed"]:
+            logger.warning(
+                f"⏱️ Cycle deadline hit after {report['elapsed']}s: missed {report['missed']}, "
+                f"{report['carried']} tasks carried forward (oldest {report['oldest_carry']} cycles)"
+            )
+        else:
+            logger.info(f"⏱️ Cycle work done in {report['elapsed']}s: {report['done']}")
+        return report
+
+
+# Global instance; carried work survives between cycles. Runs as many tasks at
+# once as the adaptive broker window allows.
+cycle_scheduler = CycleScheduler(limiter=broker_concurrency)
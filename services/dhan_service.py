@@ -1,13 +1,17 @@
 # services/dhan_service.py
 
 import os
-import requests
 from dotenv import load_dotenv
 from config.db_config import db
 from datetime import datetime, timedelta
-from dhanhq import dhanhq
-import pandas as pd
 from utils.logger import logger
+from services.market_state import market_state, BAR_FIELDS
+from services.market_bus import market_bus
+from services.resilience import broker_guard, BrokerError, NO_DATA
+from services.quota_manager import quota_manager, PRIORITY_ORDER
+from services.concurrency import broker_concurrency
+from services.response_cache import response_cache, signal_cache, expiry_for
+from utils.time_utils import BAR_SECONDS, DAY_SECONDS, bar_close, ist_day, format_ist, to_epoch
 import time
 
 
@@ -32,7 +36,8 @@ class DhanService:
             else:
                 raise ValueError("❌ Dhan credentials missing in both .env and DB")
 
-        self.client = dhanhq(self.client_id,  self.access_token)
+        # dhanhq (and pandas) are heavy imports; the client is built on first API call
+        self._client = None
 
         self.headers = {
             "Content-Type": "application/json",
@@ -43,213 +48,144 @@ class DhanService:
 
         logger.info("✅ DhanService initialized")
 
-    def fetch_intraday_minute_data(self, symbol_id, from_date, to_date):
-
+    @property
+    def client(self):
+        if self._client is None:
+            from dhanhq import dhanhq
+            self._client = dhanhq(self.client_id,  self.access_token)
+        return self._client
+
+    def _data_request(self, priority=None, timeout=None, **params):
+        """
+        intraday_minute_data under the shared data quota (waits for a permit,
+        never sleeps blindly) and the adaptive in-flight window.
+        """
+        quota_manager.acquire("data", priority=priority, timeout=timeout)
+        return broker_concurrency.call(lambda: self.client.intraday_minute_data(**params))
 
-       # Call Dhan API
-        resp = self.client.intraday_minute_data(
-            security_id=symbol_id,
-            exchange_segment=dhanhq.NSE,
-            instrument_type="EQUITY",
-            interval=5,
-            from_date=from_date.strftime("%Y-%m-%d"),
-            to_date=to_date.strftime("%Y-%m-%d %H:%M:%S")
-        )
-      
+    def fetch_intraday_minute_data(self, symbol_id, from_date, to_date):
+        from services.signal_engine import thread_buffer, bar_dict
 
-        if resp.get("status") != "success":
-            print(resp["data"])
-            time.sleep(10)
+        try:
+            resp = broker_guard.call("intraday", lambda: self._data_request(
+                security_id=symbol_id,
+                exchange_segment=self.client.NSE,
+                instrument_type="EQUITY",
+                interval=5,
+                from_date=from_date.strftime("%Y-%m-%d"),
+                to_date=to_date.strftime("%Y-%m-%d %H:%M:%S")
+            ), key=str(symbol_id))
+        except BrokerError:
             return None
         d = resp["data"]
-        df = pd.DataFrame({
-            "Datetime": pd.to_datetime(d["timestamp"], unit='s', utc=True),
-            "Open": d["open"],
-            "High": d["high"],
-            "Low": d["low"],
-            "Close": d["close"],
-            "Volume": d["volume"]
-        })
-        df["SMA20"] = df["Close"].rolling(20).mean()
-        df["SMA200"] = df["Close"].rolling(200).mean()
-        hl = df["High"] - df["Low"]
-        hc = abs(df["High"] - df["Close"].shift())
-        lc = abs(df["Low"] - df["Close"].shift())
-        df["ATR"] = pd.concat([hl, hc, lc], axis=1).max(axis=1).rolling(14).mean()
-        #df.dropna(inplace=True)
-        last_candle = df.tail(1).iloc[0].to_dict()
-        return last_candle
+        buf = thread_buffer().load(d).compute()
+        if buf.n == 0:
+            return None
+        return bar_dict(buf, buf.n - 1, symbol_id)
     
     def fetch_candles(self, symbol_id, symbol, date):
-        if isinstance(date, str):
-            date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
-
-        from_date = date - timedelta(days=5)
-
-        resp = self.client.intraday_minute_data(
-            security_id=symbol_id,
-            exchange_segment="NSE_EQ",
-            instrument_type="EQUITY",
-            interval=5,
-            from_date=from_date.strftime("%Y-%m-%d"),
-            to_date=date.strftime("%Y-%m-%d %H:%M:%S")
+        """
+        Evaluate the strategy on the bar containing `date` (epoch seconds; an
+        IST "YYYY-MM-DD HH:MM:SS" string or a datetime is converted once here).
+
+        Memoized per (security id, interval, bar close): the scan and the trade
+        monitor share one download and one evaluation per closed bar (a forming
+        bar only for FORMING_BAR_TTL), and concurrent callers for the same bar
+        wait for the in-flight request.
+        """
+        ts = to_epoch(date)
+        close_ts = bar_close(ts)
+        candle = signal_cache.get_or_load(
+            (str(symbol_id), 5, close_ts),
+            lambda: self._evaluate_candles(symbol_id, symbol, ts),
+            expiry_for(close_ts)
         )
-        time.sleep(0.25) # to avoid rate limits
+        # Callers mutate the dict (e.g. Datetime → IST), never hand out the cached one
+        return dict(candle) if candle else None
+
+    @staticmethod
+    def cache_stats():
+        return {"responses": response_cache.stats(), "signals": signal_cache.stats()}
+
+    @staticmethod
+    def broker_stats():
+        return broker_guard.stats()
+
+    @staticmethod
+    def quota_stats():
+        return quota_manager.stats()
+
+    @staticmethod
+    def concurrency_stats():
+        return broker_concurrency.stats()
+
+    def _download_bars(self, symbol_id, until):
+        """Fetch bars up to `until` (epoch seconds) into MarketState (only the gap if cached). Returns None on failure."""
+        from_ts = until - 5 * DAY_SECONDS
+
+        last_ts = market_state.last_timestamp(symbol_id)
+        if last_ts is not None and last_ts > until:
+            # Cached history already has a later bar, so this one is complete
+            return True
+
+        if market_bus.is_reader:
+            # Another process already downloaded this bar: take it from shared memory
+            bus_last = market_bus.last_timestamp(symbol_id)
+            if bus_last is not None and bus_last + BAR_SECONDS > until:
+                bars = market_bus.read(symbol_id, BAR_FIELDS)
+                if bars:
+                    market_state.merge_bars(symbol_id, bars)
+                    return True
+
+        if last_ts is not None and until - last_ts < 5 * DAY_SECONDS:
+            # Warm cache: only download from the day of the last cached bar
+            from_ts = last_ts
 
-        if resp.get("status") != "success":
-            print(resp.get("data"))
-            time.sleep(5)
+        try:
+            resp = broker_guard.call("intraday", lambda: self._data_request(
+                security_id=symbol_id,
+                exchange_segment="NSE_EQ",
+                instrument_type="EQUITY",
+                interval=5,
+                # The broker takes IST date strings
+                from_date=ist_day(from_ts),
+                to_date=format_ist(until, seconds=True)
+            ), key=str(symbol_id))
+        except BrokerError as e:
+            # Failures are deferred by the guard (no sleeping here); an empty
+            # gap on a warm cache still leaves usable bars
+            return True if e.kind == NO_DATA and last_ts is not None else None
+
+        market_state.merge_bars(symbol_id, resp["data"])
+        return True
+
+    def _evaluate_candles(self, symbol_id, symbol, ts):
+        from services.signal_engine import evaluate_last
+
+        close_ts = bar_close(ts)
+        downloaded = response_cache.get_or_load(
+            (str(symbol_id), 5, close_ts),
+            lambda: self._download_bars(symbol_id, ts),
+            expiry_for(close_ts)
+        )
+        if not downloaded:
             return None
 
-        d = resp["data"]
-        df = pd.DataFrame({
-            "Datetime": pd.to_datetime(d["timestamp"], unit='s', utc=True),
-            "Open": d["open"],
-            "High": d["high"],
-            "Low": d["low"],
-            "Close": d["close"],
-            "Volume": d["volume"]
-        })
-
-        df["dsecurityid"] = symbol_id;
-
-
-        # Indicators
-        df["SMA20"] = df["Close"].rolling(20).mean()
-        df["SMA200"] = df["Close"].rolling(200).mean()
-
-        hl = df["High"] - df["Low"]
-        hc = abs(df["High"] - df["Close"].shift())
-        lc = abs(df["Low"] - df["Close"].shift())
-        df["ATR"] = pd.concat([hl, hc, lc], axis=1).max(axis=1).rolling(14).mean()
-        atr_mean = df["ATR"].mean()
-
-        # Convert timezone
-        df["Datetime"] = df["Datetime"].dt.tz_convert("Asia/Kolkata")
-
-        # Get last candle <= given date
-        df_filtered = df[df["Datetime"] <= date.astimezone()]
-        if df_filtered.empty:
+        # Hot path: bars decode straight into reusable NumPy buffers (see signal_engine)
+        candle_data = evaluate_last(market_state.get_bars(symbol_id, ts), symbol_id, symbol)
+        if candle_data is None:
             return None
+        if market_bus.is_writer:
+            from services.signal_engine import thread_buffer
+            # evaluate_last left the computed bars and indicators in this thread's buffer
+            market_bus.publish(symbol_id, thread_buffer())
 
-        last_candle = df_filtered.tail(1).iloc[0]
-        close = float(last_candle["Close"])
-        open_ = float(last_candle["Open"])
-        sma20 = float(last_candle["SMA20"])
-        sma200 = float(last_candle["SMA200"])
-        atr = float(last_candle["ATR"])
-
-        # Distance from SMA20
-        near_sma = abs(close - sma20) <= (0.005 * close)  # within 0.5%
-
-        # SMA20 trend check
-        last_n = df["SMA20"].iloc[-3:].tolist()
-        is_sma20_rising = all(x < y for x, y in zip(last_n, last_n[1:]))
-        is_sma20_falling = all(x > y for x, y in zip(last_n, last_n[1:]))
-
-        # Volume analysis
-        last6 = df.iloc[-6:]
-        avg_vol = last6["Volume"].mean()
-        strong_bearish_vol = any(
-            (last6["Close"] < last6["Open"]) & (last6["Volume"] > avg_vol)
-        )
-        strong_bullish_vol = any(
-            (last6["Close"] > last6["Open"]) & (last6["Volume"] > avg_vol)
-        )
-
-        # Trend conditions
-        isBearish = (
-            (close < sma20)
-            and (sma20 < sma200)
-            and (atr > 0.5)
-            and is_sma20_falling
-            and near_sma
-            and strong_bearish_vol
-        )
-
-        isBullish = (
-            (close > sma20)
-            and (sma20 > sma200)
-            and (atr > 0.5)
-            and is_sma20_rising
-            and near_sma
-            and strong_bullish_vol
-        )
-
-        # Stoploss + Target logic
-        if len(df_filtered) >= 2:
-            prev_candle = df_filtered.iloc[-2]
-        else:
-            prev_candle = last_candle
-
-        if isBullish:
-            signal = "bullish"
-            stoploss = float(prev_candle["Low"])
-            target = round(close + (2 * atr), 2)
-        elif isBearish:
-            signal = "bearish"
-            stoploss = float(prev_candle["High"])
-            target = round(close - (2 * atr), 2)
-        else:
-            signal = None
-            stoploss = None
-            target = None
-
-        # Price Structure (HH / LL)
-        last_highs = df["High"].iloc[-3:].tolist()
-        last_lows = df["Low"].iloc[-3:].tolist()
-        is_higher_highs = all(x < y for x, y in zip(last_highs, last_highs[1:]))
-        is_lower_lows = all(x > y for x, y in zip(last_lows, last_lows[1:]))
-
-        # Enhanced Trend Strength
-        if isBullish:
-            if is_sma20_rising and strong_bullish_vol and is_higher_highs:
-                trend_strength = "strong_bullish"
-            elif is_sma20_rising and (strong_bullish_vol or is_higher_highs):
-                trend_strength = "moderate_bullish"
-            else:
-                trend_strength = "weak_bullish"
-
-        elif isBearish:
-            if is_sma20_falling and strong_bearish_vol and is_lower_lows:
-                trend_strength = "strong_bearish"
-            elif is_sma20_falling and (strong_bearish_vol or is_lower_lows):
-                trend_strength = "moderate_bearish"
-            else:
-                trend_strength = "weak_bearish"
-        else:
-            trend_strength = "neutral"
-        
-        tradeStatus = "ready" if signal and ("strong" in trend_strength or "moderate" in trend_strength) else "not_ready"
-
-        # Final candle dict
-        candle_data = last_candle.to_dict()
-        candle_data.update({
-            "symbol": symbol,
-            "signal": signal,
-            "stoploss": stoploss,
-            "target": target,
-            "tradeStatus": tradeStatus,
-            "atr_mean": round(float(atr_mean), 2),
-            "avg_vol": round(float(avg_vol), 2),
-            "is_sma20_rising": bool(is_sma20_rising),
-            "is_sma20_falling": bool(is_sma20_falling),
-            "strong_bullish_vol": bool(strong_bullish_vol),
-            "strong_bearish_vol": bool(strong_bearish_vol),
-            "near_sma": bool(near_sma),
-            "isBullish": bool(isBullish),
-            "isBearish": bool(isBearish),
-            "is_higher_highs": bool(is_higher_highs),
-            "is_lower_lows": bool(is_lower_lows),
-            "trend_strength": trend_strength
-        })
-
+        market_state.set_signal(symbol_id, candle_data)
         return candle_data
 
-
-
-    
     def fetch_dhan_data(self, symbol_id, date):
+        import pandas as pd
+
         # Parse the given date if it's a string (e.g., "2025-10-29")
         if isinstance(date, str):
             date = datetime.strptime(date, "%Y-%m-%d")
@@ -257,18 +193,16 @@ class DhanService:
         # Calculate 5 days back
         from_date = date - timedelta(days=5)
 
-        # Call Dhan API
-        resp = self.client.intraday_minute_data(
-            security_id=symbol_id,
-            exchange_segment=dhanhq.NSE,
-            instrument_type="EQUITY",
-            interval=5,
-            from_date=from_date.strftime("%Y-%m-%d"),
-            to_date=date.strftime("%Y-%m-%d")
-        )
-
-        if resp.get("status") != "success":
-            print(resp["data"])
+        try:
+            resp = broker_guard.call("intraday", lambda: self._data_request(
+                security_id=symbol_id,
+                exchange_segment=self.client.NSE,
+                instrument_type="EQUITY",
+                interval=5,
+                from_date=from_date.strftime("%Y-%m-%d"),
+                to_date=date.strftime("%Y-%m-%d")
+            ), key=str(symbol_id))
+        except BrokerError:
             return None
         d = resp["data"]
         df = pd.DataFrame({
@@ -291,6 +225,8 @@ class DhanService:
     # --- Example: Fetch 5-min candles ---
     def fetch_5min_candles(self, security_id: str, from_date: str, to_date: str):
         """Fetch 5-min candle data from Dhan"""
+        import requests
+
         url = f"{self.base_url}/market/v1/quotes/intraday-candle"
         params = {
             "securityId": security_id,
@@ -299,19 +235,24 @@ class DhanService:
             "toDate": to_date
         }
 
-        try:
+        def get():
+            quota_manager.acquire("quotes")
             resp = requests.get(url, headers=self.headers, params=params, timeout=10)
             resp.raise_for_status()
-            data = resp.json()
-            logger.info(f"Fetched 5-min candles for {security_id} ({len(data.get('data', []))} candles)")
+            return resp.json()
+
+        try:
+            data = broker_guard.call("quotes", get, key=str(security_id), check=None)
+            logger.info(f"Fetched 5-min candles for {security_id} ({len(data.get('data', []))} candles)", extra={"sample_key": "fetched_candles"})
             return data
-        except requests.RequestException as e:
-            logger.exception(f"Error fetching candles for {security_id}: {e}")
+        except BrokerError:
             return None
 
     # --- Example: Place an Order ---
     def place_order(self, symbol: str, side: str, quantity: int, price: float):
         """Place a simple order on Dhan"""
+        import requests
+
         url = f"{self.base_url}/orders"
         payload = {
             "symbol": symbol,
@@ -321,13 +262,18 @@ class DhanService:
             "price": price
         }
 
-        try:
+        def post():
+            quota_manager.acquire("orders", priority=PRIORITY_ORDER)
             resp = requests.post(url, headers=self.headers, json=payload, timeout=10)
             resp.raise_for_status()
-            data = resp.json()
+            return resp.json()
+
+        # Orders are not idempotent: no per-key retry, only the endpoint breaker
+        try:
+            data = broker_guard.call("orders", post, check=None)
             logger.info(f"✅ Order placed: {symbol} | {side} | {quantity}")
             return data
-        except requests.RequestException as e:
-            logger.exception(f"❌ Order placement failed for {symbol}: {e}")
+        except BrokerError as e:
+            logger.error(f"❌ Order placement failed for {symbol}: {e}")
             return None
 
@@ -0,0 +1,287 @@
+# services/market_bus.py
+
+import os
+import threading
+import time
+
+from services.market_state import BAR_FIELDS, MAX_BARS
+from utils.logger import logger
+
+BUS_ROLE = os.getenv("MARKET_BUS", "").lower()          # "writer", "reader" or off
+BUS_NAME = os.getenv("MARKET_BUS_NAME", "narmada-bars")
+BUS_SLOTS = int(os.getenv("MARKET_BUS_SLOTS", "3000"))   # securities
+BUS_BARS = MAX_BARS
+
+MAGIC = 0x4E42555331        # "NBUS1"
+LAYOUT_VERSION = 1
+
+# Value columns after the int64 timestamps
+VALUE_FIELDS = BAR_FIELDS[1:] + ("sma20", "sma200", "atr")
+BUFFER_COLUMNS = {"sma20": "sma_fast", "sma200": "sma_slow"}   # BarBuffer attribute names
+
+# Global header (int64): magic, version, slots, bars, columns, slots in use, generation
+HEADER_WORDS = 8
+H_MAGIC, H_VERSION, H_SLOTS, H_BARS, H_COLUMNS, H_USED, H_GENERATION = range(7)
+# Slot header (int64): seqlock sequence, bar count, security id, publish time (ms)
+SLOT_WORDS = 4
+S_SEQ, S_COUNT, S_SECURITY, S_UPDATED = range(4)
+
+READ_RETRIES = 100
+
+
+def _attach(shared_memory, name):
+    """Attach without letting this process's resource tracker unlink the writer's segment on exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python 3.13+
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class MarketBus:
+    """
+    Bars and indicator columns in one fixed-layout shared memory segment, so
+    a scanner, a trade monitor and the web process can share one copy of the
+    market instead of each downloading and holding their own.
+
+    Layout (all NumPy views on the segment, no pickling):
+        header  int64[8]
+        slots   int64[SLOTS, 4]            seq, count, security id, updated
+        ts      int64[SLOTS, BARS]
+        values  float64[SLOTS, 8, BARS]    OHLCV + SMA20/SMA200/ATR
+
+    One writer publishes; any number of readers attach. Every slot is guarded
+    by a seqlock: the writer makes `seq` odd, writes, makes it even again,
+    and a reader retries when it saw an odd or changed `seq`. `views()` hands
+    out zero-copy views (check them with `stable()`), `read()` returns a
+    consistent copy.
+
+    A restarted writer reuses the segment and hands out slots afresh, so the
+    generation word is seeded from the wall clock (it only ever grows, across
+    restarts too) and readers also check that a slot still holds the
+    security they looked up before trusting it.
+    """
+
+    def __init__(self, name=BUS_NAME, slots=BUS_SLOTS, bars=BUS_BARS):
+        self.name = name
+        self.slots = slots
+        self.bars = bars
+        self.role = None
+        self._shm = None
+        self._directory = {}   # security id -> slot
+        self._generation = -1
+        self.published = 0
+        self.read_retries = 0
+        self._write_lock = threading.Lock()
+
+    @property
+    def is_writer(self):
+        return self.role == "writer"
+
+    @property
+    def is_reader(self):
+        return self.role == "reader"
+
+    # --- Lifecycle ---
+
+    def open(self, role=BUS_ROLE):
+        """Create (writer) or attach to (reader) the segment. Returns False if the bus stays off."""
+        if role not in ("writer", "reader"):
+            return False
+        import numpy as np
+        from multiprocessing import shared_memory
+
+        self._np = np
+        size = 8 * (HEADER_WORDS + self.slots * SLOT_WORDS + self.slots * self.bars * (1 + len(VALUE_FIELDS)))
+        try:
+            if role == "writer":
+                try:
+                    self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+                except FileExistsError:
+                    # Left over by a writer that died; the layout is rebuilt below
+                    self._shm = shared_memory.SharedMemory(name=self.name)
+                    if self._shm.size < size:
+                        self._shm.close()
+                        self._shm.unlink()
+                        self._shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+            else:
+                self._shm = _attach(shared_memory, self.name)
+        except FileNotFoundError:
+            logger.warning(f"⚠️ Market bus '{self.name}' not found; reading from the broker instead")
+            return False
+
+        self._map(role)
+        self.role = role
+        logger.info(f"🚌 Market bus '{self.name}' open as {role}: {self.slots} slots x {self.bars} bars "
+                    f"({size / 1e6:.0f} MB shared)")
+        return True
+
+    def _map(self, role):
+        np = self._np
+        buf = self._shm.buf
+        self.header = np.ndarray((HEADER_WORDS,), np.int64, buf, 0)
+
+        if role == "writer":
+            # Above any generation an earlier writer published, so attached readers rebuild their directory
+            generation = max(time.time_ns(), int(self.header[H_GENERATION]) + 1)
+            self.header[:] = 0
+            self.header[[H_MAGIC, H_VERSION, H_SLOTS, H_BARS, H_COLUMNS]] = (
+                MAGIC, LAYOUT_VERSION, self.slots, self.bars, len(VALUE_FIELDS))
+            self.header[H_GENERATION] = generation
+        elif self.header[H_MAGIC] != MAGIC or self.header[H_VERSION] != LAYOUT_VERSION:
+            raise RuntimeError(f"Market bus '{self.name}' has an unknown layout")
+        else:
+            # The writer's layout wins
+            self.slots, self.bars = int(self.header[H_SLOTS]), int(self.header[H_BARS])
+
+        offset = 8 * HEADER_WORDS
+        self.slot_meta = np.ndarray((self.slots, SLOT_WORDS), np.int64, buf, offset)
+        offset += self.slot_meta.nbytes
+        self.ts = np.ndarray((self.slots, self.bars), np.int64, buf, offset)
+        offset += self.ts.nbytes
+        self.values = np.ndarray((self.slots, len(VALUE_FIELDS), self.bars), np.float64, buf, offset)
+
+        if role == "writer":
+            self.slot_meta[:] = 0
+
+    def close(self):
+        if self._shm is None:
+            return
+        # Views must go before the mapping can close
+        self.header = self.slot_meta = self.ts = self.values = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # a caller still holds views(); the mapping goes with the process
+        if self.is_writer:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._shm = None
+        self.role = None
+
+    # --- Writer ---
+
+    def _slot_for(self, security_id):
+        key = int(security_id)
+        slot = self._directory.get(key)
+        if slot is None:
+            used = int(self.header[H_USED])
+            if used >= self.slots:
+                logger.warning(f"⚠️ Market bus full ({self.slots} slots), {security_id} not published",
+                               extra={"sample_key": "market_bus_full"})
+                return None
+            slot = self._directory[key] = used
+            self.slot_meta[slot, S_SECURITY] = key
+            self.header[H_USED] = used + 1
+            self.header[H_GENERATION] += 1
+        return slot
+
+    def publish(self, security_id, buf):
+        """Publish a computed signal_engine.BarBuffer (its last BARS bars) unless the bus already has newer bars."""
+        if not self.is_writer or buf.n == 0:
+            return False
+        with self._write_lock:
+            slot = self._slot_for(security_id)
+            if slot is None:
+                return False
+            meta = self.slot_meta[slot]
+            if meta[S_COUNT] and self.ts[slot, meta[S_COUNT] - 1] > buf.ts[buf.n - 1]:
+                return False  # e.g. the monitor re-evaluating an earlier bar
+
+            n = min(buf.n, self.bars)
+            start = buf.n - n
+            meta[S_SEQ] += 1                       # odd: write in progress
+            self.ts[slot, :n] = buf.ts[start:buf.n]
+            for column, field in enumerate(VALUE_FIELDS):
+                self.values[slot, column, :n] = getattr(buf, BUFFER_COLUMNS.get(field, field))[start:buf.n]
+            meta[S_COUNT] = n
+            meta[S_UPDATED] = int(time.time() * 1000)
+            meta[S_SEQ] += 1                       # even: consistent again
+            self.published += 1
+        return True
+
+    # --- Readers ---
+
+    def _find(self, security_id):
+        try:
+            key = int(security_id)
+        except (TypeError, ValueError):
+            return None
+        for _ in range(2):
+            generation = int(self.header[H_GENERATION])
+            if generation != self._generation:
+                used = int(self.header[H_USED])
+                self._directory = {int(sid): slot for slot, sid in enumerate(self.slot_meta[:used, S_SECURITY])}
+                self._generation = generation
+            slot = self._directory.get(key)
+            if slot is None or int(self.slot_meta[slot, S_SECURITY]) == key:
+                return slot
+            # The slot was handed to another security (writer restart): rebuild once
+            self._generation = -1
+        return None
+
+    def views(self, security_id):
+        """Zero-copy (token, {field: view}) for a security, or None. Validate with stable(security_id, token) after use."""
+        if self._shm is None:
+            return None
+        slot = self._find(security_id)
+        if slot is None:
+            return None
+        for _ in range(READ_RETRIES):
+            seq = int(self.slot_meta[slot, S_SEQ])
+            if seq % 2 == 0:
+                n = int(self.slot_meta[slot, S_COUNT])
+                fields = {"timestamp": self.ts[slot, :n]}
+                fields.update({field: self.values[slot, column, :n] for column, field in enumerate(VALUE_FIELDS)})
+                return (self._generation, seq), fields
+            self.read_retries += 1
+        return None
+
+    def stable(self, security_id, token):
+        """True if nothing was written to the security's slot (and no writer restarted) since views()."""
+        slot = self._find(security_id)
+        return slot is not None and (self._generation, int(self.slot_meta[slot, S_SEQ])) == token
+
+    def read(self, security_id, fields=None):
+        """A consistent copy of a security's columns as lists (market_state shape), or None."""
+        for _ in range(READ_RETRIES):
+            found = self.views(security_id)
+            if found is None:
+                return None
+            token, views = found
+            data = {f: views[f].tolist() for f in (fields or views)}
+            if self.stable(security_id, token):
+                return data
+            self.read_retries += 1
+        return None
+
+    def last_timestamp(self, security_id):
+        for _ in range(READ_RETRIES):
+            found = self.views(security_id)
+            if found is None:
+                return None
+            token, views = found
+            timestamps = views["timestamp"]
+            last = int(timestamps[-1]) if len(timestamps) else None
+            if self.stable(security_id, token):
+                return last
+            self.read_retries += 1
+        return None
+
+    def stats(self):
+        if self._shm is None:
+            return {"role": None}
+        return {
+            "role": self.role,
+            "securities": int(self.header[H_USED]),
+            "published": self.published,
+            "read_retries": self.read_retries,
+        }
+
+
+# Global instance; opened by main() when MARKET_BUS is set
+market_bus = MarketBus()
@@ -0,0 +1,128 @@
+# services/market_state.py
+
+import threading
+
+BAR_FIELDS = ("timestamp", "open", "high", "low", "close", "volume")
+
+# 5 trading days of 5-minute bars is ~375; keep a little headroom for SMA200
+MAX_BARS = 450
+
+
+class MarketState:
+    """
+    Process-wide, in-memory view of the market that survives between cycles:
+
+    - bars:     per security id, the broker arrays (epoch seconds + OHLCV)
+    - signals:  per security id, the last candle dict produced by fetch_candles
+    - trades:   per symbol, the open (in_progress) trades last seen by the monitor
+    - setups:   per symbol, the latest setup written or seen by this process
+
+    Everything here is plain lists/dicts so it can be snapshotted cheaply.
+    Scan and monitor tasks run on the cycle's thread pool, so every access
+    goes through the lock. Merged bar arrays are never mutated in place, so
+    callers may keep what get_bars() returned.
+    """
+
+    def __init__(self, max_bars=MAX_BARS):
+        self.max_bars = max_bars
+        self.bars = {}
+        self.signals = {}
+        self.trades = {}
+        self.setups = {}
+        self._lock = threading.Lock()
+
+    # --- Bars ---
+
+    def last_timestamp(self, security_id):
+        with self._lock:
+            bars = self.bars.get(str(security_id))
+        if not bars or not bars["timestamp"]:
+            return None
+        return bars["timestamp"][-1]
+
+    def merge_bars(self, security_id, data):
+        """Merge broker arrays into the cached history. Newer values win on equal timestamps."""
+        key = str(security_id)
+        with self._lock:
+            current = self.bars.get(key)
+            if not current or not current["timestamp"]:
+                merged = {f: list(data[f]) for f in BAR_FIELDS}
+            else:
+                first_new = data["timestamp"][0] if data["timestamp"] else None
+                if first_new is None:
+                    return current
+                # Drop cached bars that the new response covers (forming bar gets replaced)
+                cut = len(current["timestamp"])
+                while cut > 0 and current["timestamp"][cut - 1] >= first_new:
+                    cut -= 1
+                merged = {f: current[f][:cut] + list(data[f]) for f in BAR_FIELDS}
+
+            if len(merged["timestamp"]) > self.max_bars:
+                merged = {f: merged[f][-self.max_bars:] for f in BAR_FIELDS}
+            self.bars[key] = merged
+            return merged
+
+    def get_bars(self, security_id, until=None):
+        """Return cached arrays, optionally only bars with timestamp <= until (epoch seconds)."""
+        with self._lock:
+            bars = self.bars.get(str(security_id))
+        if not bars:
+            return None
+        if until is None:
+            return bars
+        end = len(bars["timestamp"])
+        while end > 0 and bars["timestamp"][end - 1] > until:
+            end -= 1
+        return {f: bars[f][:end] for f in BAR_FIELDS}
+
+    # --- Indicator state / trades ---
+
+    def set_signal(self, security_id, candle_data):
+        with self._lock:
+            self.signals[str(security_id)] = candle_data
+
+    def get_signal(self, security_id):
+        with self._lock:
+            return self.signals.get(str(security_id))
+
+    def signal_values(self):
+        with self._lock:
+            return list(self.signals.values())
+
+    def set_open_trades(self, trades):
+        trades = {t["symbol"]: t for t in trades}
+        with self._lock:
+            self.trades = trades
+
+    def set_setup(self, setup):
+        with self._lock:
+            previous = self.setups.get(setup["symbol"])
+            if previous and previous.get("date") == setup.get("date"):
+                setup = {**previous, **setup}
+            self.setups[setup["symbol"]] = setup
+
+    def setup_values(self):
+        with self._lock:
+            return list(self.setups.values())
+
+    # --- Snapshot support ---
+
+    def to_snapshot(self):
+        with self._lock:
+            return {
+                "bars": {k: {f: list(v[f]) for f in BAR_FIELDS} for k, v in self.bars.items()},
+                "signals": dict(self.signals),
+                "trades": dict(self.trades),
+                "setups": dict(self.setups),
+            }
+
+    def load_snapshot(self, snapshot):
+        with self._lock:
+            self.bars = snapshot.get("bars", {})
+            self.signals = snapshot.get("signals", {})
+            self.trades = snapshot.get("trades", {})
+            self.setups = snapshot.get("setups", {})
+
+
+# Global instance shared by the scanner and the monitor
+market_state = MarketState()
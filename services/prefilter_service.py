@@ -0,0 +1,129 @@
+# services/prefilter_service.py
+
+import math
+import os
+import threading
+import time
+
+from services.market_state import market_state
+from utils.logger import logger
+
+# Mirrors the entry conditions in DhanService.fetch_candles
+NEAR_SMA_BAND = 0.005   # |close - SMA20| <= 0.5% of close
+ATR_FLOOR = 0.5         # atr > 0.5
+
+# How far one bar can plausibly move price / the SMAs, in ATRs
+REACH_ATR = float(os.getenv("PREFILTER_REACH_ATR", "1.5"))
+# Skipped symbols are re-evaluated at this slower cadence (seconds)
+RECHECK_SECONDS = int(os.getenv("PREFILTER_RECHECK_SECONDS", "900"))
+
+
+class RegimeState:
+    """Cheap per-symbol regime snapshot taken from the last full evaluation."""
+
+    __slots__ = ("close", "sma20", "sma200", "atr", "score", "viable", "checked_at")
+
+    def __init__(self, close, sma20, sma200, atr, checked_at):
+        self.close = close
+        self.sma20 = sma20
+        self.sma200 = sma200
+        self.atr = atr
+        self.checked_at = checked_at
+        self.score, self.viable = self._assess()
+
+    def _assess(self):
+        """
+        Returns (score, viable). Lower score = closer to an entry.
+
+        Not viable when, even after a REACH_ATR move on the next bar:
+        - ATR is far below the floor, or
+        - price can't get within the near-SMA20 band, or
+        - price sits on the wrong side of SMA20 for the current SMA20/SMA200
+          regime and the regime is too wide to flip in one bar.
+        """
+        if self.atr < ATR_FLOOR / 2:
+            return math.inf, False
+
+        reach = REACH_ATR * self.atr
+        band = NEAR_SMA_BAND * self.close
+        distance = abs(self.close - self.sma20)
+        excess = max(0.0, distance - band - reach)
+        if excess > 0:
+            return excess / self.atr, False
+
+        bull_regime = self.sma20 > self.sma200
+        regime_gap = abs(self.sma20 - self.sma200)
+        wrong_side = (self.close < self.sma20) if bull_regime else (self.close > self.sma20)
+        if wrong_side and distance > reach and regime_gap > reach:
+            return distance / self.atr, False
+
+        return distance / self.atr, True
+
+
+class RegimePrefilter:
+    """
+    Decides which symbols deserve a full download + evaluation this cycle.
+
+    Live candidates are ranked by how close they are to the entry conditions;
+    symbols that cannot satisfy them on the next bar are skipped and only
+    re-checked every RECHECK_SECONDS. Symbols with no state yet are always
+    evaluated. Scan tasks update it from the cycle's thread pool.
+    """
+
+    def __init__(self, recheck_seconds=RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self.states = {}
+        self.skipped_total = 0
+        self._lock = threading.Lock()
+
+    def state(self, security_id):
+        with self._lock:
+            return self.states.get(str(security_id))
+
+    def update(self, security_id, candle):
+        """Record the outcome of a full evaluation (the dict returned by fetch_candles)."""
+        key = str(security_id)
+        try:
+            values = [float(candle[f]) for f in ("Close", "SMA20", "SMA200", "ATR")]
+        except (KeyError, TypeError, ValueError):
+            values = None
+        if values is None or any(math.isnan(v) for v in values):
+            # No usable indicators (e.g. not enough history yet); keep evaluating
+            with self._lock:
+                self.states.pop(key, None)
+            return
+        state = RegimeState(*values, checked_at=time.time())
+        with self._lock:
+            self.states[key] = state
+
+    def plan(self, stocks, now=None):
+        """Split stocks into (candidates ranked best-first, skipped)."""
+        now = now or time.time()
+        ranked, skipped = [], []
+
+        for stock in stocks:
+            key = str(stock.get("SECURITY_ID"))
+            state = self.state(key)
+            if state is None:
+                # Warm restart: seed from the restored snapshot
+                signal = market_state.get_signal(key)
+                if signal is not None:
+                    self.update(key, signal)
+                    state = self.state(key)
+
+            if state is None:
+                ranked.append((-1.0, stock))
+            elif state.viable or now - state.checked_at >= self.recheck_seconds:
+                ranked.append((state.score, stock))
+            else:
+                skipped.append(stock)
+
+        ranked.sort(key=lambda item: item[0])
+        with self._lock:
+            self.skipped_total += len(skipped)
+        logger.info(f"🧮 Prefilter: {len(ranked)} candidates, {len(skipped)} skipped until re-check")
+        return [stock for _, stock in ranked], skipped
+
+
+# Global instance kept across cycles
+regime_prefilter = RegimePrefilter()
@@ -0,0 +1,236 @@
+# services/quota_manager.py
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from utils.logger import logger
+
+# Permit priorities (lower is more urgent)
+PRIORITY_ORDER = 0
+PRIORITY_MONITOR = 1
+PRIORITY_SCAN = 2
+
+PRIORITY_NAMES = {PRIORITY_ORDER: "order", PRIORITY_MONITOR: "monitor", PRIORITY_SCAN: "scan"}
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+# Broker limits per endpoint class: (per second, per day). Dhan v2 publishes
+# 25/s + 7000/day for orders, 5/s + 100000/day for data and 1/s for quotes.
+DEFAULT_LIMITS = {
+    "orders": (25, 7000),
+    "data": (5, 100000),
+    "quotes": (1, None),
+}
+
+# Permits per second / per day held back for callers more urgent than the given priority
+DEFAULT_RESERVES = {
+    "data": {"second": {PRIORITY_MONITOR: 1}, "day": {PRIORITY_MONITOR: 2000}},
+}
+
+# How long each priority is willing to wait for a permit by default
+DEFAULT_TIMEOUTS = {PRIORITY_ORDER: 5.0, PRIORITY_MONITOR: 3.0, PRIORITY_SCAN: 2.0}
+
+_current_priority = ContextVar("quota_priority", default=PRIORITY_SCAN)
+
+
+class QuotaExhausted(Exception):
+    def __init__(self, endpoint_class, priority, reason):
+        super().__init__(f"{endpoint_class} quota {reason} for {PRIORITY_NAMES.get(priority, priority)}")
+        self.endpoint_class = endpoint_class
+        self.priority = priority
+        self.reason = reason
+
+
+def _limit(name, which, default):
+    value = os.getenv(f"QUOTA_{name.upper()}_PER_{which.upper()}")
+    if value is None:
+        return default
+    return float(value) if value.strip() else None
+
+
+class QuotaClass:
+    """Token bucket (per-second limit) plus an IST-day counter (per-day limit) for one endpoint class."""
+
+    def __init__(self, name, per_second, per_day=None, reserves=None):
+        self.name = name
+        self.per_second = float(per_second)
+        self.per_day = per_day
+        self.reserves = reserves or {}
+        self.tokens = self.per_second
+        self.refilled_at = time.monotonic()
+        self.day = None
+        self.used_today = 0
+        self.recent = deque()          # monotonic times of the last minute's permits
+        self.waiting = {}              # priority -> callers currently waiting
+        self.granted = {}
+        self.throttled = {}
+        self.wait_seconds = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.per_second, self.tokens + (now - self.refilled_at) * self.per_second)
+        self.refilled_at = now
+
+    def _roll_day(self):
+        today = datetime.now(IST).date()
+        if today != self.day:
+            self.day = today
+            self.used_today = 0
+
+    def _held_back(self, scope, priority):
+        """Reserve kept for callers more urgent than `priority`."""
+        return sum(amount for p, amount in self.reserves.get(scope, {}).items() if p < priority)
+
+    def day_allows(self, priority):
+        if self.per_day is None:
+            return True
+        return self.used_today + 1 <= self.per_day - self._held_back("day", priority)
+
+    def try_take(self, priority, now):
+        """Take a permit if the bucket (minus reserves) allows and nobody more urgent is queued."""
+        if any(count for p, count in self.waiting.items() if p < priority):
+            return False
+        self._refill(now)
+        if self.tokens - self._held_back("second", priority) < 1:
+            return False
+        self.tokens -= 1
+        self.used_today += 1
+        self.recent.append(now)
+        self.granted[priority] = self.granted.get(priority, 0) + 1
+        return True
+
+    def seconds_until_token(self, priority):
+        needed = 1 + self._held_back("second", priority) - self.tokens
+        return max(needed / self.per_second, 0.001)
+
+    def stats(self, now):
+        while self.recent and now - self.recent[0] > 60:
+            self.recent.popleft()
+        return {
+            "per_second": self.per_second,
+            "tokens": round(self.tokens, 2),
+            "last_minute": len(self.recent),
+            "utilization": round(len(self.recent) / (self.per_second * 60), 3),
+            "used_today": self.used_today,
+            "per_day": self.per_day,
+            "day_utilization": round(self.used_today / self.per_day, 3) if self.per_day else None,
+            "granted": {PRIORITY_NAMES.get(p, p): n for p, n in self.granted.items()},
+            "throttled": {PRIORITY_NAMES.get(p, p): n for p, n in self.throttled.items()},
+            "wait_seconds": round(self.wait_seconds, 2),
+        }
+
+
+class QuotaManager:
+    """
+    Process-wide broker quota, shared by the scan, the trade monitor and
+    order placement.
+
+    - Each endpoint class has a per-second token bucket and an optional
+      per-day budget.
+    - Permits go out by priority: order > monitor > scan. A caller waits while
+      anyone more urgent is queued, and lower priorities can't dip into the
+      reserves held back for higher ones.
+    - Everything else is free for the scan to use.
+
+    The caller's priority comes from `use_priority(...)` (a context variable),
+    so shared code paths such as DhanService.fetch_candles need no extra arguments.
+    """
+
+    def __init__(self, limits=None, reserves=None):
+        limits = limits or DEFAULT_LIMITS
+        reserves = DEFAULT_RESERVES if reserves is None else reserves
+        self.classes = {
+            name: QuotaClass(
+                name,
+                _limit(name, "second", per_second),
+                _limit(name, "day", per_day),
+                reserves.get(name),
+            )
+            for name, (per_second, per_day) in limits.items()
+        }
+        self._cond = threading.Condition()
+
+    def configure(self, name, per_second=None, per_day=None):
+        with self._cond:
+            quota = self.classes[name]
+            if per_second is not None:
+                quota.per_second = float(per_second)
+                quota.tokens = min(quota.tokens, quota.per_second)
+            if per_day is not None:
+                quota.per_day = per_day
+
+    @staticmethod
+    @contextmanager
+    def use_priority(priority):
+        token = _current_priority.set(priority)
+        try:
+            yield
+        finally:
+            _current_priority.reset(token)
+
+    def acquire(self, name, priority=None, timeout=None):
+        """Block until a permit for endpoint class `name` is granted, or raise QuotaExhausted."""
+        priority = _current_priority.get() if priority is None else priority
+        timeout = DEFAULT_TIMEOUTS.get(priority, 2.0) if timeout is None else timeout
+        quota = self.classes[name]
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+
+        with self._cond:
+            quota._roll_day()
+            if not quota.day_allows(priority):
+                quota.throttled[priority] = quota.throttled.get(priority, 0) + 1
+                logger.warning(f"🎫 Daily {name} budget exhausted for {PRIORITY_NAMES.get(priority, priority)} "
+                               f"({quota.used_today}/{quota.per_day})", extra={"sample_key": f"quota_day_{name}"})
+                raise QuotaExhausted(name, priority, "daily budget used up")
+
+            if quota.try_take(priority, started):
+                return
+
+            quota.waiting[priority] = quota.waiting.get(priority, 0) + 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if deadline is not None and now >= deadline:
+                        quota.throttled[priority] = quota.throttled.get(priority, 0) + 1
+                        raise QuotaExhausted(name, priority, f"not granted within {timeout:.1f}s")
+                    wait = quota.seconds_until_token(priority)
+                    if deadline is not None:
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+                    # Don't count ourselves as someone more urgent queued ahead
+                    quota.waiting[priority] -= 1
+                    taken = quota.try_take(priority, time.monotonic())
+                    quota.waiting[priority] += 1
+                    if taken:
+                        return
+            finally:
+                quota.waiting[priority] -= 1
+                quota.wait_seconds += time.monotonic() - started
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            return {name: quota.stats(now) for name, quota in self.classes.items()}
+
+
+def with_priority(priority):
+    """Decorator: run the function with `priority` permits."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with QuotaManager.use_priority(priority):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Global instance: one quota per process
+quota_manager = QuotaManager()
+use_priority = QuotaManager.use_priority
@@ -0,0 +1,256 @@
+# services/resilience.py
+
+import os
+import random
+import re
+import threading
+import time
+
+from services.quota_manager import QuotaExhausted
+from utils.logger import logger
+
+BREAKER_FAILURES = int(os.getenv("BROKER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BROKER_BREAKER_RESET_SECONDS", "30"))
+BACKOFF_BASE_SECONDS = float(os.getenv("BROKER_BACKOFF_BASE_SECONDS", "5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("BROKER_BACKOFF_MAX_SECONDS", "300"))
+QUARANTINE_AFTER = int(os.getenv("BROKER_QUARANTINE_AFTER", "3"))
+QUARANTINE_SECONDS = float(os.getenv("BROKER_QUARANTINE_SECONDS", "900"))
+
+# Error kinds
+AUTH = "auth"                # bad/expired token, no data subscription: nothing works until fixed
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"      # network, timeouts, broker 5xx
+NO_DATA = "no_data"          # the instrument returned nothing
+BAD_REQUEST = "bad_request"  # our input was rejected; retrying the same call won't help
+# Calls that were not attempted
+THROTTLED = "throttled"      # no quota permit (services.quota_manager)
+CIRCUIT_OPEN = "circuit_open"
+DEFERRED = "deferred"
+QUARANTINED = "quarantined"
+
+# Dhan error codes (remarks.error_code)
+DHAN_CODES = {
+    "DH-901": AUTH, "DH-902": AUTH, "DH-903": AUTH,
+    "DH-904": RATE_LIMIT,
+    "DH-905": BAD_REQUEST, "DH-906": BAD_REQUEST,
+    "DH-907": NO_DATA,
+    "DH-908": TRANSIENT, "DH-909": TRANSIENT, "DH-910": TRANSIENT,
+}
+_DHAN_CODE = re.compile(r"DH-9\d\d")
+
+# Kinds that say something about the broker (vs. the instrument or the request)
+BREAKER_KINDS = {AUTH, RATE_LIMIT, TRANSIENT}
+
+
+class BrokerError(Exception):
+    def __init__(self, kind, message=""):
+        super().__init__(f"{kind}: {message}" if message else kind)
+        self.kind = kind
+
+
+def classify_response(resp):
+    """Kind of a failed dhanhq response dict, or None if it succeeded with data."""
+    if resp.get("status") == "success":
+        data = resp.get("data")
+        if not data or (isinstance(data, dict) and "timestamp" in data and not data["timestamp"]):
+            return NO_DATA
+        return None
+
+    text = f"{resp.get('remarks')} {resp.get('data')}"
+    match = _DHAN_CODE.search(text)
+    if match:
+        return DHAN_CODES.get(match.group(0), TRANSIENT)
+    lowered = text.lower()
+    if "too many" in lowered or "rate limit" in lowered:
+        return RATE_LIMIT
+    if "no data" in lowered:
+        return NO_DATA
+    if "token" in lowered or "unauthor" in lowered:
+        return AUTH
+    return TRANSIENT
+
+
+def classify_exception(exc):
+    if isinstance(exc, BrokerError):
+        return exc.kind
+    if isinstance(exc, QuotaExhausted):
+        return THROTTLED
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        if status in (401, 403):
+            return AUTH
+        if status == 429:
+            return RATE_LIMIT
+        if 400 <= status < 500:
+            return BAD_REQUEST
+    # Connection errors, timeouts, 5xx, anything unexpected
+    return TRANSIENT
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive broker-side errors (AUTH opens it
+    at once); open -> half-open after `reset_seconds`, where one probe call
+    decides between closed and open again.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def allow(self, now):
+        if self.state == "closed":
+            return True
+        if self.state == "open" and now - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def release_probe(self):
+        """The probe was never sent (e.g. no quota permit): let the next call probe instead."""
+        self.probing = False
+
+    def success(self):
+        if self.state != "closed":
+            logger.info(f"🟢 Broker circuit '{self.name}' closed")
+        self.state = "closed"
+        self.consecutive = 0
+        self.probing = False
+
+    def failure(self, kind, now):
+        self.consecutive += 1
+        if self.state == "half_open" or kind == AUTH or self.consecutive >= self.failures:
+            if self.state != "open":
+                self.trips += 1
+                logger.warning(f"🔴 Broker circuit '{self.name}' open for {self.reset_seconds:.0f}s after {kind} ({self.consecutive} in a row)")
+            self.state = "open"
+            self.opened_at = now
+            self.probing = False
+
+
+class KeyState:
+    __slots__ = ("failures", "retry_at", "no_data", "quarantined_until")
+
+    def __init__(self):
+        self.failures = 0
+        self.retry_at = 0.0
+        self.no_data = 0
+        self.quarantined_until = 0.0
+
+
+class BrokerGuard:
+    """
+    Wraps every broker call:
+
+    - errors are classified (auth / rate limit / transient / no data / bad request)
+    - a failing key (usually a security id) is not retried before its jittered
+      exponential backoff expires; the call is skipped instead of sleeping, so
+      the rest of the cycle carries on and the key is retried on a later cycle
+    - one circuit breaker per endpoint fails fast while the broker is degraded
+    - instruments that keep returning no data are quarantined for a while
+
+    `call()` returns the response or raises BrokerError; skipped calls raise
+    with kind CIRCUIT_OPEN / DEFERRED / QUARANTINED / THROTTLED and cost nothing.
+    """
+
+    def __init__(self):
+        self.breakers = {}
+        self.keys = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def _breaker(self, endpoint):
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+    def _count(self, kind):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def _backoff(self, attempt):
+        ceiling = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def call(self, endpoint, fn, key=None, check=classify_response):
+        """Run `fn()` under the endpoint's breaker and the key's backoff/quarantine."""
+        now = time.time()
+        with self._lock:
+            state = self.keys.get((endpoint, key)) if key is not None else None
+            if state is not None:
+                if state.quarantined_until > now:
+                    self._count(QUARANTINED)
+                    raise BrokerError(QUARANTINED, f"{key} until {time.strftime('%H:%M:%S', time.localtime(state.quarantined_until))}")
+                if state.retry_at > now:
+                    self._count(DEFERRED)
+                    raise BrokerError(DEFERRED, f"{key} retry in {state.retry_at - now:.0f}s")
+            breaker = self._breaker(endpoint)
+            if not breaker.allow(now):
+                self._count(CIRCUIT_OPEN)
+                raise BrokerError(CIRCUIT_OPEN, endpoint)
+
+        try:
+            resp = fn()
+            kind = check(resp) if check else None
+            error = BrokerError(kind, str(resp.get("remarks") or resp.get("data"))[:200]) if kind else None
+        except Exception as e:
+            kind = classify_exception(e)
+            error = e if isinstance(e, BrokerError) else BrokerError(kind, str(e)[:200])
+
+        if kind == THROTTLED:
+            # Our own quota said no; that says nothing about the broker or the key
+            with self._lock:
+                self._count(THROTTLED)
+                self._breaker(endpoint).release_probe()
+            raise error
+
+        with self._lock:
+            now = time.time()
+            breaker = self._breaker(endpoint)
+            if kind is None or kind not in BREAKER_KINDS:
+                breaker.success()
+            else:
+                breaker.failure(kind, now)
+
+            if kind is None:
+                self._count("ok")
+                if key is not None:
+                    self.keys.pop((endpoint, key), None)
+                return resp
+
+            self._count(kind)
+            if key is not None:
+                state = self.keys.setdefault((endpoint, key), KeyState())
+                if kind == NO_DATA:
+                    state.no_data += 1
+                    if state.no_data >= QUARANTINE_AFTER:
+                        state.quarantined_until = now + QUARANTINE_SECONDS
+                        logger.warning(f"🚧 {key} quarantined for {QUARANTINE_SECONDS / 60:.0f} min after {state.no_data} empty responses")
+                else:
+                    state.failures += 1
+                    state.retry_at = now + self._backoff(state.failures)
+
+        logger.warning(f"⚠️ Broker {endpoint} failed for {key}: {error}", extra={"sample_key": f"broker_{kind}", "sample_warnings": True})
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counts,
+                "open_circuits": [name for name, b in self.breakers.items() if b.state != "closed"],
+                "backing_off": sum(1 for s in self.keys.values() if s.retry_at > time.time()),
+                "quarantined": sum(1 for s in self.keys.values() if s.quarantined_until > time.time()),
+            }
+
+
+# Shared by every DhanService instance in the process
+broker_guard = BrokerGuard()
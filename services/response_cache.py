@@ -0,0 +1,107 @@
+# services/response_cache.py
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from utils.time_utils import BAR_SECONDS, bar_close
+
+# Results for bars that have already closed never change; keep them for the session
+CLOSED_BAR_TTL = 6 * 3600
+# A forming bar changes with every trade: share it within a cycle (~60s), refetch in the next
+FORMING_BAR_TTL = float(os.getenv("FORMING_BAR_TTL_SECONDS", "30"))
+MAX_ENTRIES = 5000
+
+
+def expiry_for(close_ts, now=None):
+    """
+    A closed bar's data is final; a still-forming bar's is a snapshot, kept
+    for FORMING_BAR_TTL seconds at most (and never past the bar's close).
+    """
+    now = time.time() if now is None else now
+    return now + CLOSED_BAR_TTL if close_ts <= now else min(close_ts, now + FORMING_BAR_TTL)
+
+
+class ResponseCache:
+    """
+    Small TTL cache with request coalescing.
+
+    `get_or_load(key, loader, expires_at)` returns a cached value if fresh;
+    otherwise the first caller runs `loader()` while concurrent callers for
+    the same key wait on its result instead of issuing their own request.
+    `None` results are not cached.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = {}   # key -> (expires_at, value)
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_load(self, key, loader, expires_at):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.hits += 1
+                return entry[1]
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if value is not None:
+                if len(self._entries) >= self.max_entries:
+                    self._evict()
+                self._entries[key] = (expires_at, value)
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        # Still full: drop the entries closest to expiry
+        if len(self._entries) >= self.max_entries:
+            for key, _ in sorted(self._entries.items(), key=lambda kv: kv[1][0])[:self.max_entries // 10]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": len(self._entries),
+            "hit_rate": round((self.hits + self.coalesced) / total, 3) if total else 0.0,
+        }
+
+
+# Shared by every DhanService instance in the process
+response_cache = ResponseCache()
+signal_cache = ResponseCache()
@@ -0,0 +1,151 @@
+# services/scan_checkpoint.py
+
+import os
+import threading
+import time
+
+from config.db_config import db
+from services.candle_service import candle_service
+from utils.logger import logger
+from utils.time_utils import format_ist
+
+CHECKPOINT_BATCH = int(os.getenv("SCAN_CHECKPOINT_BATCH", "50"))
+CHECKPOINT_SECONDS = float(os.getenv("SCAN_CHECKPOINT_SECONDS", "10"))
+CHECKPOINT_ID = "scan-checkpoint"
+
+scans = db["scandetails"]
+
+
+class ScanCheckpoint:
+    """
+    Progress of the scan for one bar, so a restarted worker resumes the bar
+    it was on instead of starting the universe from the top.
+
+    Stored as one `scandetails` document: {bar, evaluated, persisted}.
+
+    - evaluated: the symbol's bars were fetched and the strategy evaluated
+      (one step in fetch_candles)
+    - persisted: its candle/signal and any setup are in Mongo
+
+    A symbol only counts as persisted after the candle buffer holding its bar
+    has been flushed, and each flush writes candles first, then the
+    checkpoint. A failed candle write keeps the candles buffered (see
+    CandleService.flush) and the marks pending, so both go out with the next
+    flush; a crash only redoes symbols whose results were lost.
+    Marks are batched (every CHECKPOINT_BATCH symbols or CHECKPOINT_SECONDS),
+    so each flush costs one insert_many per collection plus one update.
+    """
+
+    def __init__(self, collection=None):
+        self._collection = collection
+        self.bar = None
+        self.evaluated = set()
+        self.persisted = set()
+        self._pending_evaluated = []
+        self._pending_persisted = []
+        self.flushed_at = time.time()
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @property
+    def collection(self):
+        return self._collection if self._collection is not None else scans
+
+    def begin(self, bar):
+        """Start or resume the scan of `bar` (epoch of the bar close). Returns the security ids already done."""
+        with self._lock:
+            if bar == self.bar:
+                return frozenset(self.persisted)
+
+        # Whatever is still buffered belongs to the previous bar
+        self.flush()
+        doc = self.collection.find_one({"_id": CHECKPOINT_ID}) or {}
+
+        with self._lock:
+            self.bar = bar
+            self._pending_evaluated, self._pending_persisted = [], []
+            if doc.get("bar") == bar:
+                self.persisted = set(doc.get("persisted", []))
+                self.evaluated = set(doc.get("evaluated", [])) | self.persisted
+                logger.info(f"♻️ Resuming scan of the {format_ist(bar)[11:]} bar: "
+                            f"{len(self.persisted)} symbols already done")
+            else:
+                self.persisted = set()
+                self.evaluated = set()
+            return frozenset(self.persisted)
+
+    def mark_evaluated(self, security_id):
+        with self._lock:
+            self.evaluated.add(str(security_id))
+            self._pending_evaluated.append(str(security_id))
+
+    def mark_persisted(self, security_id):
+        with self._lock:
+            self.persisted.add(str(security_id))
+            self._pending_persisted.append(str(security_id))
+            due = (len(self._pending_persisted) >= CHECKPOINT_BATCH
+                   or time.time() - self.flushed_at >= CHECKPOINT_SECONDS)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered candles/signals, then record the symbols they cover."""
+        with self._flush_lock:
+            with self._lock:
+                bar = self.bar
+                evaluated, self._pending_evaluated = self._pending_evaluated, []
+                persisted, self._pending_persisted = self._pending_persisted, []
+                self.flushed_at = time.time()
+
+            # Candles first: a checkpoint must never claim a bar that isn't stored
+            try:
+                candle_service.flush()
+            except Exception as e:
+                logger.exception(f"❌ Failed to store candles/signals, retrying with the next flush: {e}")
+                self._requeue(bar, evaluated, persisted)
+                return
+
+            if bar is None or not (evaluated or persisted):
+                return
+
+            try:
+                updated = self.collection.update_one(
+                    {"_id": CHECKPOINT_ID, "bar": bar},
+                    {
+                        "$addToSet": {"evaluated": {"$each": evaluated}, "persisted": {"$each": persisted}},
+                        "$set": {"updated_at": time.time()},
+                    },
+                )
+                if updated.matched_count == 0:
+                    # First write for this bar replaces the previous bar's progress
+                    self.collection.replace_one(
+                        {"_id": CHECKPOINT_ID},
+                        {"bar": bar, "evaluated": evaluated, "persisted": persisted, "updated_at": time.time()},
+                        upsert=True,
+                    )
+                self.writes += 1
+            except Exception as e:
+                logger.exception(f"❌ Failed to write scan checkpoint: {e}")
+                # The data is stored; record it with the next flush
+                self._requeue(bar, evaluated, persisted)
+
+    def _requeue(self, bar, evaluated, persisted):
+        with self._lock:
+            if bar == self.bar:
+                self._pending_evaluated = evaluated + self._pending_evaluated
+                self._pending_persisted = persisted + self._pending_persisted
+
+    def stats(self):
+        with self._lock:
+            return {
+                "bar": self.bar,
+                "evaluated": len(self.evaluated),
+                "persisted": len(self.persisted),
+                "pending": len(self._pending_persisted),
+                "writes": self.writes,
+            }
+
+
+# Global instance
+scan_checkpoint = ScanCheckpoint()
@@ -1,8 +1,21 @@
+import os
+import threading
+
+from pymongo import ASCENDING
+
 from config.db_config import db
 from utils.logger import logger
-import pytz
+from services.candle_service import candle_ref
+from services.change_tracker import ChangeTracker
+from services.market_state import market_state
+from utils.time_utils import ist_day, parse_ist, to_datetime, to_epoch
+
 
+SETUP_BATCH_SIZE = int(os.getenv("SETUP_BATCH_SIZE", "500"))
 
+# Default read shape: no per-bar history. Legacy setups keep their first
+# embedded candle, the only one readers fall back to (entry price).
+SUMMARY_PROJECTION = {"candleRefs": 0, "candleData": {"$slice": 1}}
 
 collection = db["setups"]
 
@@ -13,29 +26,78 @@ class SetupService:
           logger.info("✅ setup initialized")
 
 
-def fetch_setups_from_mongo(query):
+def ensure_indexes():
+    """(date, tradeStatus, symbol) serves today's ready setups and covers the processed-symbol query."""
+    collection.create_index([("date", ASCENDING), ("tradeStatus", ASCENDING), ("symbol", ASCENDING)])
+
+
+def iter_setups(query, projection=SUMMARY_PROJECTION, batch_size=SETUP_BATCH_SIZE):
+    """Stream setups matching `query`; the cursor fetches `batch_size` documents per round trip."""
+    return collection.find(query, projection, batch_size=batch_size)
+
+
+def fetch_setups_from_mongo(query, projection=SUMMARY_PROJECTION, batch_size=SETUP_BATCH_SIZE):
     """
     Fetch setups from MongoDB based on the provided query.
-    Returns a list of setups.
+    Returns a list of setups (pass projection=None for whole documents).
     """
     try:
-        setups = list(collection.find(query))
-        logger.info(f"🟢 Fetched {len(setups)} setups from MongoDB")
+        setups = list(iter_setups(query, projection, batch_size))
+        logger.info(f"🟢 Fetched {len(setups)} setups from MongoDB", extra={"sample_key": "fetched_setups"})
         return setups
 
     except Exception as e:
-        print(f"❌ Error fetching setups from MongoDB: {e}")
         logger.exception(f"❌ Error fetching setups from MongoDB: {e}")
         return []
 
 
+class ProcessedSymbols:
+    """
+    Symbols that already have a setup past "not_ready" for the IST day.
+    Loaded once per day with an index-covered query (symbols only), then
+    kept current in memory as setups are written or streamed in.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.symbols = set()
+        self._lock = threading.Lock()
+
+    def for_day(self, day):
+        with self._lock:
+            if day != self.day:
+                cursor = collection.find(
+                    {"date": day, "tradeStatus": {"$ne": "not_ready"}},
+                    {"symbol": 1, "_id": 0},
+                    batch_size=SETUP_BATCH_SIZE,
+                )
+                self.symbols = {doc["symbol"] for doc in cursor}
+                self.day = day
+                logger.info(f"✅ Loaded {len(self.symbols)} processed symbols for {day}")
+            return frozenset(self.symbols)
+
+    def add(self, day, symbol):
+        with self._lock:
+            if day == self.day:
+                self.symbols.add(symbol)
+
+
+# Global instances
+processed_symbols = ProcessedSymbols()
+setup_changes = ChangeTracker("setups")  # last written state per (symbol, date, signal)
+_changes_day = None
+
+# What decides whether a setup needs writing; Datetime and the candle ref move every bar
+SETUP_STATE_FIELDS = ("signal", "stoploss", "target", "tradeStatus")
+LEVEL_FIELDS = ("stoploss", "target")
+
+
 def save_setups_to_mongo(candle_data):
     """
-    - One document per stock per day
-    - Candles stored inside `candles` array
-    - First candle's target/stoploss/stoplosshit saved once (if not already present)
-    - Last candle's target/targetachieved/stoplosshit updated each time
-    - Prevent duplicate timestamps
+    - One document per stock, day and signal
+    - Candle + signal stored in the `candles`/`signals` time-series collections,
+      the setup only keeps references in `candleRefs`
+    - First candle's close saved once as `entryPrice`
     """
     if not candle_data:
         return
@@ -43,14 +105,12 @@ def save_setups_to_mongo(candle_data):
         #logger.info(f"❌ No setups generated for {candle_data['symbol']}")
         return
     
-    logger.info(f"setups generated for {candle_data['symbol']} {candle_data['Datetime']}")
+    logger.info(f"setups generated for {candle_data['symbol']} {candle_data['Datetime']}", extra={"sample_key": "setup_generated", "symbol": candle_data["symbol"]})
     
-    # Convert candle datetime to IST
-    ist = pytz.timezone("Asia/Kolkata")
-    ist_dt = candle_data["Datetime"].astimezone(ist)
-    candle_data["Datetime"] = ist_dt
-    # Extract only the date (YYYY-MM-DD) for uniqueness
-    candle_date = ist_dt.date()
+    # Candle time as an IST datetime for the document; the day comes from the epoch
+    ts = to_epoch(candle_data["Datetime"])
+    candle_data["Datetime"] = to_datetime(ts)
+    candle_date = ist_day(ts)
     
         # Outer + candle info
     outer_data = {
@@ -60,30 +120,60 @@ def save_setups_to_mongo(candle_data):
         "stoploss": candle_data["stoploss"],
         "target": candle_data["target"],
         "tradeStatus": candle_data["tradeStatus"],
-        "date": str(candle_date),  # use only date for uniqueness
+        "date": candle_date,  # use only date for uniqueness
         "Datetime": candle_data["Datetime"]  # main timestamp
     }
 
-    # Update or append candle_data in array, unique by symbol + Datetime + signal
+    # The candle itself is stored by the scan once it closes (candle_service.record); store only its reference
+    ref = candle_ref(candle_data["dsecurityid"], candle_data["Datetime"])
+
+    # Tracked state only lives for the current IST day
+    global _changes_day
+    if outer_data["date"] != _changes_day:
+        setup_changes.retain(lambda key: key[1] == outer_data["date"])
+        _changes_day = outer_data["date"]
+
+    # Setup state unchanged since its last write: nothing to write
+    key = (outer_data["symbol"], outer_data["date"], outer_data["signal"])
+    state = {f: outer_data[f] for f in SETUP_STATE_FIELDS}
+    changed = setup_changes.changes(key, state)
+    if not changed:
+        return
+
+    # One setup per symbol + date + signal: the first write inserts it, later ones
+    # only move the levels (and the bar they came from). tradeStatus is never
+    # $set here, so a setup already claimed as "traded" stays claimed.
+    levels = {f: outer_data[f] for f in LEVEL_FIELDS if f in changed}
+    if levels:
+        levels["Datetime"] = outer_data["Datetime"]
+    update = {
+        "$setOnInsert": {
+            **{k: v for k, v in outer_data.items() if k not in levels},
+            "entryPrice": float(candle_data["Close"]),
+        },
+        "$addToSet": {"candleRefs": ref},   # reference, not the candle itself
+    }
+    if levels:
+        update["$set"] = levels
     collection.update_one(
         {
             "symbol": outer_data["symbol"],
-            "Datetime": outer_data["date"],
+            "date": outer_data["date"],
             "signal": outer_data["signal"]   # ensure uniqueness per signal
         },
-        {
-            "$set": outer_data,                # update main fields
-            "$push": {"candleData": candle_data}  # append new candle
-        },
+        update,
         upsert=True  # create if not exists
     )
+    setup_changes.persisted(key, changed)
+    market_state.set_setup({**outer_data, "entryPrice": float(candle_data["Close"])})
+    processed_symbols.add(outer_data["date"], outer_data["symbol"])
 
     #print("✅ Candle added/updated uniquely based on symbol + date + signal")
 
 def save_setups_to_mongo2(setups):
     """
-    - One document per stock per day
-    - Candles stored inside `candles` array
+    - One document per stock, day and signal
+    - Candles stored in the `signals` time-series collection, referenced from `candleRefs`
     - First candle's target/stoploss/stoplosshit saved once (if not already present)
     - Last candle's target/targetachieved/stoplosshit updated each time
     - Prevent duplicate timestamps
@@ -99,10 +189,21 @@ def save_setups_to_mongo2(setups):
     first_candle = setups[0]
     last_candle = setups[-1]
 
+    # Time-series collections have no unique index, so skip bars already referenced
+    existing = collection.find_one({"stock": stock, "status": status, "date": date_str}, {"candleRefs.ts": 1}) or {}
+    # Mongo hands datetimes back as naive UTC; compare as epoch seconds
+    existing_ts = {to_epoch(ref["ts"]) for ref in existing.get("candleRefs", [])}
+
+    candles = []
+    refs = []
     for setup in setups:
-        timestamp = setup["timestamp"]
-        candle = {
-            "timestamp": timestamp,
+        epoch = parse_ist(setup["timestamp"])
+        if epoch in existing_ts:
+            continue
+        ts = to_datetime(epoch)
+        candles.append({
+            "ts": ts,
+            "meta": {"securityId": str(dSecurityId), "symbol": stock},
             "price": setup["price"],
             "high": setup["high"],
             "low": setup["low"],
@@ -116,17 +217,21 @@ def save_setups_to_mongo2(setups):
             "isstar": setup["isstar"],
             "targetachieved": setup["targetachieved"],
             "stoplosshit": setup["stoplosshit"],
-        }
+        })
+        refs.append(candle_ref(dSecurityId, ts))
+
+    if candles:
+        db["signals"].insert_many(candles, ordered=False)
 
-        # Push only if timestamp not present
-        collection.update_one(
-            {"stock": stock, "status":status, "date": date_str, "candles.timestamp": {"$ne": timestamp}},
-            {
-                "$push": {"candles": candle},
-                "$setOnInsert": {"stock": stock, "dSecurityId":dSecurityId,  "date": date_str, "price":price,}
-            },
-            upsert=True
-        )
+    # One upsert for all references; $addToSet keeps timestamps unique
+    collection.update_one(
+        {"stock": stock, "status":status, "date": date_str},
+        {
+            "$addToSet": {"candleRefs": {"$each": refs}},
+            "$setOnInsert": {"stock": stock, "dSecurityId":dSecurityId,  "date": date_str, "price":price,}
+        },
+        upsert=True
+    )
 
     # Update first_* fields only if not already present
     collection.update_one(
@@ -0,0 +1,310 @@
+# services/signal_engine.py
+
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.time_utils import to_datetime
+
+# Strategy parameters (the values DhanService has always used)
+DEFAULT_PARAMS = {
+    "sma_fast": 20,
+    "sma_slow": 200,
+    "atr_period": 14,
+    "near_band": 0.005,     # close within 0.5% of SMA20
+    "atr_floor": 0.5,       # atr > 0.5
+    "target_atr": 2.0,      # target = close ± 2 * atr
+    "slope_bars": 3,        # SMA20 rising/falling over the last 3 values
+    "volume_bars": 6,       # volume confirmation window
+    "structure_bars": 3,    # HH / LL window
+}
+
+# 5 trading days of 5-minute bars is ~375
+INITIAL_CAPACITY = 512
+
+
+class BarBuffer:
+    """
+    Preallocated, reusable typed columns for one instrument's bars.
+
+    Broker arrays are decoded straight into these (int64 epoch seconds,
+    float64 OHLCV) and indicators are computed in place, so a hot-path
+    evaluation does no per-call DataFrame/Series allocation. Float64 is
+    kept for prices so rolling means match the pandas path bit-for-bit
+    closely enough for the strict SMA slope comparisons.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.n = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.ts = np.empty(capacity, dtype=np.int64)
+        self.open = np.empty(capacity, dtype=np.float64)
+        self.high = np.empty(capacity, dtype=np.float64)
+        self.low = np.empty(capacity, dtype=np.float64)
+        self.close = np.empty(capacity, dtype=np.float64)
+        self.volume = np.empty(capacity, dtype=np.float64)
+        self.sma_fast = np.empty(capacity, dtype=np.float64)
+        self.sma_slow = np.empty(capacity, dtype=np.float64)
+        self.atr = np.empty(capacity, dtype=np.float64)
+        self._tr = np.empty(capacity, dtype=np.float64)
+        self._csum = np.empty(capacity + 1, dtype=np.float64)
+
+    def load(self, data):
+        """Decode broker-style arrays (timestamp/open/high/low/close/volume) into the buffer."""
+        n = len(data["timestamp"])
+        if n > self.capacity:
+            self._allocate(max(n, self.capacity * 2))
+        self.n = n
+        self.ts[:n] = data["timestamp"]
+        self.open[:n] = data["open"]
+        self.high[:n] = data["high"]
+        self.low[:n] = data["low"]
+        self.close[:n] = data["close"]
+        self.volume[:n] = data["volume"]
+        return self
+
+    def _rolling_mean(self, values, window, out):
+        """pandas `rolling(window).mean()`: NaN until the window is full."""
+        n = self.n
+        if n < window:
+            out[:n] = np.nan
+            return out
+        # Offset by the first value to keep the running sum small (less cancellation)
+        base = values[0]
+        csum = self._csum
+        csum[0] = 0.0
+        np.subtract(values[:n], base, out=csum[1:n + 1])
+        np.cumsum(csum[1:n + 1], out=csum[1:n + 1])
+        np.subtract(csum[window:n + 1], csum[:n + 1 - window], out=out[window - 1:n])
+        out[window - 1:n] /= window
+        out[window - 1:n] += base
+        out[:window - 1] = np.nan
+        return out
+
+    def compute(self, params=DEFAULT_PARAMS):
+        """Fill SMA fast/slow and ATR columns for the loaded bars."""
+        n = self.n
+        if n == 0:
+            return self
+        high, low, close, tr = self.high[:n], self.low[:n], self.close[:n], self._tr[:n]
+
+        # True range; the first bar has no previous close, so it is just high - low
+        np.subtract(high, low, out=tr)
+        if n > 1:
+            prev_close = close[:-1]
+            np.maximum(tr[1:], np.abs(high[1:] - prev_close), out=tr[1:])
+            np.maximum(tr[1:], np.abs(low[1:] - prev_close), out=tr[1:])
+
+        self._rolling_mean(close, params["sma_fast"], self.sma_fast)
+        self._rolling_mean(close, params["sma_slow"], self.sma_slow)
+        self._rolling_mean(tr, params["atr_period"], self.atr)
+        return self
+
+
+_local = threading.local()
+
+
+def thread_buffer():
+    """One reusable BarBuffer per thread."""
+    buf = getattr(_local, "buffer", None)
+    if buf is None:
+        buf = _local.buffer = BarBuffer()
+    return buf
+
+
+def _monotonic(values, rising):
+    pairs = zip(values, values[1:])
+    return all(x < y for x, y in pairs) if rising else all(x > y for x, y in pairs)
+
+
+def levels_at(buf, i, signal, params=DEFAULT_PARAMS):
+    """(stoploss, target) set by a `signal` on bar `i`: previous bar's low/high and close ± target_atr * ATR."""
+    if signal is None:
+        return None, None
+    prev = i - 1 if i >= 1 else i
+    close, atr = float(buf.close[i]), float(buf.atr[i])
+    if signal == "bullish":
+        return float(buf.low[prev]), round(close + (params["target_atr"] * atr), 2)
+    return float(buf.high[prev]), round(close - (params["target_atr"] * atr), 2)
+
+
+def evaluate_at(buf, i, params=DEFAULT_PARAMS):
+    """
+    Strategy evaluation for bar `i` of a computed BarBuffer, using only bars
+    0..i. Returns the same fields as the historical pandas path.
+    """
+    close = float(buf.close[i])
+    sma20 = float(buf.sma_fast[i])
+    sma200 = float(buf.sma_slow[i])
+    atr = float(buf.atr[i])
+    atr_window = buf.atr[:i + 1]
+    atr_valid = atr_window[~np.isnan(atr_window)]
+    atr_mean = float(atr_valid.mean()) if atr_valid.size else float("nan")
+
+    near_sma = abs(close - sma20) <= (params["near_band"] * close)
+
+    slope = buf.sma_fast[max(0, i + 1 - params["slope_bars"]):i + 1].tolist()
+    is_sma20_rising = _monotonic(slope, True)
+    is_sma20_falling = _monotonic(slope, False)
+
+    start = max(0, i + 1 - params["volume_bars"])
+    vol = buf.volume[start:i + 1]
+    opens = buf.open[start:i + 1]
+    closes = buf.close[start:i + 1]
+    avg_vol = float(vol.mean())
+    heavy = vol > avg_vol
+    strong_bearish_vol = bool(np.any((closes < opens) & heavy))
+    strong_bullish_vol = bool(np.any((closes > opens) & heavy))
+
+    atr_ok = atr > params["atr_floor"]
+    isBearish = (close < sma20) and (sma20 < sma200) and atr_ok and is_sma20_falling and near_sma and strong_bearish_vol
+    isBullish = (close > sma20) and (sma20 > sma200) and atr_ok and is_sma20_rising and near_sma and strong_bullish_vol
+
+    if isBullish:
+        signal = "bullish"
+    elif isBearish:
+        signal = "bearish"
+    else:
+        signal = None
+    stoploss, target = levels_at(buf, i, signal, params)
+
+    s = max(0, i + 1 - params["structure_bars"])
+    is_higher_highs = _monotonic(buf.high[s:i + 1].tolist(), True)
+    is_lower_lows = _monotonic(buf.low[s:i + 1].tolist(), False)
+
+    if isBullish:
+        if is_sma20_rising and strong_bullish_vol and is_higher_highs:
+            trend_strength = "strong_bullish"
+        elif is_sma20_rising and (strong_bullish_vol or is_higher_highs):
+            trend_strength = "moderate_bullish"
+        else:
+            trend_strength = "weak_bullish"
+    elif isBearish:
+        if is_sma20_falling and strong_bearish_vol and is_lower_lows:
+            trend_strength = "strong_bearish"
+        elif is_sma20_falling and (strong_bearish_vol or is_lower_lows):
+            trend_strength = "moderate_bearish"
+        else:
+            trend_strength = "weak_bearish"
+    else:
+        trend_strength = "neutral"
+
+    tradeStatus = "ready" if signal and ("strong" in trend_strength or "moderate" in trend_strength) else "not_ready"
+
+    return {
+        "signal": signal,
+        "stoploss": stoploss,
+        "target": target,
+        "tradeStatus": tradeStatus,
+        "atr_mean": round(atr_mean, 2),
+        "avg_vol": round(avg_vol, 2),
+        "is_sma20_rising": is_sma20_rising,
+        "is_sma20_falling": is_sma20_falling,
+        "strong_bullish_vol": strong_bullish_vol,
+        "strong_bearish_vol": strong_bearish_vol,
+        "near_sma": bool(near_sma),
+        "isBullish": bool(isBullish),
+        "isBearish": bool(isBearish),
+        "is_higher_highs": is_higher_highs,
+        "is_lower_lows": is_lower_lows,
+        "trend_strength": trend_strength,
+    }
+
+
+def bar_dict(buf, i, security_id):
+    """The bar + indicator fields of row `i`, as the pandas path's `row.to_dict()` produced them."""
+    return {
+        "Datetime": to_datetime(buf.ts[i]),
+        "Open": float(buf.open[i]),
+        "High": float(buf.high[i]),
+        "Low": float(buf.low[i]),
+        "Close": float(buf.close[i]),
+        "Volume": float(buf.volume[i]),
+        "dsecurityid": security_id,
+        "SMA20": float(buf.sma_fast[i]),
+        "SMA200": float(buf.sma_slow[i]),
+        "ATR": float(buf.atr[i]),
+    }
+
+
+def evaluate_last(data, security_id, symbol, params=DEFAULT_PARAMS):
+    """Hot path: decode bars into this thread's buffer and evaluate the last one."""
+    buf = thread_buffer().load(data).compute(params)
+    if buf.n == 0:
+        return None
+    i = buf.n - 1
+    candle_data = bar_dict(buf, i, security_id)
+    candle_data["symbol"] = symbol
+    candle_data.update(evaluate_at(buf, i, params))
+    return candle_data
+
+
+# --- Vectorized evaluation over a whole history (simulator / sweep) ---
+
+def _windows_all(flags, window):
+    """out[i] = flags[i-window+1 .. i] all true (False until the window is full)."""
+    out = np.zeros(len(flags), dtype=bool)
+    if window <= 0:
+        out[:] = True
+    elif len(flags) >= window:
+        out[window - 1:] = sliding_window_view(flags, window).all(axis=1)
+    return out
+
+
+class MaskCache:
+    """
+    Per-buffer cache of the parts of the entry test that only depend on a
+    window length, shared between parameter sets (indicators must already be
+    computed).
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self._cache = {}
+
+    def slope(self, bars):
+        key = ("slope", bars)
+        if key not in self._cache:
+            sma = self.buf.sma_fast[:self.buf.n]
+            diff = np.diff(sma, prepend=np.nan)
+            # `bars` SMA values rising = `bars - 1` consecutive positive diffs
+            self._cache[key] = (_windows_all(diff > 0, bars - 1), _windows_all(diff < 0, bars - 1))
+        return self._cache[key]
+
+    def volume(self, bars):
+        key = ("volume", bars)
+        if key not in self._cache:
+            n = self.buf.n
+            bullish = np.zeros(n, dtype=bool)
+            bearish = np.zeros(n, dtype=bool)
+            if n >= bars:
+                vol = sliding_window_view(self.buf.volume[:n], bars)
+                opens = sliding_window_view(self.buf.open[:n], bars)
+                closes = sliding_window_view(self.buf.close[:n], bars)
+                heavy = vol > vol.mean(axis=1)[:, None]
+                bullish[bars - 1:] = ((closes > opens) & heavy).any(axis=1)
+                bearish[bars - 1:] = ((closes < opens) & heavy).any(axis=1)
+            self._cache[key] = (bullish, bearish)
+        return self._cache[key]
+
+
+def entry_masks(buf, masks, params=DEFAULT_PARAMS):
+    """
+    (bullish, bearish) boolean arrays over every bar of a computed buffer:
+    the same conditions as evaluate_at's isBullish/isBearish, vectorized.
+    Either one implies tradeStatus "ready" (the SMA slope and volume checks
+    they require already make the trend at least "moderate").
+    """
+    n = buf.n
+    close, sma20, sma200, atr = buf.close[:n], buf.sma_fast[:n], buf.sma_slow[:n], buf.atr[:n]
+    rising, falling = masks.slope(params["slope_bars"])
+    bull_vol, bear_vol = masks.volume(params["volume_bars"])
+
+    base = (atr > params["atr_floor"]) & (np.abs(close - sma20) <= params["near_band"] * close)
+    bullish = base & (close > sma20) & (sma20 > sma200) & rising & bull_vol
+    bearish = base & (close < sma20) & (sma20 < sma200) & falling & bear_vol
+    return bullish, bearish
@@ -0,0 +1,99 @@
+# services/snapshot_service.py
+
+import gzip
+import os
+import pickle
+import time
+from array import array
+from pathlib import Path
+
+from services.market_state import market_state, BAR_FIELDS
+from utils.logger import logger
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "state/market_snapshot.pkl.gz")
+SNAPSHOT_INTERVAL = int(os.getenv("SNAPSHOT_INTERVAL", "300"))  # seconds
+# Bars older than the 5-day fetch window are useless, so is a snapshot of them
+SNAPSHOT_MAX_AGE = 5 * 24 * 3600
+
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotService:
+    """Periodically persists MarketState to a local file and restores it on startup."""
+
+    def __init__(self, state=None, path=SNAPSHOT_PATH, interval=SNAPSHOT_INTERVAL):
+        self.state = state if state is not None else market_state
+        self.path = Path(path)
+        self.interval = interval
+        self.last_saved_at = 0
+
+    def save(self):
+        """Write the snapshot atomically (tmp file + rename) so a crash never leaves it half-written."""
+        started = time.time()
+        snapshot = self.state.to_snapshot()
+
+        # Typed arrays pickle far smaller than lists of Python floats
+        snapshot["bars"] = {
+            sec_id: {
+                f: array("q" if f == "timestamp" else "d", bars[f]) for f in BAR_FIELDS
+            }
+            for sec_id, bars in snapshot["bars"].items()
+        }
+        snapshot["version"] = SNAPSHOT_VERSION
+        snapshot["saved_at"] = started
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with gzip.open(tmp_path, "wb", compresslevel=1) as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.exception(f"❌ Failed to write market snapshot: {e}")
+            return False
+
+        self.last_saved_at = started
+        logger.info(f"💾 Market snapshot saved: {len(snapshot['bars'])} symbols in {time.time() - started:.2f}s")
+        return True
+
+    def maybe_save(self):
+        """Save if the snapshot interval has elapsed since the last save."""
+        if time.time() - self.last_saved_at >= self.interval:
+            return self.save()
+        return False
+
+    def restore(self):
+        """Load the snapshot into MarketState. Returns True if anything was restored."""
+        if not self.path.exists():
+            logger.info("ℹ️ No market snapshot found, starting cold")
+            return False
+
+        started = time.time()
+        try:
+            with gzip.open(self.path, "rb") as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            logger.exception(f"❌ Failed to read market snapshot, starting cold: {e}")
+            return False
+
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            logger.warning("⚠️ Market snapshot version mismatch, starting cold")
+            return False
+
+        age = started - snapshot.get("saved_at", 0)
+        if age > SNAPSHOT_MAX_AGE:
+            logger.info(f"ℹ️ Market snapshot is {age / 3600:.1f}h old, starting cold")
+            return False
+
+        snapshot["bars"] = {
+            sec_id: {f: list(bars[f]) for f in BAR_FIELDS}
+            for sec_id, bars in snapshot["bars"].items()
+        }
+        self.state.load_snapshot(snapshot)
+        self.last_saved_at = started
+        logger.info(
+            f"♻️ Restored market snapshot ({age / 60:.0f} min old): "
+            f"{len(snapshot['bars'])} symbols, {len(snapshot.get('trades', {}))} open trades "
+            f"in {time.time() - started:.2f}s"
+        )
+        return True
@@ -0,0 +1,319 @@
+# services/trade_book.py
+
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config.db_config import db
+from services.change_tracker import ChangeTracker
+from services.trigger_index import TriggerIndex
+from utils.logger import logger
+
+# Record attribute -> field name in the `trades` collection
+FIELD_MAP = {
+    "symbol": "symbol",
+    "security_id": "dsecurityid",
+    "signal": "signal",
+    "entry_price": "price",
+    "stoploss": "stoploss",
+    "target": "target",
+    "last_price": "current_price",
+    "status": "status",
+    "entry_time": "entry_time",
+    "fentry_time": "fentry_time",
+    "exit_time": "exit_time",
+    "exit_reason": "exit_reason",
+    "pnl": "pnl",
+    "levels_ts": "levels_ts",   # epoch of the bar the current stoploss/target were derived from
+}
+
+MAX_STALENESS = 5.0  # seconds a change may sit in memory before it is flushed
+FLUSH_BATCH_SIZE = 100
+
+
+class TradeRecord:
+    """One trade as held by the TradeBook. Attribute names map to Mongo fields via FIELD_MAP."""
+
+    __slots__ = tuple(FIELD_MAP) + ("_id", "dirty", "dirty_since")
+
+    def __init__(self, _id, **fields):
+        self._id = _id
+        for attr in FIELD_MAP:
+            setattr(self, attr, fields.get(attr))
+        self.dirty = set()
+        self.dirty_since = None
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(doc["_id"], **{attr: doc.get(field) for attr, field in FIELD_MAP.items()})
+
+    def to_doc(self, attrs=None):
+        attrs = FIELD_MAP if attrs is None else attrs
+        return {FIELD_MAP[attr]: getattr(self, attr) for attr in attrs}
+
+    def __repr__(self):
+        return f"TradeRecord({self.symbol} {self.signal} {self.status} entry={self.entry_price} sl={self.stoploss} tgt={self.target})"
+
+
+class TradeBook:
+    """
+    Authoritative in-memory view of open trades.
+
+    - O(1) lookups by symbol and by security id
+    - New trades are inserted synchronously: the setup they come from is
+      already claimed, so the trade document must exist before open() returns
+    - Changes are applied in memory and marked dirty
+    - A background flusher writes dirty trades to Mongo in one bulk_write,
+      at the latest MAX_STALENESS seconds after the first unflushed change
+    - Only fields that differ from the last persisted value are written; a
+      trade whose dirty fields all came back unchanged costs no write at all
+    """
+
+    def __init__(self, collection=None, max_staleness=MAX_STALENESS, batch_size=FLUSH_BATCH_SIZE):
+        self.collection = collection if collection is not None else db["trades"]
+        self.max_staleness = max_staleness
+        self.batch_size = batch_size
+
+        self.by_symbol = {}
+        self.by_security = {}
+        self.triggers = TriggerIndex()
+        self._dirty = {}  # _id -> record, includes just-closed trades until flushed
+        self._in_flight = set()  # _ids whose write is in a bulk_write that hasn't returned yet
+        self.changes = ChangeTracker("trades")  # last persisted fields per _id
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Loading ---
+
+    def ensure_indexes(self):
+        """status serves load/reconcile; fentry_time serves the per-day export's prefix query."""
+        self.collection.create_index([("status", ASCENDING)])
+        self.collection.create_index([("fentry_time", ASCENDING)])
+
+    def load(self):
+        """Seed the book with every in-progress trade in Mongo (one query at startup)."""
+        docs = list(self.collection.find({"status": "in_progress"}))
+        with self._lock:
+            self.by_symbol.clear()
+            self.by_security.clear()
+            self.triggers = TriggerIndex()
+            for doc in docs:
+                record = TradeRecord.from_doc(doc)
+                self._index(record)
+                self.changes.seed(record._id, record.to_doc())
+        logger.info(f"📒 Trade book loaded with {len(docs)} open trades")
+
+    def reconcile(self):
+        """
+        Align the book with Mongo when no change stream feeds it (polling mode):
+        picks up trades opened, changed or closed by another process.
+        """
+        docs = list(self.collection.find({"status": "in_progress"}))
+        open_ids = {doc["_id"] for doc in docs}
+        with self._lock:
+            missing = [r._id for r in self.by_symbol.values() if r._id not in open_ids]
+        if missing:
+            docs += list(self.collection.find({"_id": {"$in": missing}}))
+        for doc in docs:
+            self.apply_external(doc)
+
+    def _index(self, record):
+        self.by_symbol[record.symbol] = record
+        if record.security_id is not None:
+            self.by_security[str(record.security_id)] = record
+        self.triggers.set(record._id, record.symbol, record.signal, record.stoploss, record.target)
+
+    def _unindex(self, record):
+        if self.by_symbol.get(record.symbol) is record:
+            del self.by_symbol[record.symbol]
+        if self.by_security.get(str(record.security_id)) is record:
+            del self.by_security[str(record.security_id)]
+        self.triggers.remove(record._id)
+
+    # --- Reads (O(1), no Mongo) ---
+
+    def get(self, symbol):
+        return self.by_symbol.get(symbol)
+
+    def get_by_security(self, security_id):
+        return self.by_security.get(str(security_id))
+
+    def has_open(self, symbol):
+        return symbol in self.by_symbol
+
+    def open_trades(self):
+        with self._lock:
+            return list(self.by_symbol.values())
+
+    def crossed(self, symbol, low, high=None, bar_ts=None):
+        """
+        Open trades on `symbol` whose stoploss/target lies inside [low, high]: [(record, kind)].
+        With `bar_ts`, a bar only counts if it starts after the bar the levels came from:
+        its range could otherwise include wicks from before the levels moved.
+        """
+        with self._lock:
+            record = self.by_symbol.get(symbol)
+            if record is None:
+                return []
+            if bar_ts is not None and record.levels_ts is not None and bar_ts <= record.levels_ts:
+                return []
+            return [(record, kind) for key, kind in self.triggers.crossed(symbol, low, high) if key == record._id]
+
+    # --- Writes (memory first, Mongo later) ---
+
+    def open(self, **fields):
+        """Insert a new in-progress trade (synchronously; raises if Mongo rejects it) and index it."""
+        record = TradeRecord(ObjectId(), **fields)
+        record.status = fields.get("status", "in_progress")
+        doc = record.to_doc()
+        self.collection.insert_one({"_id": record._id, **doc})
+        with self._lock:
+            self._index(record)
+            self.changes.persisted(record._id, doc)
+        return record
+
+    def update(self, record, **fields):
+        with self._lock:
+            for attr, value in fields.items():
+                setattr(record, attr, value)
+            if ("stoploss" in fields or "target" in fields) and self.by_symbol.get(record.symbol) is record:
+                self.triggers.set(record._id, record.symbol, record.signal, record.stoploss, record.target)
+            self._mark(record, fields)
+
+    def close(self, record, **fields):
+        fields["status"] = "closed"
+        with self._lock:
+            self.update(record, **fields)
+            self._unindex(record)
+        # Closing matters more than a price tick; don't wait for the staleness window
+        self._wake.set()
+
+    def apply_external(self, doc):
+        """Sync a trade changed outside this process (e.g. from the change stream)."""
+        with self._lock:
+            record = self.by_symbol.get(doc.get("symbol"))
+            if record is None or record._id != doc["_id"]:
+                record = self._dirty.get(doc["_id"])
+
+            if record is None:
+                if doc.get("status") == "in_progress":
+                    record = TradeRecord.from_doc(doc)
+                    self._index(record)
+                    self.changes.seed(record._id, record.to_doc())
+                return
+
+            # Local unflushed (or still in-flight) changes win; the document is older than memory
+            if record.dirty or record._id in self._in_flight:
+                return
+
+            # Update in place so callers holding the record see the new values
+            for attr, field in FIELD_MAP.items():
+                setattr(record, attr, doc.get(field))
+            self.changes.seed(record._id, record.to_doc())
+            if record.status == "in_progress":
+                self._index(record)
+            else:
+                self._unindex(record)
+
+    def _mark(self, record, attrs):
+        if not record.dirty:
+            record.dirty_since = time.time()
+        record.dirty.update(attrs)
+        self._dirty[record._id] = record
+        if len(self._dirty) >= self.batch_size:
+            self._wake.set()
+
+    # --- Write-behind flushing ---
+
+    def flush(self):
+        """Persist every dirty trade in one unordered bulk write. Returns the number of operations."""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            batch = []
+            for record in self._dirty.values():
+                fields = self.changes.changes(record._id, record.to_doc(record.dirty))
+                if fields:
+                    op = UpdateOne({"_id": record._id}, {"$set": fields})
+                    batch.append((record, op, record.dirty, record.dirty_since, fields))
+                    self._in_flight.add(record._id)
+                record.dirty = set()
+                record.dirty_since = None
+            self._dirty = {}
+        if not batch:
+            return 0
+
+        started = time.time()
+        try:
+            self.collection.bulk_write([entry[1] for entry in batch], ordered=False)
+        except BulkWriteError as e:
+            failed = {err["index"]: err for err in e.details.get("writeErrors", [])}
+            logger.error(f"❌ Trade book flush: {len(failed)}/{len(batch)} writes failed, will retry")
+            self._requeue([
+                (record, dirty, since)
+                for i, (record, _, dirty, since, _) in enumerate(batch) if i in failed
+            ])
+            self._persisted([entry for i, entry in enumerate(batch) if i not in failed])
+            return len(batch) - len(failed)
+        except Exception as e:
+            logger.exception(f"❌ Trade book flush failed, will retry: {e}")
+            self._requeue([(record, dirty, since) for record, _, dirty, since, _ in batch])
+            return 0
+
+        self._persisted(batch)
+        logger.info(f"💾 Flushed {len(batch)} trade changes in {time.time() - started:.2f}s")
+        return len(batch)
+
+    def _persisted(self, entries):
+        with self._lock:
+            for record, _, _, _, fields in entries:
+                self._in_flight.discard(record._id)
+                self.changes.persisted(record._id, fields)
+                if record.status != "in_progress":
+                    # Closed trades are not written again
+                    self.changes.forget(record._id)
+
+    def _requeue(self, entries):
+        with self._lock:
+            for record, dirty, since in entries:
+                self._in_flight.discard(record._id)
+                record.dirty |= dirty
+                times = [t for t in (record.dirty_since, since) if t]
+                record.dirty_since = min(times) if times else None
+                self._dirty[record._id] = record
+
+    def oldest_dirty_age(self):
+        with self._lock:
+            ages = [time.time() - r.dirty_since for r in self._dirty.values() if r.dirty_since]
+        return max(ages) if ages else 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trade-book-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+        self.flush()
+
+    def _run(self):
+        while not self._stop.is_set():
+            woken = self._wake.wait(timeout=max(0.05, self.max_staleness - self.oldest_dirty_age()))
+            self._wake.clear()
+            # Flush on explicit wake-ups (close/batch full) or once the oldest change hits the window
+            if self._dirty and (woken or self.oldest_dirty_age() >= self.max_staleness):
+                self.flush()
+
+
+# Global instance shared by trade activation and monitoring
+trade_book = TradeBook()
@@ -0,0 +1,64 @@
+# services/trade_rules.py
+
+"""
+Exit rules of monitor_open_trades as pure functions, so the live monitor and
+the replay simulator (tasks.simulator) make exactly the same decisions.
+"""
+
+from services.trigger_index import STOPLOSS, TARGET
+
+CLOSE = "close"
+UPDATE = "update"
+
+SIGNAL_LOST = "Signal lost sl hit"
+
+
+def pnl_label(signal, entry_price, price):
+    """"profit"/"loss" of exiting at `price`."""
+    if not price:
+        return "loss"
+    if signal == "bearish":
+        return "profit" if price < entry_price else "loss"
+    return "profit" if price > entry_price else "loss"
+
+
+def crossed_level(signal, stoploss, target, low, high):
+    """
+    First level touched by a bar's [low, high] range: (kind, level) or None.
+    Stops win when a bar spans both levels (assume the worse fill).
+    """
+    if signal == "bullish":
+        if stoploss is not None and low <= float(stoploss):
+            return STOPLOSS, float(stoploss)
+        if target is not None and high >= float(target):
+            return TARGET, float(target)
+    elif signal == "bearish":
+        if stoploss is not None and high >= float(stoploss):
+            return STOPLOSS, float(stoploss)
+        if target is not None and low <= float(target):
+            return TARGET, float(target)
+    return None
+
+
+def monitor_decision(signal, stoploss, live_data):
+    """
+    What the monitor does with a fresh evaluation once no level was crossed:
+
+    - (CLOSE, price, exit_reason): the signal is gone, or price closed through the
+      new stoploss
+    - (UPDATE, fields, None): trail last_price/target/stoploss to the new evaluation
+    """
+    if live_data.get("tradeStatus") != "ready":
+        return CLOSE, stoploss, SIGNAL_LOST
+
+    current_price = float(live_data["Close"]) if live_data.get("Close") is not None else 0
+    new_stoploss = float(live_data["stoploss"]) if live_data.get("stoploss") is not None else 0
+
+    if signal == "bullish" and current_price <= new_stoploss:
+        return CLOSE, current_price, "stoploss_hit"
+    if signal == "bearish" and current_price >= new_stoploss:
+        return CLOSE, current_price, "stoploss_hit"
+    if signal not in ("bullish", "bearish"):
+        return UPDATE, {}, None
+
+    return UPDATE, {"last_price": current_price, "target": live_data["target"], "stoploss": live_data["stoploss"]}, None
@@ -0,0 +1,128 @@
+# services/trigger_index.py
+
+from bisect import bisect_left, bisect_right
+
+STOPLOSS = "stoploss"
+TARGET = "target"
+
+
+def _level(value):
+    """Coerce a stored level to float; missing/blank levels are not indexed."""
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+class LevelList:
+    """Sorted price levels with a parallel list of trade keys (bisect-able)."""
+
+    __slots__ = ("levels", "keys")
+
+    def __init__(self):
+        self.levels = []
+        self.keys = []
+
+    def add(self, level, key):
+        i = bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.keys.insert(i, key)
+
+    def remove(self, level, key):
+        i = bisect_left(self.levels, level)
+        while i < len(self.levels) and self.levels[i] == level:
+            if self.keys[i] == key:
+                del self.levels[i]
+                del self.keys[i]
+                return True
+            i += 1
+        return False
+
+    def at_or_above(self, price):
+        """Keys whose level >= price."""
+        return self.keys[bisect_left(self.levels, price):]
+
+    def at_or_below(self, price):
+        """Keys whose level <= price."""
+        return self.keys[:bisect_right(self.levels, price)]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class SymbolTriggers:
+    """Stop and target levels for one symbol, split by trade direction."""
+
+    __slots__ = ("long_stops", "long_targets", "short_stops", "short_targets")
+
+    def __init__(self):
+        self.long_stops = LevelList()     # hit when price <= level
+        self.long_targets = LevelList()   # hit when price >= level
+        self.short_stops = LevelList()    # hit when price >= level
+        self.short_targets = LevelList()  # hit when price <= level
+
+    def lists(self, signal):
+        if signal == "bullish":
+            return self.long_stops, self.long_targets
+        return self.short_stops, self.short_targets
+
+    def crossed(self, low, high):
+        """
+        Every trigger crossed by a price range [low, high] in O(log n + k).
+        Pass low == high for a single tick.
+        """
+        hits = []
+        hits += [(key, STOPLOSS) for key in self.long_stops.at_or_above(low)]
+        hits += [(key, STOPLOSS) for key in self.short_stops.at_or_below(high)]
+        hits += [(key, TARGET) for key in self.long_targets.at_or_below(high)]
+        hits += [(key, TARGET) for key in self.short_targets.at_or_above(low)]
+        return hits
+
+    def __len__(self):
+        return len(self.long_stops) + len(self.long_targets) + len(self.short_stops) + len(self.short_targets)
+
+
+class TriggerIndex:
+    """
+    Per-symbol index of open trades' stoploss and target levels.
+
+    Instead of re-checking every trade on a polling cadence, each incoming
+    price (or bar high/low) is looked up once per symbol and returns exactly
+    the trades whose levels were crossed.
+    """
+
+    def __init__(self):
+        self.symbols = {}
+        self.entries = {}  # key -> (symbol, signal, stoploss, target)
+
+    def set(self, key, symbol, signal, stoploss, target):
+        """Add or move a trade's levels. None levels are not indexed."""
+        self.remove(key)
+        stoploss, target = _level(stoploss), _level(target)
+        triggers = self.symbols.setdefault(symbol, SymbolTriggers())
+        stops, targets = triggers.lists(signal)
+        if stoploss is not None:
+            stops.add(stoploss, key)
+        if target is not None:
+            targets.add(target, key)
+        self.entries[key] = (symbol, signal, stoploss, target)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        symbol, signal, stoploss, target = entry
+        triggers = self.symbols[symbol]
+        stops, targets = triggers.lists(signal)
+        if stoploss is not None:
+            stops.remove(stoploss, key)
+        if target is not None:
+            targets.remove(target, key)
+        if not len(triggers):
+            del self.symbols[symbol]
+
+    def crossed(self, symbol, low, high=None):
+        """Return [(key, "stoploss"|"target")] crossed by this price or bar range."""
+        triggers = self.symbols.get(symbol)
+        if triggers is None:
+            return []
+        return triggers.crossed(float(low), float(low if high is None else high))
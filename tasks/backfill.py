@@ -0,0 +1,194 @@
+# tasks/backfill.py
+"""
+Download a date range of 5-minute bars for the stock universe into the local
+HistoryStore.
+
+The range x universe is split into broker-sized chunks, downloaded by a
+thread pool under the process-wide broker data quota, circuit breaker and
+in-flight limit, and every finished chunk is appended to a checkpoint file
+so an interrupted run resumes where it stopped.
+
+Usage:
+    python -m tasks.backfill --from 2025-06-01 --to 2025-10-31
+    python -m tasks.backfill --from 2025-06-01 --to 2025-10-31 --symbols TCS,INFY --workers 4
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from services.quota_manager import quota_manager, PRIORITY_SCAN
+from services.resilience import broker_guard, BrokerError, CIRCUIT_OPEN, DEFERRED, NO_DATA
+from utils.history_store import HistoryStore, HISTORY_DIR
+from utils.logger import logger
+
+CHUNK_DAYS = int(os.getenv("BACKFILL_CHUNK_DAYS", "30"))
+REQUESTS_PER_SECOND = float(os.getenv("BACKFILL_RATE", "4"))
+WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))
+ATTEMPTS = int(os.getenv("BACKFILL_ATTEMPTS", "5"))
+RETRY_SECONDS = float(os.getenv("BACKFILL_RETRY_SECONDS", "10"))
+
+
+def make_chunks(stocks, start, end, chunk_days=CHUNK_DAYS):
+    """Split [start, end] x stocks into (symbol, security_id, from, to) chunks."""
+    chunks = []
+    for stock in stocks:
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            chunks.append((stock["UNDERLYING_SYMBOL"], str(stock["SECURITY_ID"]), chunk_start, chunk_end))
+            chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def chunk_key(chunk):
+    _, sec_id, chunk_start, chunk_end = chunk
+    return f"{sec_id}:{chunk_start:%Y-%m-%d}:{chunk_end:%Y-%m-%d}"
+
+
+class Checkpoint:
+    """Append-only file of finished chunk keys."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def mark(self, key):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(key + "\n")
+            self.done.add(key)
+
+
+class Progress:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.bars = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def update(self, bars=0, failed=False):
+        with self._lock:
+            self.done += 1
+            self.failed += int(failed)
+            self.bars += bars
+            elapsed = time.time() - self.started
+            rate = self.done / elapsed if elapsed else 0
+            eta = (self.total - self.done) / rate if rate else 0
+            logger.info(
+                f"📦 {self.done}/{self.total} chunks ({self.failed} failed) | "
+                f"{self.bars} bars | {self.bars / elapsed if elapsed else 0:.0f} bars/s | "
+                f"ETA {timedelta(seconds=int(eta))}"
+            )
+
+
+def download_chunk(dhan, chunk, attempts=ATTEMPTS):
+    """
+    One chunk through the same guarded path as live fetches: broker_guard's
+    'intraday' breaker and backoff, the data quota and the adaptive in-flight
+    window. Skipped calls (open circuit, key backing off) are waited out here,
+    since backfill has no deadline; a chunk that keeps failing is left for the next run.
+    """
+    symbol, sec_id, chunk_start, chunk_end = chunk
+    key = chunk_key(chunk)
+    for attempt in range(1, attempts + 1):
+        try:
+            # Backfill has no deadline: wait as long as it takes for a scan-priority permit
+            resp = broker_guard.call("intraday", lambda: dhan._data_request(
+                priority=PRIORITY_SCAN,
+                timeout=float("inf"),
+                security_id=sec_id,
+                exchange_segment="NSE_EQ",
+                instrument_type="EQUITY",
+                interval=5,
+                from_date=chunk_start.strftime("%Y-%m-%d"),
+                # to_date is exclusive on the broker side; overlap is de-duplicated by the store
+                to_date=(chunk_end + timedelta(days=1)).strftime("%Y-%m-%d")
+            ), key=key)
+        except BrokerError as e:
+            if e.kind == NO_DATA:
+                # Holidays, or before the listing date: nothing to store, but the chunk is done
+                return None
+            if e.kind not in (CIRCUIT_OPEN, DEFERRED) or attempt == attempts:
+                raise RuntimeError(f"{symbol} {key}: {e}") from e
+            time.sleep(RETRY_SECONDS)
+            continue
+        return resp["data"]
+
+
+def backfill(stocks, start, end, store=None, workers=WORKERS, rate=REQUESTS_PER_SECOND, chunk_days=CHUNK_DAYS):
+    from services.dhan_service import DhanService
+
+    store = store or HistoryStore()
+    store.root.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(str(store.root / ".backfill_checkpoint"))
+
+    chunks = [c for c in make_chunks(stocks, start, end, chunk_days) if chunk_key(c) not in checkpoint.done]
+    logger.info(f"🚚 Backfill {start:%Y-%m-%d} → {end:%Y-%m-%d}: {len(stocks)} symbols, "
+                f"{len(chunks)} chunks to fetch ({len(checkpoint.done)} already done)")
+    if not chunks:
+        return
+
+    dhan = DhanService()
+    quota_manager.configure("data", per_second=rate)
+    progress = Progress(len(chunks))
+
+    def run(chunk):
+        data = download_chunk(dhan, chunk)
+        bars = store.write(chunk[1], data)
+        checkpoint.mark(chunk_key(chunk))
+        return bars
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run, chunk): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                progress.update(bars=future.result())
+            except Exception as e:
+                logger.error(f"❌ Chunk failed (will retry on next run): {e}")
+                progress.update(failed=True)
+
+    logger.info(f"✅ Backfill finished: {progress.bars} bars, {progress.failed} failed chunks "
+                f"in {timedelta(seconds=int(time.time() - progress.started))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill 5-minute bars into the local history store.")
+    parser.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--symbols", help="comma-separated UNDERLYING_SYMBOLs (default: whole universe)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--rate", type=float, default=REQUESTS_PER_SECOND, help="requests per second")
+    parser.add_argument("--chunk-days", type=int, default=CHUNK_DAYS)
+    parser.add_argument("--dir", default=HISTORY_DIR, help="history store root")
+    args = parser.parse_args(argv)
+
+    from services.stock_service import StockService
+
+    stocks = StockService().get_stocks()
+    if args.symbols:
+        wanted = {s.strip().upper() for s in args.symbols.split(",")}
+        stocks = [s for s in stocks if s.get("UNDERLYING_SYMBOL", "").upper() in wanted]
+
+    backfill(
+        stocks,
+        datetime.strptime(args.start, "%Y-%m-%d"),
+        datetime.strptime(args.end, "%Y-%m-%d"),
+        store=HistoryStore(args.dir),
+        workers=args.workers,
+        rate=args.rate,
+        chunk_days=args.chunk_days,
+    )
+
+
+if __name__ == "__main__":
+    main()
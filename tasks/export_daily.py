@@ -0,0 +1,186 @@
+# tasks/export_daily.py
+"""
+End-of-day export of the day's setups, trades, bars and signals from MongoDB
+into the local columnar store (utils.columnar_store), so analytics run on
+Parquet files instead of the production database.
+
+Each day is one zstd Parquet partition per table; re-exporting a day
+replaces it. Mongo is read once per table per day with projections and
+batched cursors.
+
+Usage:
+    python -m tasks.export_daily                                  # today (IST)
+    python -m tasks.export_daily --from 2025-11-01 --to 2025-11-30
+
+Querying (memory-mapped, only the requested days/columns are read):
+    from utils.columnar_store import ColumnarStore
+    trades = ColumnarStore().load("trades", "2025-09-01", "2025-11-30").to_pandas()
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from utils.columnar_store import ColumnarStore, EXPORT_DIR
+from utils.logger import logger
+from utils.time_utils import DAY_SECONDS, day_start, ist_day, now_epoch, parse_ist
+
+BATCH_SIZE = 2000
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None  # "" / None in older documents
+
+
+def _utc(value):
+    """Mongo datetimes come back naive UTC."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return None
+
+
+def _ist(value):
+    """Trade times are stored as IST wall-clock strings ("YYYY-MM-DD HH:MM")."""
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromtimestamp(parse_ist(value[:16]), timezone.utc)
+        except ValueError:
+            return None
+    return _utc(value)
+
+
+def day_bounds(day):
+    """[start, end) of an IST day as naive UTC datetimes, the way the time-series collections store `ts`."""
+    start = datetime.fromtimestamp(day_start(day), timezone.utc).replace(tzinfo=None)
+    return start, start + timedelta(days=1)
+
+
+def _series(collection, day, fields):
+    start, end = day_bounds(day)
+    cursor = collection.find(
+        {"ts": {"$gte": start, "$lt": end}},
+        {"_id": 0, "ts": 1, "meta": 1, **{f: 1 for f in fields}},
+        batch_size=BATCH_SIZE,
+    )
+    for doc in cursor:
+        meta = doc.get("meta") or {}
+        yield meta.get("securityId"), meta.get("symbol"), doc
+
+
+def export_bars(store, day):
+    from services.candle_service import candles
+
+    rows = [
+        {
+            "security_id": sid, "symbol": symbol, "ts": _utc(doc["ts"]),
+            "open": _float(doc.get("Open")), "high": _float(doc.get("High")), "low": _float(doc.get("Low")),
+            "close": _float(doc.get("Close")), "volume": _float(doc.get("Volume")),
+        }
+        for sid, symbol, doc in _series(candles, day, ("Open", "High", "Low", "Close", "Volume"))
+    ]
+    return store.write("bars", day, rows)
+
+
+def export_signals(store, day):
+    """Returns (rows written, {(security id, ts): trend_strength}) for the setups export."""
+    from services.candle_service import signals
+
+    rows = [
+        {
+            "security_id": sid, "symbol": symbol, "ts": _utc(doc["ts"]),
+            "close": _float(doc.get("Close")), "sma20": _float(doc.get("SMA20")),
+            "sma200": _float(doc.get("SMA200")), "atr": _float(doc.get("ATR")),
+            "signal": doc.get("signal"), "trade_status": doc.get("tradeStatus"),
+            "stoploss": _float(doc.get("stoploss")), "target": _float(doc.get("target")),
+            "trend_strength": doc.get("trend_strength"),
+        }
+        for sid, symbol, doc in _series(
+            signals, day,
+            ("Close", "SMA20", "SMA200", "ATR", "signal", "tradeStatus", "stoploss", "target", "trend_strength"),
+        )
+    ]
+    strength = {(r["security_id"], r["ts"]): r["trend_strength"] for r in rows}
+    return store.write("signals", day, rows), strength
+
+
+def export_setups(store, day, strength):
+    from services.setup_service import iter_setups
+
+    rows = []
+    for doc in iter_setups({"date": day}, {"candleRefs": 0, "candleData": 0}, BATCH_SIZE):
+        sid = str(doc.get("dSecurityId"))
+        ts = _utc(doc.get("Datetime"))
+        rows.append({
+            "symbol": doc.get("symbol"), "security_id": sid, "signal": doc.get("signal"),
+            "trade_status": doc.get("tradeStatus"), "ts": ts,
+            "entry_price": _float(doc.get("entryPrice")),
+            "stoploss": _float(doc.get("stoploss")), "target": _float(doc.get("target")),
+            "trend_strength": strength.get((sid, ts)),
+        })
+    return store.write("setups", day, rows)
+
+
+def export_trades(store, day):
+    from config.db_config import db
+    from services.trade_rules import pnl_label
+
+    # Anchored prefix: a range scan on the fentry_time index (TradeBook.ensure_indexes)
+    cursor = db["trades"].find(
+        {"fentry_time": {"$regex": f"^{day}"}},
+        {"_id": 0, "symbol": 1, "dsecurityid": 1, "signal": 1, "status": 1, "fentry_time": 1, "exit_time": 1,
+         "price": 1, "current_price": 1, "stoploss": 1, "target": 1, "exit_reason": 1},
+        batch_size=BATCH_SIZE,
+    )
+    rows = []
+    for doc in cursor:
+        entry, last = _float(doc.get("price")), _float(doc.get("current_price"))
+        move = None
+        if entry and last is not None:
+            move = (entry - last) if doc.get("signal") == "bearish" else (last - entry)
+        rows.append({
+            "symbol": doc.get("symbol"), "security_id": str(doc.get("dsecurityid")), "signal": doc.get("signal"),
+            "status": doc.get("status"), "entry_ts": _ist(doc.get("fentry_time")), "exit_ts": _ist(doc.get("exit_time")),
+            "entry_price": entry, "exit_price": last,
+            "stoploss": _float(doc.get("stoploss")), "target": _float(doc.get("target")),
+            "exit_reason": doc.get("exit_reason"),
+            "pnl": move, "pnl_pct": move / entry * 100 if move is not None else None,
+            "pnl_label": pnl_label(doc.get("signal"), entry, last) if entry and last is not None else None,
+        })
+    return store.write("trades", day, rows)
+
+
+def export_day(day, store=None):
+    """Export one IST day (YYYY-MM-DD). Returns rows written per table."""
+    store = store or ColumnarStore()
+    started = time.time()
+    counts = {"bars": export_bars(store, day)}
+    counts["signals"], strength = export_signals(store, day)
+    counts["setups"] = export_setups(store, day, strength)
+    counts["trades"] = export_trades(store, day)
+    logger.info(f"📦 Exported {day}: {counts} in {time.time() - started:.1f}s")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a day's setups/trades/bars/signals to Parquet.")
+    parser.add_argument("--from", dest="start", help="YYYY-MM-DD (IST, default today)")
+    parser.add_argument("--to", dest="end", help="YYYY-MM-DD (IST, default --from)")
+    parser.add_argument("--dir", default=EXPORT_DIR, help="export root")
+    args = parser.parse_args(argv)
+
+    start = args.start or ist_day(now_epoch())
+    end = args.end or start
+    store = ColumnarStore(args.dir)
+
+    from services.trade_book import trade_book
+    trade_book.ensure_indexes()
+
+    for midnight in range(day_start(start), day_start(end) + 1, DAY_SECONDS):
+        export_day(ist_day(midnight), store)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# tasks/simulator.py
+"""
+Replay historical 5-minute bars from the local HistoryStore through the live
+entry and exit rules and report the resulting trades.
+
+Entries (check_for_setups_and_trade):
+- default: setups are regenerated from the bars with the live strategy. A
+  symbol gets at most one ready setup per day (the scan stops evaluating it
+  once it has one) and it is only traded if no trade on that symbol is open.
+- --setups-from-db: the setups actually recorded in MongoDB over the range.
+
+Exits (monitor_open_trades): every following bar is one monitor cycle, i.e.
+the bar range is checked against the live stoploss/target first, then
+trade_rules.monitor_decision runs on that bar's evaluation (signal lost,
+close through the new stoploss, or trail target/stoploss). With --eod-exit
+trades are also closed on the 15:15 bar, which is what
+close_trades_before_market_close intends; live currently carries them over.
+
+Indicators and entry conditions are computed vectorized per symbol; only the
+bars a trade is actually open for are walked one at a time.
+
+Usage:
+    python -m tasks.simulator --from 2025-06-01 --to 2025-10-31
+    python -m tasks.simulator --from 2025-06-01 --to 2025-10-31 --setups-from-db --csv trades.csv
+"""
+
+import argparse
+import csv
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from services.signal_engine import DEFAULT_PARAMS, BarBuffer, MaskCache, entry_masks, levels_at
+from services.trade_rules import crossed_level, monitor_decision, pnl_label, CLOSE
+from utils.history_store import HistoryStore, HISTORY_DIR
+from utils.logger import logger
+from utils.time_utils import DAY_SECONDS, IST_OFFSET, day_start, format_ist, ist_day, to_epoch
+
+WORKERS = int(os.getenv("SIMULATOR_WORKERS", str(os.cpu_count() or 2)))
+
+# Enough history before the range for SMA200 on 5-minute bars
+WARMUP_SECONDS = 7 * DAY_SECONDS
+EOD_MINUTE = 15 * 60 + 15
+
+
+def epoch_of_day(day, end_of_day=False):
+    """IST calendar day (YYYY-MM-DD) -> epoch seconds of its first (or last) second."""
+    return day_start(day) + (DAY_SECONDS - 1 if end_of_day else 0)
+
+
+def generated_setups(buf, bullish, bearish, first_index=0):
+    """First ready bar per IST day: [(index, signal)]."""
+    ready = np.flatnonzero(bullish | bearish)
+    ready = ready[ready >= first_index]
+    if not ready.size:
+        return []
+    day = (buf.ts[ready] + IST_OFFSET) // DAY_SECONDS
+    firsts = ready[np.unique(day, return_index=True)[1]]
+    return [(int(i), "bullish" if bullish[i] else "bearish") for i in firsts]
+
+
+def replay_symbol(buf, params=DEFAULT_PARAMS, masks=None, setups=None, first_index=0,
+                  eod_exit=False, symbol=None, security_id=None):
+    """
+    Run one symbol's setups through the exit rules. `buf` must be computed
+    with `params`. `setups` is a list of dicts with index/signal and optional
+    entry_price/stoploss/target (regenerated from the bars when None).
+    Returns a list of trade dicts.
+    """
+    n = buf.n
+    bullish, bearish = entry_masks(buf, masks or MaskCache(buf), params)
+    local = buf.ts[:n] + IST_OFFSET
+    day = local // DAY_SECONDS
+    minute = (local % DAY_SECONDS) // 60
+
+    if setups is None:
+        setups = [{"index": i, "signal": signal} for i, signal in generated_setups(buf, bullish, bearish, first_index)]
+
+    trades = []
+    busy_until = -1
+    for setup in setups:
+        i = setup["index"]
+        if i <= busy_until:
+            continue  # trade_book.has_open(symbol)
+        if eod_exit and minute[i] >= EOD_MINUTE:
+            continue
+
+        signal = setup["signal"]
+        default_sl, default_target = levels_at(buf, i, signal, params)
+        entry_price = float(setup.get("entry_price") or buf.close[i])
+        stoploss = setup.get("stoploss", default_sl)
+        target = setup.get("target", default_target)
+        initial = (stoploss, target)
+
+        exit_price, exit_reason, j = None, None, i
+        while j + 1 < n:
+            j += 1
+            close = float(buf.close[j])
+
+            hit = crossed_level(signal, stoploss, target, float(buf.low[j]), float(buf.high[j]))
+            if hit:
+                exit_price, exit_reason = hit[1], f"{hit[0]}_hit"
+                break
+
+            bar_signal = "bullish" if bullish[j] else "bearish" if bearish[j] else None
+            bar_sl, bar_target = levels_at(buf, j, bar_signal, params)
+            live_data = {
+                "Close": close,
+                "tradeStatus": "ready" if bar_signal else "not_ready",
+                "stoploss": bar_sl,
+                "target": bar_target,
+            }
+            action, result, reason = monitor_decision(signal, stoploss, live_data)
+            if action == CLOSE:
+                exit_price, exit_reason = float(result), reason
+                break
+            if result:
+                stoploss, target = result["stoploss"], result["target"]
+
+            if eod_exit and (minute[j] >= EOD_MINUTE or (j + 1 < n and day[j + 1] != day[j])):
+                exit_price, exit_reason = close, "EOD"
+                break
+
+        if exit_reason is None:
+            # Still open when the history ends: mark to market
+            exit_price, exit_reason = float(buf.close[j]), "open"
+
+        move = (exit_price - entry_price) if signal == "bullish" else (entry_price - exit_price)
+        trades.append({
+            "symbol": symbol,
+            "security_id": security_id,
+            "signal": signal,
+            "entry_time": format_ist(buf.ts[i]),
+            "entry_price": round(entry_price, 2),
+            "stoploss": initial[0],
+            "target": initial[1],
+            "exit_time": format_ist(buf.ts[j]),
+            "exit_price": round(exit_price, 2),
+            "exit_reason": exit_reason,
+            "pnl": round(move, 2),
+            "pnl_pct": round(move / entry_price * 100, 3),
+            "pnl_label": pnl_label(signal, entry_price, exit_price),
+            "bars_held": j - i,
+        })
+        busy_until = j if exit_reason != "open" else n
+
+    return trades
+
+
+def load_bars(store, security_id, start, end, params=DEFAULT_PARAMS):
+    """Bars for [start, end] plus warm-up history. Returns (computed buffer, index of the first in-range bar)."""
+    bars = store.read(security_id, start - WARMUP_SECONDS, end)
+    buf = BarBuffer(max(len(bars["timestamp"]), 1)).load(bars).compute(params)
+    return buf, int(np.searchsorted(buf.ts[:buf.n], start))
+
+
+def setups_from_db(start_day, end_day, security_ids=None):
+    """Recorded setups that reached "ready" in [start_day, end_day], grouped by security id."""
+    from services.setup_service import fetch_setups_from_mongo
+
+    query = {"date": {"$gte": start_day, "$lte": end_day}, "tradeStatus": {"$in": ["ready", "traded"]}}
+    if security_ids:
+        query["dSecurityId"] = {"$in": security_ids}
+
+    grouped = {}
+    for setup in fetch_setups_from_mongo(query):
+        entry_price = setup.get("entryPrice")
+        if entry_price is None and setup.get("candleData"):
+            entry_price = setup["candleData"][0]["Close"]
+        grouped.setdefault(str(setup["dSecurityId"]), []).append({
+            "symbol": setup["symbol"],
+            # Stored as naive UTC (see start_trade)
+            "ts": to_epoch(setup["Datetime"]),
+            "signal": setup["signal"],
+            "entry_price": entry_price,
+            "stoploss": setup.get("stoploss"),
+            "target": setup.get("target"),
+        })
+    return grouped
+
+
+def simulate_security(root, security_id, start, end, params, recorded=None, eod_exit=False):
+    """Worker: replay one security. Returns its trades."""
+    buf, first_index = load_bars(HistoryStore(root), security_id, start, end, params)
+    if buf.n == 0:
+        return []
+
+    setups = None
+    symbol = security_id
+    if recorded is not None:
+        setups = []
+        timestamps = buf.ts[:buf.n]
+        for setup in sorted(recorded, key=lambda s: s["ts"]):
+            i = int(np.searchsorted(timestamps, setup["ts"]))
+            if i < buf.n and timestamps[i] == setup["ts"]:
+                setups.append({**setup, "index": i})
+            else:
+                logger.warning(f"⚠️ No stored bar for {setup['symbol']} setup at {format_ist(setup['ts'])}")
+        symbol = recorded[0]["symbol"] if recorded else security_id
+
+    return replay_symbol(buf, params, setups=setups, first_index=first_index, eod_exit=eod_exit,
+                         symbol=symbol, security_id=security_id)
+
+
+def run_simulation(start, end, security_ids=None, root=HISTORY_DIR, params=DEFAULT_PARAMS,
+                   from_db=False, eod_exit=False, workers=WORKERS):
+    store = HistoryStore(root)
+    recorded = None
+    if from_db:
+        recorded = setups_from_db(ist_day(start), ist_day(end), security_ids)
+        security_ids = sorted(recorded)
+    security_ids = security_ids or store.security_ids()
+    logger.info(f"🔁 Replaying {len(security_ids)} securities {format_ist(start)} → {format_ist(end)}")
+
+    started = time.time()
+    trades = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(simulate_security, str(store.root), sid, start, end, params,
+                        recorded.get(sid) if recorded is not None else None, eod_exit): sid
+            for sid in security_ids
+        }
+        for future in as_completed(futures):
+            try:
+                trades.extend(future.result())
+            except Exception as e:
+                logger.error(f"❌ Replay failed for {futures[future]}: {e}")
+
+    trades.sort(key=lambda t: (t["entry_time"], str(t["symbol"])))
+    logger.info(f"✅ Replayed {len(trades)} trades in {time.time() - started:.1f}s")
+    return trades
+
+
+def summary(trades):
+    closed = [t for t in trades if t["exit_reason"] != "open"]
+    wins = sum(1 for t in closed if t["pnl"] > 0)
+    return {
+        "trades": len(closed),
+        "still_open": len(trades) - len(closed),
+        "hit_rate": round(wins / len(closed), 3) if closed else 0.0,
+        "pnl_pct": round(sum(t["pnl_pct"] for t in closed), 2),
+        "exit_reasons": dict(Counter(t["exit_reason"] for t in trades)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay stored bars through the live entry/exit rules.")
+    parser.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD (IST)")
+    parser.add_argument("--to", dest="end", required=True, help="YYYY-MM-DD (IST)")
+    parser.add_argument("--securities", help="comma-separated security ids (default: everything in the store)")
+    parser.add_argument("--setups-from-db", action="store_true", help="replay the setups recorded in MongoDB")
+    parser.add_argument("--eod-exit", action="store_true", help="close open trades on the 15:15 bar")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--csv", help="write every trade to this file")
+    parser.add_argument("--dir", default=HISTORY_DIR, help="history store root")
+    args = parser.parse_args(argv)
+
+    security_ids = [s.strip() for s in args.securities.split(",")] if args.securities else None
+    trades = run_simulation(
+        epoch_of_day(args.start), epoch_of_day(args.end, end_of_day=True), security_ids, args.dir,
+        from_db=args.setups_from_db, eod_exit=args.eod_exit, workers=args.workers,
+    )
+
+    for key, value in summary(trades).items():
+        print(f"{key:>12}: {value}")
+
+    if args.csv and trades:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(trades[0]))
+            writer.writeheader()
+            writer.writerows(trades)
+        logger.info(f"💾 Wrote {len(trades)} trades to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# tasks/sweep.py
+"""
+Evaluate a grid of strategy parameters over the bars in the local
+HistoryStore (see tasks.backfill) and print a ranked results table.
+
+Work is split per security across a process pool. Inside a worker the bars
+are loaded once, indicators are computed once per (sma_fast, sma_slow,
+atr_period) group and the slope/volume masks are cached per window, so each
+extra combination only costs its own vectorized comparisons plus the bars
+its trades are open for.
+
+Trades are replayed with tasks.simulator (the live entry and exit rules)
+with the end-of-day exit on the 15:15 bar.
+
+Usage:
+    python -m tasks.sweep --from 2025-06-01 --to 2025-10-31 \\
+        --grid near_band=0.003,0.005,0.008 atr_floor=0.3,0.5 target_atr=1.5,2,3
+"""
+
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from services.signal_engine import DEFAULT_PARAMS, BarBuffer, MaskCache
+from tasks.simulator import replay_symbol, epoch_of_day, WARMUP_SECONDS
+from utils.history_store import HistoryStore, HISTORY_DIR
+from utils.logger import logger
+
+WORKERS = int(os.getenv("SWEEP_WORKERS", str(os.cpu_count() or 2)))
+
+INDICATOR_KEYS = ("sma_fast", "sma_slow", "atr_period")
+
+
+def parse_grid(specs):
+    """["near_band=0.003,0.005", ...] -> list of full parameter dicts."""
+    axes = {}
+    for spec in specs or []:
+        key, _, values = spec.partition("=")
+        if key not in DEFAULT_PARAMS:
+            raise ValueError(f"Unknown parameter '{key}' (known: {', '.join(DEFAULT_PARAMS)})")
+        cast = type(DEFAULT_PARAMS[key])
+        axes[key] = [cast(v) for v in values.split(",") if v]
+
+    keys = list(axes)
+    return [{**DEFAULT_PARAMS, **dict(zip(keys, combo))} for combo in itertools.product(*axes.values())]
+
+
+def sweep_security(root, security_id, start, end, grid):
+    """Worker: all combinations for one security. Returns {combo index: [pnl %, ...]}."""
+    bars = HistoryStore(root).read(security_id, start - WARMUP_SECONDS, end)
+    buf = BarBuffer(max(len(bars["timestamp"]), 1)).load(bars)
+    out = {}
+    if buf.n == 0:
+        return out
+    first_index = int(np.searchsorted(buf.ts[:buf.n], start))
+
+    groups = {}
+    for index, params in enumerate(grid):
+        groups.setdefault(tuple(params[k] for k in INDICATOR_KEYS), []).append(index)
+
+    for indexes in groups.values():
+        buf.compute(grid[indexes[0]])
+        masks = MaskCache(buf)
+        for index in indexes:
+            trades = replay_symbol(buf, grid[index], masks, first_index=first_index, eod_exit=True)
+            out[index] = [t["pnl_pct"] for t in trades if t["exit_reason"] != "open"]
+    return out
+
+
+def summarize(grid, pnl_by_combo):
+    rows = []
+    for index, params in enumerate(grid):
+        pnl = pnl_by_combo.get(index, [])
+        wins = [p for p in pnl if p > 0]
+        losses = [-p for p in pnl if p < 0]
+        rows.append({
+            **{k: params[k] for k in DEFAULT_PARAMS},
+            "trades": len(pnl),
+            "hit_rate": round(len(wins) / len(pnl), 3) if pnl else 0.0,
+            "pnl_pct": round(sum(pnl), 2),
+            "avg_pct": round(sum(pnl) / len(pnl), 3) if pnl else 0.0,
+            "profit_factor": round(sum(wins) / sum(losses), 2) if losses else float("inf") if wins else 0.0,
+        })
+    return rows
+
+
+def run_sweep(grid, start, end, security_ids=None, root=HISTORY_DIR, workers=WORKERS):
+    store = HistoryStore(root)
+    security_ids = security_ids or store.security_ids()
+    logger.info(f"🧪 Sweep: {len(grid)} combinations x {len(security_ids)} securities on {workers} workers")
+
+    started = time.time()
+    pnl_by_combo = {index: [] for index in range(len(grid))}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(sweep_security, str(store.root), sid, start, end, grid): sid for sid in security_ids}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                for index, pnl in future.result().items():
+                    pnl_by_combo[index].extend(pnl)
+            except Exception as e:
+                logger.error(f"❌ Sweep failed for {futures[future]}: {e}")
+            if done % 25 == 0:
+                logger.info(f"🧪 {done}/{len(futures)} securities done")
+
+    logger.info(f"✅ Sweep finished in {time.time() - started:.1f}s")
+    return summarize(grid, pnl_by_combo)
+
+
+def print_table(rows, swept, sort_key, top, stream=sys.stdout):
+    rows = sorted(rows, key=lambda r: r[sort_key], reverse=True)[:top]
+    columns = list(swept) + ["trades", "hit_rate", "pnl_pct", "avg_pct", "profit_factor"]
+    widths = {c: max(len(c), *(len(str(r[c])) for r in rows)) if rows else len(c) for c in columns}
+    stream.write("  ".join(["#".rjust(3)] + [c.rjust(widths[c]) for c in columns]) + "\n")
+    for rank, row in enumerate(rows, 1):
+        stream.write("  ".join([str(rank).rjust(3)] + [str(row[c]).rjust(widths[c]) for c in columns]) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep strategy parameters over locally stored bars.")
+    parser.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD (IST)")
+    parser.add_argument("--to", dest="end", required=True, help="YYYY-MM-DD (IST)")
+    parser.add_argument("--grid", nargs="*", default=[], help="param=v1,v2,... (see signal_engine.DEFAULT_PARAMS)")
+    parser.add_argument("--securities", help="comma-separated security ids (default: everything in the store)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--sort", default="pnl_pct", choices=["pnl_pct", "hit_rate", "avg_pct", "profit_factor", "trades"])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--csv", help="also write the full table to this file")
+    parser.add_argument("--dir", default=HISTORY_DIR, help="history store root")
+    args = parser.parse_args(argv)
+
+    grid = parse_grid(args.grid)
+    swept = [spec.partition("=")[0] for spec in args.grid]
+    security_ids = [s.strip() for s in args.securities.split(",")] if args.securities else None
+
+    rows = run_sweep(grid, epoch_of_day(args.start), epoch_of_day(args.end, end_of_day=True), security_ids, args.dir, args.workers)
+    print_table(rows, swept, args.sort, args.top)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(sorted(rows, key=lambda r: r[args.sort], reverse=True))
+        logger.info(f"💾 Wrote {len(rows)} rows to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
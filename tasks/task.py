@@ -5,64 +5,91 @@ from services.stock_service import StockService
 from services.scan_service import ScanService
 from utils.logger import logger
 from utils.patterns import is_bullish_candle, is_bearish_candle
-from services.setup_service import save_setups_to_mongo, fetch_setups_from_mongo
-import pandas as pd
-import pytz
-from datetime import datetime
+from services.setup_service import save_setups_to_mongo, processed_symbols
+from services.candle_service import candle_service
+from services.prefilter_service import regime_prefilter
+from services.scan_checkpoint import scan_checkpoint
+from utils.time_utils import BAR_SECONDS, bar_close, day_start, format_ist, ist_day, now_epoch
 
 
 def fetch_setups():
     """Fetch setups for all stocks in the database."""
-    dhanService = DhanService()
+    dhanService, candidates = prepare_scan()
+    for stock in candidates:
+        scan_stock(dhanService, stock)
+    finish_scan()
+
+
+def prepare_scan(dhanService=None):
+    """Decide which stocks to evaluate this cycle. Returns (DhanService, stocks best-first)."""
+    dhanService = dhanService or DhanService()
     stockService = StockService()
     scanService =  ScanService()
 
     stocks = stockService.get_stocks()
     logger.info(f"🟢 Found {len(stocks)} stocks to process")
 
-    # Filter stock that already been start for the day
-    # Step 1: Fetch all documents already processed for this date
-    query =  { "date": "2025-11-11", "tradeStatus": { "$ne": "not_ready" } }
-    documents = fetch_setups_from_mongo(query)
-
-    processed_stocks = {doc["symbol"] for doc in documents}
-    logger.info(f"✅ Found {len(processed_stocks)} documents for {query['date']}")
-
-
-    # Step 2: Exclude already processed stocks
+    # Skip stocks that already have a setup for the day
+    today = ist_day(now_epoch())
+    processed_stocks = processed_symbols.for_day(today)
     stocks_to_process = [s for s in stocks if s["UNDERLYING_SYMBOL"] not in processed_stocks]
 
-    logger.info(f"🧹 Skipping {len(processed_stocks)} stocks already processed")
+    logger.info(f"🧹 Skipping {len(processed_stocks)} stocks already processed for {today}")
     logger.info(f"🚀 {len(stocks_to_process)} stocks left to process")
 
     current_time = scanService.get_next_scan_time()
     logger.info(f"✅ Process for {current_time}")
 
-    for stock in stocks_to_process:
-        symbol = stock.get("UNDERLYING_SYMBOL")
-        sec_id = stock.get("SECURITY_ID")
-
-        if not symbol or not sec_id:
-            logger.warning(f"⚠️ Skipping stock with missing fields: {stock}")
-            continue
-
-        try:
-            ist = pytz.timezone("Asia/Kolkata")
-            current_time = datetime.now(ist)
-            #current_time = "2025-11-07 9:20:00"  # For testing purpose
-
-            #setups = process_symbol(dhanService, symbol, sec_id, "2025-10-30")
-            #logger.info(f"✅ Process {symbol} {current_time}")
-            setups = process_stock(dhanService, symbol, sec_id, current_time)
-            #logger.info(f"✅ Processed {symbol}")
-            if setups:
-                save_setups_to_mongo(setups)
-                #print(f"✅ Saved {len(setups)} setups for {symbol}")
-
-
-        except Exception as e:
-            logger.exception(f"❌ Failed to process {symbol}: {e}")
-
+    # Resume the bar where a previous (possibly crashed) run left it
+    done = scan_checkpoint.begin(bar_close(now_epoch()))
+    if done:
+        stocks_to_process = [s for s in stocks_to_process if str(s.get("SECURITY_ID")) not in done]
+        logger.info(f"♻️ {len(done)} stocks already scanned for this bar, {len(stocks_to_process)} left")
+
+    # Only fully evaluate symbols that can still produce a signal on this bar
+    candidates, _ = regime_prefilter.plan(stocks_to_process)
+    return dhanService, candidates
+
+
+def scan_stock(dhanService, stock):
+    """Evaluate one stock and persist its setup. Returns the evaluated candle (or None)."""
+    symbol = stock.get("UNDERLYING_SYMBOL")
+    sec_id = stock.get("SECURITY_ID")
+
+    if not symbol or not sec_id:
+        logger.warning(f"⚠️ Skipping stock with missing fields: {stock}")
+        return None
+
+    try:
+        current_time = now_epoch()
+        #current_time = "2025-11-07 9:20:00"  # For testing purpose
+
+        #setups = process_symbol(dhanService, symbol, sec_id, "2025-10-30")
+        #logger.info(f"✅ Process {symbol} {current_time}")
+        setups = process_stock(dhanService, symbol, sec_id, current_time)
+        #logger.info(f"✅ Processed {symbol}")
+        if setups:
+            scan_checkpoint.mark_evaluated(sec_id)
+            regime_prefilter.update(sec_id, setups)
+            # The scanned bar is still forming; store the one that just closed, evaluated on
+            # its final data (the download above refreshed it, so this is a cache read)
+            closed = process_stock(dhanService, symbol, sec_id, current_time - BAR_SECONDS)
+            if closed:
+                candle_service.record(closed)
+            save_setups_to_mongo(setups)
+            #print(f"✅ Saved {len(setups)} setups for {symbol}")
+            # Counted as done once the candle buffer holding this bar is flushed
+            scan_checkpoint.mark_persisted(sec_id)
+        return setups
+
+    except Exception as e:
+        logger.exception(f"❌ Failed to process {symbol}: {e}")
+        return None
+
+
+def finish_scan():
+    # Remaining candles/signals (one insert_many per collection), then the checkpoint
+    scan_checkpoint.flush()
 
 
 def process_stock(dhanService, symbol, sec_id, date):
@@ -72,6 +99,8 @@ def process_stock(dhanService, symbol, sec_id, date):
 
 
 def process_symbol(dhanService, symbol, sec_id, date):
+    import pandas as pd
+
     df = dhanService.fetch_dhan_data(sec_id, date)
 
     if df is None or df.empty:
@@ -91,18 +120,10 @@ def process_symbol(dhanService, symbol, sec_id, date):
         # set index
         df.set_index("Datetime", inplace=True)
 
-    # Convert string to datetime if needed
-    if isinstance(date, str):
-        date = datetime.strptime(date, "%Y-%m-%d")
-
-    # Create start and end time strings
-    start_str = date.strftime("%Y-%m-%d") + " 09:15"
-    end_str   = date.strftime("%Y-%m-%d") + " 15:30"
-
-    # Localize to IST and convert to UTC
-    ist = pytz.timezone("Asia/Kolkata")
-    start_dt = ist.localize(datetime.strptime(start_str, "%Y-%m-%d %H:%M")).astimezone(pytz.UTC)
-    end_dt   = ist.localize(datetime.strptime(end_str, "%Y-%m-%d %H:%M")).astimezone(pytz.UTC)
+    # Session bounds (09:15-15:30 IST) as epoch seconds
+    midnight = day_start(date if isinstance(date, str) else date.strftime("%Y-%m-%d"))
+    start_dt = pd.Timestamp(midnight + (9 * 60 + 15) * 60, unit="s", tz="UTC")
+    end_dt = pd.Timestamp(midnight + (15 * 60 + 30) * 60, unit="s", tz="UTC")
 
     df_range = df[(df.index >= start_dt) & (df.index <= end_dt)]
     if df_range.empty:
@@ -111,7 +132,7 @@ def process_symbol(dhanService, symbol, sec_id, date):
     setups = []
     for idx, row in df.iterrows():
         df_up_to = df_range.loc[:idx]
-        ts_str = idx.tz_convert(ist).strftime("%Y-%m-%d %H:%M")
+        ts_str = format_ist(idx.value // 10**9)  # Timestamp.value: UTC nanoseconds
         is_first = idx == df_range.index[0]
 
 
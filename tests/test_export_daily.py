@@ -0,0 +1,42 @@
+# tests/test_export_daily.py
+
+from datetime import datetime
+
+import services.candle_service as candle_service
+import services.setup_service as setup_service
+from tasks.export_daily import export_signals, export_setups
+from utils.columnar_store import ColumnarStore
+
+DAY = "2025-11-03"
+BAR = datetime(2025, 11, 3, 4, 0)  # 09:30 IST, naive UTC as Mongo returns it
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, *args, **kwargs):
+        return iter(self.docs)
+
+
+def test_setup_exports_trend_strength_label(tmp_path, monkeypatch):
+    signal = {
+        "ts": BAR, "meta": {"securityId": "11536", "symbol": "TCS"},
+        "Close": 3050.5, "signal": "bullish", "tradeStatus": "ready",
+        "stoploss": 3040.0, "target": 3080.0, "trend_strength": "strong_bullish",
+    }
+    setup = {
+        "symbol": "TCS", "dSecurityId": "11536", "signal": "bullish", "tradeStatus": "ready",
+        "Datetime": BAR, "entryPrice": 3050.5, "stoploss": 3040.0, "target": 3080.0,
+    }
+    monkeypatch.setattr(candle_service, "signals", FakeCollection([signal]))
+    monkeypatch.setattr(setup_service, "iter_setups", lambda *args: iter([setup]))
+
+    store = ColumnarStore(str(tmp_path))
+    _, strength = export_signals(store, DAY)
+    export_setups(store, DAY, strength)
+
+    setups = store.load("setups", DAY, DAY).to_pylist()
+    signals = store.load("signals", DAY, DAY).to_pylist()
+    assert [s["trend_strength"] for s in setups] == ["strong_bullish"]
+    assert [s["trend_strength"] for s in signals] == ["strong_bullish"]
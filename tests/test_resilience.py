@@ -0,0 +1,43 @@
+# tests/test_resilience.py
+
+import pytest
+
+from services.quota_manager import QuotaExhausted, PRIORITY_SCAN
+from services.resilience import BrokerGuard, BrokerError, CIRCUIT_OPEN, THROTTLED
+
+OK = {"status": "success", "data": {"timestamp": [1]}}
+
+
+def half_open_guard():
+    guard = BrokerGuard()
+    breaker = guard._breaker("intraday")
+    breaker.state = "open"
+    breaker.opened_at = 0.0
+    return guard, breaker
+
+
+def throttled():
+    raise QuotaExhausted("data", PRIORITY_SCAN, "not granted within 2.0s")
+
+
+def test_throttled_probe_releases_half_open_slot():
+    guard, breaker = half_open_guard()
+
+    with pytest.raises(BrokerError) as exc:
+        guard.call("intraday", throttled)
+    assert exc.value.kind == THROTTLED
+    assert breaker.state == "half_open"
+    assert not breaker.probing
+
+    # The next call gets to probe, and its success closes the circuit
+    assert guard.call("intraday", lambda: OK) is OK
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_a_single_probe():
+    guard, breaker = half_open_guard()
+    assert breaker.allow(now=breaker.reset_seconds)
+
+    with pytest.raises(BrokerError) as exc:
+        guard.call("intraday", lambda: OK)
+    assert exc.value.kind == CIRCUIT_OPEN
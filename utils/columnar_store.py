@@ -0,0 +1,134 @@
+# utils/columnar_store.py
+
+import os
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "data/exports")
+COMPRESSION = "zstd"
+
+_TS = pa.timestamp("s", tz="UTC")
+
+# Table -> typed schema of its daily partitions
+SCHEMAS = {
+    "setups": pa.schema([
+        ("symbol", pa.string()),
+        ("security_id", pa.string()),
+        ("signal", pa.string()),
+        ("trade_status", pa.string()),
+        ("ts", _TS),                       # setup bar
+        ("entry_price", pa.float64()),
+        ("stoploss", pa.float64()),
+        ("target", pa.float64()),
+        ("trend_strength", pa.string()),   # e.g. "strong_bullish", from the setup bar's signal record
+    ]),
+    "trades": pa.schema([
+        ("symbol", pa.string()),
+        ("security_id", pa.string()),
+        ("signal", pa.string()),
+        ("status", pa.string()),
+        ("entry_ts", _TS),
+        ("exit_ts", _TS),
+        ("entry_price", pa.float64()),
+        ("exit_price", pa.float64()),      # last price for trades still open
+        ("stoploss", pa.float64()),
+        ("target", pa.float64()),
+        ("exit_reason", pa.string()),
+        ("pnl", pa.float64()),             # points in the trade's direction
+        ("pnl_pct", pa.float64()),
+        ("pnl_label", pa.string()),
+    ]),
+    "bars": pa.schema([
+        ("security_id", pa.string()),
+        ("symbol", pa.string()),
+        ("ts", _TS),
+        ("open", pa.float64()),
+        ("high", pa.float64()),
+        ("low", pa.float64()),
+        ("close", pa.float64()),
+        ("volume", pa.float64()),
+    ]),
+    "signals": pa.schema([
+        ("security_id", pa.string()),
+        ("symbol", pa.string()),
+        ("ts", _TS),
+        ("close", pa.float64()),
+        ("sma20", pa.float64()),
+        ("sma200", pa.float64()),
+        ("atr", pa.float64()),
+        ("signal", pa.string()),
+        ("trade_status", pa.string()),
+        ("stoploss", pa.float64()),
+        ("target", pa.float64()),
+        ("trend_strength", pa.string()),
+    ]),
+}
+
+
+class ColumnarStore:
+    """
+    Local analytics store: one zstd Parquet file per table per IST day,
+
+        <root>/<table>/date=YYYY-MM-DD/part-0.parquet
+
+    written atomically and replaced as a whole when a day is re-exported.
+    Reads go through a hive-partitioned dataset on a memory-mapped local
+    filesystem, so only the requested days and columns are touched.
+    """
+
+    def __init__(self, root=EXPORT_DIR):
+        self.root = Path(root)
+
+    def _path(self, table, day):
+        return self.root / table / f"date={day}" / "part-0.parquet"
+
+    def write(self, table, day, rows):
+        """Replace the `day` partition of `table` with `rows` (dicts keyed by schema field). Returns rows written."""
+        schema = SCHEMAS[table]
+        columns = {field.name: [row.get(field.name) for row in rows] for field in schema}
+        data = pa.Table.from_pydict(columns, schema=schema)
+
+        path = self._path(table, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")  # dot files are ignored by dataset reads
+        pq.write_table(data, tmp_path, compression=COMPRESSION)
+        os.replace(tmp_path, path)
+        return data.num_rows
+
+    def days(self, table):
+        folder = self.root / table
+        if not folder.exists():
+            return []
+        return sorted(p.name[len("date="):] for p in folder.glob("date=*") if (p / "part-0.parquet").exists())
+
+    def dataset(self, table):
+        return ds.dataset(
+            str(self.root / table),
+            schema=SCHEMAS[table].append(pa.field("date", pa.string())),
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"),
+            filesystem=fs.LocalFileSystem(use_mmap=True),
+        )
+
+    def load(self, table, start=None, end=None, columns=None, filter=None):
+        """
+        Rows of `table` for IST days in [start, end] (YYYY-MM-DD, inclusive) as a
+        pyarrow.Table. `filter` is an extra pyarrow.compute expression, e.g.
+        `pc.field("signal") == "bullish"`.
+        """
+        condition = filter
+        if start is not None:
+            condition = _and(condition, ds.field("date") >= start)
+        if end is not None:
+            condition = _and(condition, ds.field("date") <= end)
+        if not (self.root / table).exists():
+            return SCHEMAS[table].empty_table()
+        return self.dataset(table).to_table(columns=columns, filter=condition)
+
+
+def _and(left, right):
+    return right if left is None else left & right
@@ -0,0 +1,122 @@
+# utils/history_store.py
+
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from utils.time_utils import IST_OFFSET
+
+HISTORY_DIR = os.getenv("HISTORY_DIR", "data/bars")
+
+
+# Column name -> dtype on disk
+COLUMNS = {
+    "timestamp": np.int64,   # epoch seconds (bar start)
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.int64,
+}
+
+
+class HistoryStore:
+    """
+    Local columnar store for 5-minute bars.
+
+    Layout: <root>/<security_id>/<YYYY-MM>.npz, one compressed array per
+    column, partitioned by IST month. Writes merge into the existing
+    partition and de-duplicate on timestamp.
+    """
+
+    def __init__(self, root=HISTORY_DIR):
+        self.root = Path(root)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, security_id):
+        with self._locks_guard:
+            return self._locks.setdefault(str(security_id), threading.Lock())
+
+    def _path(self, security_id, month):
+        return self.root / str(security_id) / f"{month}.npz"
+
+    @staticmethod
+    def _months(timestamps):
+        """IST month ("YYYY-MM") of each epoch timestamp, without a per-bar datetime."""
+        local = (np.asarray(timestamps, dtype=np.int64) + IST_OFFSET).astype("datetime64[s]")
+        return local.astype("datetime64[M]").astype(str)
+
+    def write(self, security_id, data):
+        """Merge broker arrays (timestamp/open/high/low/close/volume) into the store. Returns bars written."""
+        if not data or not len(data.get("timestamp", [])):
+            return 0
+
+        arrays = {col: np.asarray(data[col], dtype=dtype) for col, dtype in COLUMNS.items()}
+        months = self._months(arrays["timestamp"])
+
+        with self._lock(security_id):
+            for month in np.unique(months):
+                mask = months == month
+                part = {col: arr[mask] for col, arr in arrays.items()}
+                path = self._path(security_id, month)
+
+                if path.exists():
+                    existing = self._load(path)
+                    # New values win for duplicate timestamps
+                    keep = ~np.isin(existing["timestamp"], part["timestamp"])
+                    part = {col: np.concatenate([existing[col][keep], part[col]]) for col in COLUMNS}
+
+                order = np.argsort(part["timestamp"], kind="stable")
+                part = {col: arr[order] for col, arr in part.items()}
+
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(path.stem + ".tmp.npz")
+                np.savez_compressed(tmp_path, **part)
+                os.replace(tmp_path, path)
+
+        return len(arrays["timestamp"])
+
+    @staticmethod
+    def _load(path):
+        with np.load(path) as npz:
+            return {col: npz[col] for col in COLUMNS}
+
+    def partitions(self, security_id):
+        folder = self.root / str(security_id)
+        if not folder.exists():
+            return []
+        return sorted(p.stem for p in folder.glob("????-??.npz"))
+
+    def security_ids(self):
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir())
+
+    def read(self, security_id, start=None, end=None):
+        """
+        Load bars for one security as a dict of numpy arrays, optionally bounded
+        by epoch seconds [start, end]. Only the needed month partitions are opened.
+        """
+        months = self.partitions(security_id)
+        if start is not None:
+            first = self._months([start])[0]
+            months = [m for m in months if m >= first]
+        if end is not None:
+            last = self._months([end])[0]
+            months = [m for m in months if m <= last]
+
+        if not months:
+            return {col: np.empty(0, dtype=dtype) for col, dtype in COLUMNS.items()}
+
+        parts = [self._load(self._path(security_id, m)) for m in months]
+        bars = {col: np.concatenate([p[col] for p in parts]) for col in COLUMNS}
+
+        mask = np.ones(len(bars["timestamp"]), dtype=bool)
+        if start is not None:
+            mask &= bars["timestamp"] >= start
+        if end is not None:
+            mask &= bars["timestamp"] <= end
+        return {col: arr[mask] for col, arr in bars.items()}
@@ -0,0 +1,104 @@
+# utils/import_report.py
+"""
+Import-time report for the worker modules.
+
+Each module is imported in a fresh interpreter with `-X importtime`, and the
+report shows total import time, whether the import touched MongoDB or pulled
+in the heavy optional modules, and the slowest transitive imports.
+
+Usage:
+    python -m utils.import_report
+    python -m utils.import_report services.setup_service --budget-ms 300 --top 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_MODULES = [
+    "config.db_config",
+    "services.setup_service",
+    "services.stock_service",
+    "services.scan_service",
+    "services.dhan_service",
+    "tasks.task",
+    "dhan_repo",
+    "main",
+]
+
+HEAVY_MODULES = ["pandas", "numpy", "dhanhq", "requests"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = (time.perf_counter() - started) * 1000
+db_config = sys.modules.get("config.db_config")
+print(json.dumps({{
+    "elapsed_ms": elapsed,
+    "connected": bool(db_config and db_config.Database._instance is not None),
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse `-X importtime` output into [(cumulative_us, module)]."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return rows
+
+
+def probe(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {"module": module, "error": result.stderr.strip().splitlines()[-1]}
+
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["module"] = module
+    report["slowest"] = sorted(parse_importtime(result.stderr), reverse=True)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import time per worker module.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="fail if any module exceeds this")
+    parser.add_argument("--top", type=int, default=3, help="slowest transitive imports to show")
+    args = parser.parse_args(argv)
+
+    over_budget = False
+    for module in args.modules:
+        report = probe(module)
+        if "error" in report:
+            print(f"❌ {module}: {report['error']}")
+            over_budget = True
+            continue
+
+        ok = report["elapsed_ms"] <= args.budget_ms and not report["connected"]
+        over_budget |= not ok
+        print(
+            f"{'✅' if ok else '❌'} {module}: {report['elapsed_ms']:.0f} ms"
+            f" | mongo={'connected' if report['connected'] else 'lazy'}"
+            f" | heavy={','.join(report['heavy']) or '-'}"
+        )
+        # The probe module itself is the first (largest) row; skip it
+        for cumulative_us, name in report["slowest"][1:args.top + 1]:
+            print(f"     {cumulative_us / 1000:7.1f} ms  {name}")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,174 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 
 # Create logs directory if not exists
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 
-# Configure logger
-logging.basicConfig(
-    level=logging.INFO,  # Can be changed to DEBUG for more details
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    handlers=[
-        logging.FileHandler(f"{LOG_DIR}/app.log"),
-        logging.StreamHandler()
-    ]
-)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # Can be changed to DEBUG for more details
+LOG_FILE_FORMAT = os.getenv("LOG_FILE_FORMAT", "json")  # "json" or "text"
+LOG_CONSOLE_FORMAT = os.getenv("LOG_CONSOLE_FORMAT", "text")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")  # e.g. "midnight" switches to time-based rotation
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Repetitive per-symbol lines: at most LOG_SAMPLE_RATE records per key per LOG_SAMPLE_WINDOW seconds
+LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", "5"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra` fields are included as top-level keys."""
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in ("sample_key", "sample_warnings"):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SampleFilter(logging.Filter):
+    """
+    Rate-limits repetitive records that carry `extra={"sample_key": ...}`.
+
+    Only the first `rate` records per key per `window` seconds pass. The first
+    record of the next window carries a count of what was suppressed.
+    WARNING and above always pass unless the record opts in with
+    `"sample_warnings": True` (e.g. one warning per failing broker call).
+    """
+
+    def __init__(self, rate=LOG_SAMPLE_RATE, window=LOG_SAMPLE_WINDOW):
+        super().__init__()
+        self.rate = rate
+        self.window = window
+        self._buckets = {}  # key -> [window_start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, "sample_key", None)
+        if key is None:
+            return True
+        if record.levelno >= logging.WARNING and not getattr(record, "sample_warnings", False):
+            return True
+
+        now = record.created
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None or now - bucket[0] >= self.window:
+                suppressed = bucket[2] if bucket else 0
+                self._buckets[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} (+{suppressed} similar '{key}' lines suppressed)"
+                return True
+
+            if bucket[1] < self.rate:
+                bucket[1] += 1
+                return True
+
+            bucket[2] += 1
+            with log_stats.lock:
+                log_stats.sampled_out += 1
+            return False
+
+
+class LogStats:
+    """Counters for the logging hot path, so its overhead is measurable. Updated from many threads."""
+
+    def __init__(self):
+        self.enqueued = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.enqueue_ns = 0
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "enqueued": self.enqueued,
+                "dropped": self.dropped,
+                "sampled_out": self.sampled_out,
+                "enqueue_ms": round(self.enqueue_ns / 1e6, 2),
+                "avg_enqueue_us": round(self.enqueue_ns / 1e3 / self.enqueued, 2) if self.enqueued else 0.0,
+            }
+
+
+log_stats = LogStats()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the background writer; never blocks the caller on a full queue."""
+
+    def emit(self, record):
+        started = time.perf_counter_ns()
+        queued = dropped = 0
+        try:
+            self.enqueue(self.prepare(record))
+            queued = 1
+        except queue.Full:
+            dropped = 1
+        except Exception:
+            self.handleError(record)
+        elapsed = time.perf_counter_ns() - started
+        with log_stats.lock:
+            log_stats.enqueued += queued
+            log_stats.dropped += dropped
+            log_stats.enqueue_ns += elapsed
+
+
+def _formatter(kind):
+    return JsonFormatter() if kind == "json" else logging.Formatter(TEXT_FORMAT)
+
+
+def _file_handler():
+    path = f"{LOG_DIR}/app.log"
+    if LOG_ROTATE_WHEN:
+        handler = TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    else:
+        handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    handler.setFormatter(_formatter(LOG_FILE_FORMAT))
+    return handler
+
+
+def _console_handler():
+    handler = logging.StreamHandler()
+    handler.setFormatter(_formatter(LOG_CONSOLE_FORMAT))
+    return handler
+
+
+# Configure logger: callers only pay for a queue put, disk/stdout I/O happens on the listener thread
+log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = NonBlockingQueueHandler(log_queue)
+queue_handler.addFilter(SampleFilter())
+
+listener = QueueListener(log_queue, _file_handler(), _console_handler(), respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+root = logging.getLogger()
+root.setLevel(LOG_LEVEL)
+root.addHandler(queue_handler)
 
 # Create a named logger for the app
 logger = logging.getLogger("TradingApp")
@@ -1,11 +1,11 @@
-import pandas as pd
-
 def detect_bullish_engulfing(df, volume_ma_period=20):
     """
     Detect Bullish Engulfing patterns in OHLCV DataFrame.
     df must have columns: ['Open', 'High', 'Low', 'Close', 'Volume']
     Returns DataFrame with boolean column 'BullishEngulfing'
     """
+    import pandas as pd
+
     df = df.copy()
     
     # Fix MultiIndex columns if present
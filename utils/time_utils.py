@@ -0,0 +1,113 @@
+# utils/time_utils.py
+"""
+The pipeline's one time representation: int epoch seconds.
+
+IST has a fixed offset (no DST), so every local-time question the hot path
+asks (which day, which minute, which 5-minute bar) is integer arithmetic on
+`ts + IST_OFFSET`. Datetimes and strings only appear at the edges: broker
+request parameters, Mongo documents and logs. The per-day part of those
+conversions is cached, so formatting a timestamp is a dict hit plus a few
+integer divisions.
+"""
+
+import time
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+IST_OFFSET = 19800          # +05:30
+DAY_SECONDS = 86400
+BAR_SECONDS = 300
+IST = timezone(timedelta(seconds=IST_OFFSET), "IST")
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def now_epoch():
+    return int(time.time())
+
+
+# --- Integer arithmetic (hot path) ---
+
+def day_number(ts):
+    """IST calendar day of `ts` as days since 1970-01-01."""
+    return (int(ts) + IST_OFFSET) // DAY_SECONDS
+
+
+def seconds_of_day(ts):
+    return (int(ts) + IST_OFFSET) % DAY_SECONDS
+
+
+def minute_of_day(ts):
+    """IST minutes since midnight, e.g. 555 for 09:15."""
+    return seconds_of_day(ts) // 60
+
+
+def bar_start(ts, interval=BAR_SECONDS):
+    return int(ts) // interval * interval
+
+
+def bar_close(ts, interval=BAR_SECONDS):
+    """Close time (epoch seconds) of the bar containing `ts`."""
+    return (int(ts) // interval + 1) * interval
+
+
+# --- Edges (cached per day) ---
+
+@lru_cache(maxsize=4096)
+def _day_string(number):
+    return date.fromordinal(_EPOCH_ORDINAL + number).isoformat()
+
+
+def ist_day(ts):
+    """IST calendar day of `ts` as YYYY-MM-DD."""
+    return _day_string(day_number(ts))
+
+
+def ist_date(ts):
+    return date.fromordinal(_EPOCH_ORDINAL + day_number(ts))
+
+
+@lru_cache(maxsize=4096)
+def day_start(day):
+    """Epoch seconds of IST midnight on `day` (YYYY-MM-DD or a date)."""
+    if isinstance(day, str):
+        day = date(int(day[:4]), int(day[5:7]), int(day[8:10]))
+    return (day.toordinal() - _EPOCH_ORDINAL) * DAY_SECONDS - IST_OFFSET
+
+
+def format_ist(ts, seconds=False):
+    """'YYYY-MM-DD HH:MM' (or 'YYYY-MM-DD HH:MM:SS') in IST."""
+    s = seconds_of_day(ts)
+    text = f"{ist_day(ts)} {s // 3600:02d}:{s // 60 % 60:02d}"
+    return f"{text}:{s % 60:02d}" if seconds else text
+
+
+def parse_ist(value):
+    """'YYYY-MM-DD[ HH:MM[:SS]]' read as IST wall clock -> epoch seconds."""
+    value = value.strip()
+    ts = day_start(value[:10])
+    if len(value) >= 16:
+        ts += int(value[11:13]) * 3600 + int(value[14:16]) * 60
+    if len(value) >= 19:
+        ts += int(value[17:19])
+    return ts
+
+
+def to_epoch(value, naive="utc"):
+    """
+    Epoch seconds from whatever an edge hands over: a number, an IST
+    wall-clock string, or a datetime. Naive datetimes are UTC by default
+    (that is how Mongo returns them); pass naive="ist" for IST wall clock.
+    """
+    if isinstance(value, str):
+        return parse_ist(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc if naive == "utc" else IST)
+        return int(value.timestamp())
+    return int(value)
+
+
+def to_datetime(ts):
+    """Aware IST datetime for documents and display."""
+    return datetime.fromtimestamp(int(ts), IST)